@@ -0,0 +1,957 @@
+"""In-memory stand-in for the parts of the boto3 DynamoDB resource the bot uses.
+
+It implements get/put/update_item, query (tables and GSIs), scan (including
+parallel segments), batch_get_item, batch_write_item and transact_write_items,
+with condition, update, key-condition, filter and projection expressions,
+ExclusiveStartKey paging and the 1 MB page limit. Every call is counted, and
+faults (latency, throttling) can be injected to see how the bot behaves on a
+degraded table.
+"""
+
+import copy
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
+from boto3.dynamodb.conditions import ConditionBase, ConditionExpressionBuilder
+from botocore.exceptions import ClientError
+
+PAGE_BYTES = 1024 * 1024
+BATCH_GET_LIMIT = 100
+BATCH_WRITE_LIMIT = 25
+TRANSACT_LIMIT = 100
+
+
+def client_error(code, message, operation, **extra):
+    return ClientError(
+        {"Error": {"Code": code, "Message": message}, **extra}, operation
+    )
+
+
+# --- values ----------------------------------------------------------------
+
+
+def to_dynamo(value):
+    """Normalise a Python value the way the boto3 serializer round-trips it."""
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, float):
+        raise TypeError("Float types are not supported. Use Decimal types instead.")
+    if isinstance(value, (int, Decimal)):
+        return Decimal(value)
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    if isinstance(value, (set, frozenset)):
+        if not value:
+            raise client_error(
+                "ValidationException", "An string set may not be empty", "PutItem"
+            )
+        return {to_dynamo(v) for v in value}
+    if isinstance(value, (list, tuple)):
+        return [to_dynamo(v) for v in value]
+    if isinstance(value, dict):
+        return {k: to_dynamo(v) for k, v in value.items()}
+    raise TypeError(f"Unsupported type {type(value)} for value {value!r}")
+
+
+def value_size(value):
+    if isinstance(value, str):
+        return len(value.encode())
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, Decimal):
+        return len(str(value)) // 2 + 1
+    if isinstance(value, (set, list)):
+        return 3 + sum(value_size(v) for v in value)
+    if isinstance(value, dict):
+        return 3 + item_size(value)
+    return 1
+
+
+def item_size(item):
+    return sum(len(name.encode()) + value_size(v) for name, v in item.items())
+
+
+def capacity_units(size, write=False):
+    if write:
+        return float(max(1, math.ceil(size / 1024)))
+    return max(1, math.ceil(size / 4096)) * 0.5
+
+
+# --- expressions -----------------------------------------------------------
+
+_TOKENS = re.compile(
+    r"\s*(?:(?P<name>#[\w]+)|(?P<value>:[\w]+)"
+    r"|(?P<op><>|<=|>=|=|<|>|\(|\)|,|\+|-)"
+    r"|(?P<word>[A-Za-z_][\w\-\.]*))"
+)
+_KEYWORDS = {"AND", "OR", "NOT", "BETWEEN", "IN", "SET", "REMOVE", "ADD", "DELETE"}
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+class _Parser:
+    def __init__(self, expression, names, values):
+        self.tokens = []
+        pos = 0
+        expression = expression.strip()
+        while pos < len(expression):
+            match = _TOKENS.match(expression, pos)
+            if not match or match.end() == pos:
+                raise ExpressionError(f"Invalid expression near {expression[pos:]!r}")
+            kind = match.lastgroup
+            self.tokens.append((kind, match.group(kind)))
+            pos = match.end()
+        self.pos = 0
+        self.names = names or {}
+        self.values = values or {}
+        self.used_names = set()
+        self.used_values = set()
+
+    def peek(self, offset=0):
+        if self.pos + offset < len(self.tokens):
+            return self.tokens[self.pos + offset]
+        return (None, None)
+
+    def next(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def accept(self, text):
+        kind, token = self.peek()
+        if token is not None and (
+            token == text or (kind == "word" and token.upper() == text)
+        ):
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, text):
+        if not self.accept(text):
+            raise ExpressionError(f"Expected {text!r}, got {self.peek()[1]!r}")
+
+    def at_end(self):
+        return self.pos >= len(self.tokens)
+
+    def path(self):
+        kind, token = self.next()
+        if kind == "name":
+            if token not in self.names:
+                raise ExpressionError(f"Undefined attribute name {token}")
+            self.used_names.add(token)
+            return ("path", self.names[token])
+        if kind == "word" and token.upper() not in _KEYWORDS:
+            return ("path", token)
+        raise ExpressionError(f"Expected an attribute, got {token!r}")
+
+    def operand(self):
+        kind, token = self.peek()
+        if kind == "value":
+            self.pos += 1
+            if token not in self.values:
+                raise ExpressionError(f"Undefined attribute value {token}")
+            self.used_values.add(token)
+            return ("value", to_dynamo(self.values[token]))
+        if kind == "word" and self.peek(1)[1] == "(":
+            function = token.lower()
+            self.pos += 2
+            args = [self.operand()]
+            while self.accept(","):
+                args.append(self.operand())
+            self.expect(")")
+            return ("call", function, args)
+        return self.path()
+
+    # Conditions
+
+    def condition(self):
+        node = self.conjunction()
+        while self.accept("OR"):
+            node = ("or", node, self.conjunction())
+        return node
+
+    def conjunction(self):
+        node = self.negation()
+        while self.accept("AND"):
+            node = ("and", node, self.negation())
+        return node
+
+    def negation(self):
+        if self.accept("NOT"):
+            return ("not", self.negation())
+        return self.comparison()
+
+    def comparison(self):
+        if self.accept("("):
+            node = self.condition()
+            self.expect(")")
+            return node
+        left = self.operand()
+        kind, token = self.peek()
+        if token in ("=", "<>", "<", "<=", ">", ">="):
+            self.pos += 1
+            return ("cmp", token, left, self.operand())
+        if self.accept("BETWEEN"):
+            low = self.operand()
+            self.expect("AND")
+            return ("between", left, low, self.operand())
+        if self.accept("IN"):
+            self.expect("(")
+            options = [self.operand()]
+            while self.accept(","):
+                options.append(self.operand())
+            self.expect(")")
+            return ("in", left, options)
+        if left[0] == "call":
+            return ("test", left)
+        raise ExpressionError(f"Expected a comparison, got {token!r}")
+
+    # Updates
+
+    def update_actions(self):
+        actions = []
+        while not self.at_end():
+            kind, token = self.next()
+            clause = (token or "").upper()
+            if clause not in ("SET", "REMOVE", "ADD", "DELETE"):
+                raise ExpressionError(f"Unknown update clause {token!r}")
+            while True:
+                path = self.path()[1]
+                if clause == "SET":
+                    self.expect("=")
+                    value = self.operand()
+                    if self.peek()[1] in ("+", "-"):
+                        operator = self.next()[1]
+                        value = ("arith", operator, value, self.operand())
+                    actions.append(("SET", path, value))
+                elif clause == "REMOVE":
+                    actions.append(("REMOVE", path, None))
+                else:
+                    actions.append((clause, path, self.operand()))
+                if not self.accept(","):
+                    break
+        return actions
+
+    def projection(self):
+        paths = [self.path()[1]]
+        while self.accept(","):
+            paths.append(self.path()[1])
+        return paths
+
+
+def _resolve(node, item):
+    kind = node[0]
+    if kind == "path":
+        return item.get(node[1], _MISSING)
+    if kind == "value":
+        return node[1]
+    if kind == "arith":
+        _, operator, left, right = node
+        left, right = _resolve(left, item), _resolve(right, item)
+        if not isinstance(left, Decimal) or not isinstance(right, Decimal):
+            raise ExpressionError("Arithmetic on a non-number")
+        return left + right if operator == "+" else left - right
+    if kind == "call":
+        _, function, args = node
+        if function == "if_not_exists":
+            current = _resolve(args[0], item)
+            return _resolve(args[1], item) if current is _MISSING else current
+        if function == "list_append":
+            return list(_resolve(args[0], item)) + list(_resolve(args[1], item))
+        if function == "size":
+            value = _resolve(args[0], item)
+            if isinstance(value, Decimal) or value is _MISSING:
+                return _MISSING
+            return Decimal(len(value))
+        raise ExpressionError(f"Unknown function {function}")
+    raise ExpressionError(f"Unexpected operand {kind}")
+
+
+class _Missing:
+    def __repr__(self):
+        return "<missing>"
+
+
+_MISSING = _Missing()
+
+
+def _compare(operator, left, right):
+    if left is _MISSING or right is _MISSING:
+        return operator == "<>" and not (left is _MISSING and right is _MISSING)
+    if operator == "=":
+        return left == right
+    if operator == "<>":
+        return left != right
+    if type(left) is not type(right):
+        return False
+    return {
+        "<": left < right,
+        "<=": left <= right,
+        ">": left > right,
+        ">=": left >= right,
+    }[operator]
+
+
+def _evaluate(node, item):
+    kind = node[0]
+    if kind == "or":
+        return _evaluate(node[1], item) or _evaluate(node[2], item)
+    if kind == "and":
+        return _evaluate(node[1], item) and _evaluate(node[2], item)
+    if kind == "not":
+        return not _evaluate(node[1], item)
+    if kind == "cmp":
+        _, operator, left, right = node
+        return _compare(operator, _resolve(left, item), _resolve(right, item))
+    if kind == "between":
+        value = _resolve(node[1], item)
+        return _compare(">=", value, _resolve(node[2], item)) and _compare(
+            "<=", value, _resolve(node[3], item)
+        )
+    if kind == "in":
+        value = _resolve(node[1], item)
+        return any(_compare("=", value, _resolve(o, item)) for o in node[2])
+    if kind == "test":
+        _, function, args = node[1]
+        if function == "attribute_exists":
+            return _resolve(args[0], item) is not _MISSING
+        if function == "attribute_not_exists":
+            return _resolve(args[0], item) is _MISSING
+        if function == "begins_with":
+            value, prefix = _resolve(args[0], item), _resolve(args[1], item)
+            return isinstance(value, (str, bytes)) and value.startswith(prefix)
+        if function == "contains":
+            value, member = _resolve(args[0], item), _resolve(args[1], item)
+            if value is _MISSING:
+                return False
+            return member in value
+        raise ExpressionError(f"Unknown function {function}")
+    raise ExpressionError(f"Unexpected condition {kind}")
+
+
+class Request:
+    """The expression parts of one request, with placeholders resolved."""
+
+    def __init__(self, kwargs, operation):
+        self.operation = operation
+        self.names = dict(kwargs.get("ExpressionAttributeNames") or {})
+        self.values = dict(kwargs.get("ExpressionAttributeValues") or {})
+        self.kwargs = kwargs
+        self._parsers = []
+
+    def _expression(self, key, is_key_condition=False):
+        expression = self.kwargs.get(key)
+        if isinstance(expression, ConditionBase):
+            built = ConditionExpressionBuilder().build_expression(
+                expression, is_key_condition=is_key_condition
+            )
+            self.names.update(built.attribute_name_placeholders)
+            self.values.update(built.attribute_value_placeholders)
+            expression = built.condition_expression
+        return expression
+
+    def parser(self, key, is_key_condition=False):
+        expression = self._expression(key, is_key_condition)
+        if not expression:
+            return None
+        parser = _Parser(expression, self.names, self.values)
+        self._parsers.append(parser)
+        return parser
+
+    def condition(self, key="ConditionExpression", is_key_condition=False):
+        parser = self.parser(key, is_key_condition)
+        if parser is None:
+            return None
+        node = parser.condition()
+        if not parser.at_end():
+            raise ExpressionError(f"Trailing tokens in {key}")
+        return node
+
+    def projection(self):
+        parser = self.parser("ProjectionExpression")
+        return parser.projection() if parser else None
+
+    def check_unused(self):
+        # DynamoDB rejects placeholders that no expression refers to
+        used_names = set().union(*(p.used_names for p in self._parsers))
+        used_values = set().union(*(p.used_values for p in self._parsers))
+        unused = (set(self.names) - used_names) | (set(self.values) - used_values)
+        if unused:
+            raise client_error(
+                "ValidationException",
+                f"Value provided in ExpressionAttribute* unused in expressions: "
+                f"{sorted(unused)}",
+                self.operation,
+            )
+
+
+def apply_update(item, actions):
+    item = copy.deepcopy(item)
+    updated = set()
+    for clause, path, operand in actions:
+        updated.add(path)
+        if clause == "SET":
+            item[path] = _resolve(operand, item)
+        elif clause == "REMOVE":
+            item.pop(path, None)
+        elif clause == "ADD":
+            value = _resolve(operand, item)
+            current = item.get(path, _MISSING)
+            if isinstance(value, Decimal):
+                item[path] = (Decimal(0) if current is _MISSING else current) + value
+            elif isinstance(value, set):
+                item[path] = (set() if current is _MISSING else set(current)) | value
+            else:
+                raise ExpressionError("ADD needs a number or a set")
+        elif clause == "DELETE":
+            current = item.get(path, _MISSING)
+            if current is not _MISSING:
+                remaining = set(current) - _resolve(operand, item)
+                if remaining:
+                    item[path] = remaining
+                else:
+                    item.pop(path)
+    return item, updated
+
+
+# --- tables ----------------------------------------------------------------
+
+
+def _sort_value(value):
+    # Partition order is a hash, like DynamoDB's; only range keys are ordered
+    if isinstance(value, bytes):
+        return value
+    return str(value)
+
+
+def _partition_hash(value):
+    return hashlib.md5(repr(_sort_value(value)).encode()).hexdigest()
+
+
+class Index:
+    def __init__(self, name, hash_key, range_key=None):
+        self.name = name
+        self.hash_key = hash_key
+        self.range_key = range_key
+
+    @property
+    def key_names(self):
+        return [k for k in (self.hash_key, self.range_key) if k]
+
+    def covers(self, item):
+        return all(name in item for name in self.key_names)
+
+
+class FakeTable:
+    def __init__(self, resource, name):
+        self._resource = resource
+        self.name = name
+
+    @property
+    def _state(self):
+        state = self._resource._tables.get(self.name)
+        if state is None:
+            raise client_error(
+                "ResourceNotFoundException",
+                f"Requested resource not found: Table: {self.name} not found",
+                "DescribeTable",
+            )
+        return state
+
+    def get_item(self, **kwargs):
+        return self._resource._call("GetItem", self._state.get_item, kwargs)
+
+    def put_item(self, **kwargs):
+        return self._resource._call("PutItem", self._state.put_item, kwargs)
+
+    def update_item(self, **kwargs):
+        return self._resource._call("UpdateItem", self._state.update_item, kwargs)
+
+    def delete_item(self, **kwargs):
+        return self._resource._call("DeleteItem", self._state.delete_item, kwargs)
+
+    def query(self, **kwargs):
+        return self._resource._call("Query", self._state.query, kwargs)
+
+    def scan(self, **kwargs):
+        return self._resource._call("Scan", self._state.scan, kwargs)
+
+
+class TableState:
+    def __init__(self, resource, name, hash_key, range_key=None, indexes=None):
+        self.resource = resource
+        self.name = name
+        self.key = Index(None, hash_key, range_key)
+        self.indexes = {
+            index_name: Index(index_name, *keys)
+            for index_name, keys in (indexes or {}).items()
+        }
+        self.items = {}
+
+    # Keys
+
+    def key_of(self, item, operation):
+        try:
+            return tuple(item[name] for name in self.key.key_names)
+        except KeyError:
+            raise client_error(
+                "ValidationException",
+                "The provided key element does not match the schema",
+                operation,
+            )
+
+    def primary_key(self, kwargs, operation):
+        key = to_dynamo(kwargs["Key"])
+        if set(key) != set(self.key.key_names):
+            raise client_error(
+                "ValidationException",
+                "The provided key element does not match the schema",
+                operation,
+            )
+        return self.key_of(key, operation)
+
+    def key_item(self, item, index=None):
+        names = self.key.key_names + (index.key_names if index else [])
+        return {name: copy.deepcopy(item[name]) for name in names}
+
+    def _stats(self, **counts):
+        self.resource.stats.update(counts)
+
+    # Single-item operations
+
+    def check_condition(self, request, item, operation):
+        node = request.condition()
+        if node is not None and not _evaluate(node, item or {}):
+            raise client_error(
+                "ConditionalCheckFailedException",
+                "The conditional request failed",
+                operation,
+            )
+
+    def get_item(self, kwargs):
+        request = Request(kwargs, "GetItem")
+        key = self.primary_key(kwargs, "GetItem")
+        projection = request.projection()
+        request.check_unused()
+        item = self.items.get(key)
+        response = {}
+        size = 0
+        if item is not None:
+            size = item_size(item)
+            response["Item"] = self.project(item, projection)
+            self._stats(items_read=1)
+        self._stats(read_units=capacity_units(size))
+        return self.with_capacity(response, kwargs, capacity_units(size))
+
+    def put_item(self, kwargs, apply=True):
+        request = Request(kwargs, "PutItem")
+        item = to_dynamo(kwargs["Item"])
+        key = self.key_of(item, "PutItem")
+        old = self.items.get(key)
+        self.check_condition(request, old, "PutItem")
+        request.check_unused()
+        size = item_size(item)
+        if size > 400 * 1024:
+            raise client_error(
+                "ValidationException", "Item size has exceeded the maximum", "PutItem"
+            )
+        if apply:
+            self.items[key] = item
+            self._stats(items_written=1, write_units=capacity_units(size, True))
+        response = {}
+        if kwargs.get("ReturnValues") == "ALL_OLD" and old is not None:
+            response["Attributes"] = copy.deepcopy(old)
+        return self.with_capacity(response, kwargs, capacity_units(size, True))
+
+    def update_item(self, kwargs, apply=True):
+        request = Request(kwargs, "UpdateItem")
+        key = self.primary_key(kwargs, "UpdateItem")
+        old = self.items.get(key)
+        self.check_condition(request, old, "UpdateItem")
+        parser = request.parser("UpdateExpression")
+        actions = parser.update_actions() if parser else []
+        request.check_unused()
+        base = old if old is not None else to_dynamo(kwargs["Key"])
+        try:
+            new, updated = apply_update(base, actions)
+        except ExpressionError as e:
+            raise client_error("ValidationException", str(e), "UpdateItem")
+        if any(name in self.key.key_names for name in updated):
+            raise client_error(
+                "ValidationException",
+                "Cannot update attribute that is part of the key",
+                "UpdateItem",
+            )
+        size = item_size(new)
+        if apply:
+            self.items[key] = new
+            self._stats(items_written=1, write_units=capacity_units(size, True))
+
+        response = {}
+        return_values = kwargs.get("ReturnValues", "NONE")
+        if return_values == "ALL_OLD" and old is not None:
+            response["Attributes"] = copy.deepcopy(old)
+        elif return_values == "ALL_NEW":
+            response["Attributes"] = copy.deepcopy(new)
+        elif return_values == "UPDATED_NEW":
+            response["Attributes"] = {
+                k: copy.deepcopy(new[k]) for k in updated if k in new
+            }
+        elif return_values == "UPDATED_OLD" and old is not None:
+            response["Attributes"] = {
+                k: copy.deepcopy(old[k]) for k in updated if k in old
+            }
+        return self.with_capacity(response, kwargs, capacity_units(size, True))
+
+    def delete_item(self, kwargs, apply=True):
+        request = Request(kwargs, "DeleteItem")
+        key = self.primary_key(kwargs, "DeleteItem")
+        old = self.items.get(key)
+        self.check_condition(request, old, "DeleteItem")
+        request.check_unused()
+        if apply and old is not None:
+            del self.items[key]
+            self._stats(items_written=1, write_units=1.0)
+        response = {}
+        if kwargs.get("ReturnValues") == "ALL_OLD" and old is not None:
+            response["Attributes"] = copy.deepcopy(old)
+        return self.with_capacity(response, kwargs, 1.0)
+
+    def check_only(self, kwargs, apply=False):
+        request = Request(kwargs, "ConditionCheck")
+        key = self.primary_key(kwargs, "ConditionCheck")
+        self.check_condition(request, self.items.get(key), "ConditionCheck")
+        request.check_unused()
+        return {}
+
+    # Reads over many items
+
+    def project(self, item, projection):
+        if projection is None:
+            return copy.deepcopy(item)
+        return {name: copy.deepcopy(item[name]) for name in projection if name in item}
+
+    def with_capacity(self, response, kwargs, units):
+        if kwargs.get("ReturnConsumedCapacity", "NONE") != "NONE":
+            response["ConsumedCapacity"] = {
+                "TableName": self.name,
+                "CapacityUnits": units,
+            }
+        return response
+
+    def _index(self, kwargs, operation):
+        name = kwargs.get("IndexName")
+        if name is None:
+            return None
+        if name not in self.indexes:
+            raise client_error(
+                "ValidationException",
+                f"The table does not have the specified index: {name}",
+                operation,
+            )
+        return self.indexes[name]
+
+    def _page(self, candidates, kwargs, request, index, operation):
+        """Read one page from ``candidates`` (already ordered, after the start key)."""
+        filter_node = request.condition("FilterExpression")
+        projection = request.projection()
+        request.check_unused()
+        limit = kwargs.get("Limit")
+        items = []
+        scanned = 0
+        size = 0
+        last = None
+        for item in candidates:
+            scanned += 1
+            size += item_size(item)
+            last = item
+            if filter_node is None or _evaluate(filter_node, item):
+                items.append(item)
+            if (limit and scanned >= limit) or size >= PAGE_BYTES:
+                break
+        else:
+            last = None
+
+        units = capacity_units(size)
+        self._stats(items_read=scanned, read_units=units)
+        response = {"Count": len(items), "ScannedCount": scanned}
+        if kwargs.get("Select") != "COUNT":
+            response["Items"] = [self.project(item, projection) for item in items]
+        if last is not None:
+            response["LastEvaluatedKey"] = self.key_item(last, index)
+        return self.with_capacity(response, kwargs, units)
+
+    def _order(self, item, index):
+        keys = index.key_names if index else self.key.key_names
+        order = [_partition_hash(item[keys[0]])]
+        order += [item[name] for name in keys[1:]]
+        if index:
+            order += [_sort_value(item[name]) for name in self.key.key_names]
+        return order
+
+    def _after(self, items, start_key, index):
+        if not start_key:
+            return items
+        start = self._order(to_dynamo(start_key), index)
+        return [item for item in items if self._order(item, index) > start]
+
+    def query(self, kwargs):
+        request = Request(kwargs, "Query")
+        index = self._index(kwargs, "Query")
+        schema = index or self.key
+        node = request.condition("KeyConditionExpression", is_key_condition=True)
+        if node is None:
+            raise client_error(
+                "ValidationException", "KeyConditionExpression is required", "Query"
+            )
+        items = [
+            item
+            for item in self.items.values()
+            if (index is None or index.covers(item)) and _evaluate(node, item)
+        ]
+        hash_values = {item[schema.hash_key] for item in items}
+        if len(hash_values) > 1:
+            raise client_error(
+                "ValidationException",
+                "Query key condition must use equality on the partition key",
+                "Query",
+            )
+        items.sort(key=lambda item: self._order(item, index))
+        if kwargs.get("ScanIndexForward", True) is False:
+            items.reverse()
+            start = kwargs.get("ExclusiveStartKey")
+            if start:
+                start = self._order(to_dynamo(start), index)
+                items = [i for i in items if self._order(i, index) < start]
+        else:
+            items = self._after(items, kwargs.get("ExclusiveStartKey"), index)
+        return self._page(items, kwargs, request, index, "Query")
+
+    def scan(self, kwargs):
+        request = Request(kwargs, "Scan")
+        index = self._index(kwargs, "Scan")
+        items = [
+            item for item in self.items.values() if index is None or index.covers(item)
+        ]
+        total = kwargs.get("TotalSegments")
+        if total:
+            segment = kwargs["Segment"]
+            hash_key = (index or self.key).hash_key
+            items = [
+                item
+                for item in items
+                if int(_partition_hash(item[hash_key]), 16) % total == segment
+            ]
+        items.sort(key=lambda item: self._order(item, index))
+        items = self._after(items, kwargs.get("ExclusiveStartKey"), index)
+        return self._page(items, kwargs, request, index, "Scan")
+
+
+# --- resource ----------------------------------------------------------------
+
+
+class FaultInjector:
+    """Adds latency and throttling errors to a share of the calls."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, throttle_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def before(self, operation):
+        with self._lock:
+            delay = self.latency_ms + self.random.uniform(0, self.jitter_ms)
+            throttled = self.random.random() < self.throttle_rate
+        if delay:
+            time.sleep(delay / 1000)
+        if throttled:
+            raise client_error(
+                "ProvisionedThroughputExceededException",
+                "The level of configured provisioned throughput for the table "
+                "was exceeded.",
+                operation,
+            )
+
+
+class _Meta:
+    def __init__(self, client):
+        self.client = client
+
+
+class FakeClient:
+    def __init__(self, resource):
+        self._resource = resource
+
+    def transact_write_items(self, **kwargs):
+        return self._resource._call(
+            "TransactWriteItems", self._resource._transact_write, kwargs
+        )
+
+    def batch_get_item(self, **kwargs):
+        return self._resource.batch_get_item(**kwargs)
+
+    def batch_write_item(self, **kwargs):
+        return self._resource.batch_write_item(**kwargs)
+
+
+class FakeDynamoDB:
+    """Drop-in for ``boto3.resource("dynamodb")`` backed by Python dicts."""
+
+    def __init__(self, faults=None):
+        self.faults = faults or FaultInjector()
+        self.stats = Counter()
+        self.meta = _Meta(FakeClient(self))
+        self._tables = {}
+        self._tokens = {}
+        self._lock = threading.RLock()
+
+    def create_table(self, name, hash_key, range_key=None, indexes=None):
+        """Create ``name``; ``indexes`` maps GSI names to (hash, range) keys."""
+        self._tables[name] = TableState(self, name, hash_key, range_key, indexes)
+        return self.Table(name)
+
+    def Table(self, name):
+        return FakeTable(self, name)
+
+    def reset_stats(self):
+        self.stats.clear()
+
+    def _call(self, operation, handler, kwargs):
+        self.stats[f"calls.{operation}"] += 1
+        try:
+            self.faults.before(operation)
+        except ClientError:
+            self.stats["throttled"] += 1
+            raise
+        with self._lock:
+            try:
+                return handler(kwargs)
+            except ExpressionError as e:
+                raise client_error("ValidationException", str(e), operation)
+
+    def batch_get_item(self, **kwargs):
+        return self._call("BatchGetItem", self._batch_get, kwargs)
+
+    def _batch_get(self, kwargs):
+        requests = kwargs["RequestItems"]
+        if sum(len(r["Keys"]) for r in requests.values()) > BATCH_GET_LIMIT:
+            raise client_error(
+                "ValidationException",
+                "Too many items requested for the BatchGetItem call",
+                "BatchGetItem",
+            )
+        responses = {}
+        for table_name, request in requests.items():
+            table = self.Table(table_name)._state
+            items = responses.setdefault(table_name, [])
+            for key in request["Keys"]:
+                params = {k: v for k, v in request.items() if k != "Keys"}
+                response = table.get_item({"Key": key, **params})
+                if "Item" in response:
+                    items.append(response["Item"])
+        return {"Responses": responses, "UnprocessedKeys": {}}
+
+    def batch_write_item(self, **kwargs):
+        return self._call("BatchWriteItem", self._batch_write, kwargs)
+
+    def _batch_write(self, kwargs):
+        requests = kwargs["RequestItems"]
+        if sum(len(r) for r in requests.values()) > BATCH_WRITE_LIMIT:
+            raise client_error(
+                "ValidationException",
+                "Too many items requested for the BatchWriteItem call",
+                "BatchWriteItem",
+            )
+        unprocessed = {}
+        for table_name, writes in requests.items():
+            table = self.Table(table_name)._state
+            for write in writes:
+                # Throttling a batch hands part of it back instead of failing
+                if self.faults.random.random() < self.faults.throttle_rate:
+                    unprocessed.setdefault(table_name, []).append(write)
+                    self.stats["throttled"] += 1
+                elif "PutRequest" in write:
+                    table.put_item({"Item": write["PutRequest"]["Item"]})
+                else:
+                    table.delete_item({"Key": write["DeleteRequest"]["Key"]})
+        return {"UnprocessedItems": unprocessed}
+
+    def _transact_write(self, kwargs):
+        items = kwargs["TransactItems"]
+        if len(items) > TRANSACT_LIMIT:
+            raise client_error(
+                "ValidationException",
+                "Member must have length less than or equal to 100",
+                "TransactWriteItems",
+            )
+
+        token = kwargs.get("ClientRequestToken")
+        fingerprint = json.dumps(items, sort_keys=True, default=repr)
+        if token:
+            seen = self._tokens.get(token)
+            if seen and time.time() - seen[1] < 600:
+                if seen[0] != fingerprint:
+                    raise client_error(
+                        "IdempotentParameterMismatchException",
+                        "The request uses the same client token as a previous, "
+                        "but non-identical request.",
+                        "TransactWriteItems",
+                    )
+                return {}
+
+        actions = []
+        reasons = []
+        failed = False
+        for entry in items:
+            ((action, params),) = entry.items()
+            params = dict(params)
+            table = self.Table(params.pop("TableName"))._state
+            handler = {
+                "Put": table.put_item,
+                "Update": table.update_item,
+                "Delete": table.delete_item,
+                "ConditionCheck": table.check_only,
+            }[action]
+            try:
+                handler(params, apply=False)
+                reasons.append({"Code": "None"})
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+                failed = True
+                reasons.append(
+                    {
+                        "Code": "ConditionalCheckFailed",
+                        "Message": "The conditional request failed",
+                    }
+                )
+            actions.append((handler, params))
+
+        if failed:
+            codes = ", ".join(r["Code"] for r in reasons)
+            raise client_error(
+                "TransactionCanceledException",
+                "Transaction cancelled, please refer cancellation reasons for "
+                f"specific reasons [{codes}]",
+                "TransactWriteItems",
+                CancellationReasons=reasons,
+            )
+
+        for handler, params in actions:
+            handler(params)
+        # Transactions cost twice the writes of the same plain operations
+        self.stats["write_units"] += sum(1 for _ in actions)
+        if token:
+            self._tokens[token] = (fingerprint, time.time())
+        return {}
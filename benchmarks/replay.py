@@ -0,0 +1,431 @@
+"""Replay Telegram updates through ``lambda_handler`` and report what they cost.
+
+DynamoDB is replaced by the in-memory stand-in in ``fake_dynamodb.py`` and the
+Telegram Bot API by a stub that answers every call locally, so a run needs no
+network and no AWS account. Updates are either generated by simulated users
+that react to what the bot sent them, or read from a JSON-lines file.
+
+    python benchmarks/replay.py --users 50 --updates 2000
+    python benchmarks/replay.py --users 50 --updates 2000 --record updates.jsonl
+    python benchmarks/replay.py --replay updates.jsonl --latency-ms 8 --throttle-rate 0.02
+    python benchmarks/replay.py --updates 2000 --redeliver-rate 0.1
+
+The report has latency percentiles per update and, per handler, the DynamoDB
+calls, items read and written, capacity units and Bot API calls. Replies sent
+back in the webhook response (--webhook-reply) are not counted as calls.
+Updates Telegram delivers again (--redeliver-rate) are reported as "redelivery".
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import math
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+
+BOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bot")
+sys.path.insert(0, BOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:BENCHMARK")
+os.environ.setdefault("DYNAMODB_TABLE_PREFIX", "echopod")
+
+from telegram.request import BaseRequest  # noqa: E402
+
+from fake_dynamodb import FakeDynamoDB, FaultInjector  # noqa: E402
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Echopod", "username": "bot"}
+
+
+def create_bot_tables(resource, prefix):
+    resource.create_table(
+        f"{prefix}_User",
+        "user_id",
+        indexes={
+            "reminder_bucket-next_reminder_at-index": (
+                "reminder_bucket",
+                "next_reminder_at",
+            )
+        },
+    )
+    resource.create_table(
+        f"{prefix}_OriginalText",
+        "text_id",
+        indexes={"translated-text_id-index": ("translated", "text_id")},
+    )
+    resource.create_table(
+        f"{prefix}_Translation",
+        "translation_id",
+        indexes={
+            "vote_queue-vote_count-index": ("vote_queue", "vote_count"),
+            "updated_day-updated_at-index": ("updated_day", "updated_at"),
+            "quality_band-mean_score-index": ("quality_band", "mean_score"),
+        },
+    )
+    resource.create_table(f"{prefix}_Score", "score_id")
+    resource.create_table("daily_stats", "date", "user_id")
+    resource.create_table(f"{prefix}_Meta", "meta_key")
+
+
+def seed_texts(resource, prefix, count):
+    table = resource.Table(f"{prefix}_OriginalText")
+    for text_id in range(1, count + 1):
+        table.put_item(
+            Item={
+                "text_id": text_id,
+                "lang": "en",
+                "text": f"Sentence number {text_id} to translate.",
+                "translated": "False",
+            }
+        )
+
+
+class StubTelegramRequest(BaseRequest):
+    """Answers Bot API calls locally and remembers what each chat was sent."""
+
+    def __init__(self):
+        self.calls = Counter()
+        self.last_message = {}
+        self._message_id = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(
+        self,
+        url,
+        method,
+        request_data=None,
+        read_timeout=None,
+        write_timeout=None,
+        connect_timeout=None,
+        pool_timeout=None,
+    ):
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[endpoint] += 1
+
+        if endpoint == "getMe":
+            result = BOT_USER
+        elif endpoint == "sendMessage":
+            result = self.send_message(params)
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    def send_message(self, params):
+        self._message_id += 1
+        reply_markup = params.get("reply_markup")
+        if isinstance(reply_markup, str):
+            reply_markup = json.loads(reply_markup)
+        chat_id = int(params["chat_id"])
+        self.last_message[chat_id] = {
+            "text": params.get("text", ""),
+            "buttons": [
+                button.get("callback_data")
+                for row in (reply_markup or {}).get("inline_keyboard", [])
+                for button in row
+            ],
+        }
+        return {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
+
+    def webhook_reply(self, response):
+        """Run the method call a webhook response carries, as Telegram would."""
+        if "headers" not in response:
+            return
+        params = json.loads(response["body"])
+        if params.pop("method") == "sendMessage":
+            self.send_message(params)
+
+
+def message_update(update_id, user_id, text):
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [
+            {"type": "bot_command", "offset": 0, "length": len(text.split()[0])}
+        ]
+    return {"update_id": update_id, "message": message}
+
+
+def callback_update(update_id, user_id, data):
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "text": "",
+            },
+        },
+    }
+
+
+class SyntheticUsers:
+    """Users who tap the buttons and answer the prompts they were last sent."""
+
+    COMMANDS = [
+        ("/contribute", 40),
+        ("/vote", 40),
+        ("/leaderboard", 10),
+        ("/stats", 5),
+        ("/stop", 5),
+    ]
+
+    def __init__(self, count, telegram, rng):
+        self.user_ids = [1000 + i for i in range(count)]
+        self.started = set()
+        self.telegram = telegram
+        self.rng = rng
+
+    def next_update(self, update_id):
+        user_id = self.rng.choice(self.user_ids)
+        if user_id not in self.started:
+            self.started.add(user_id)
+            return message_update(update_id, user_id, "/start")
+
+        buttons = self.telegram.last_message.pop(user_id, {}).get("buttons", [])
+        votes = [b for b in buttons if b and b.startswith("vote_")]
+        if votes and self.rng.random() < 0.9:
+            return callback_update(update_id, user_id, self.rng.choice(votes))
+        if "start_voting" in buttons:
+            return callback_update(update_id, user_id, "start_voting")
+        if "skip_contribute" in buttons:
+            if self.rng.random() < 0.85:
+                text = f"ဘာသာပြန် {update_id}"
+                return message_update(update_id, user_id, text)
+            return callback_update(update_id, user_id, "skip_contribute")
+
+        commands, weights = zip(*self.COMMANDS)
+        command = self.rng.choices(commands, weights)[0]
+        return message_update(update_id, user_id, command)
+
+
+def handler_label(update):
+    if "callback_query" in update:
+        return "callback:" + update["callback_query"]["data"].split("_")[0]
+    text = update.get("message", {}).get("text", "")
+    return text.split()[0] if text.startswith("/") else "text"
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    # Nearest-rank percentile
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.totals = defaultdict(Counter)
+
+    def add(self, label, latency_ms, db_stats, telegram_calls, ok):
+        self.latencies[label].append(latency_ms)
+        totals = self.totals[label]
+        totals["updates"] += 1
+        totals["errors"] += 0 if ok else 1
+        totals["telegram_calls"] += telegram_calls
+        totals["db_calls"] += sum(
+            v for k, v in db_stats.items() if k.startswith("calls.")
+        )
+        for key in ("items_read", "items_written", "read_units", "write_units"):
+            totals[key] += db_stats.get(key, 0)
+        totals["throttled"] += db_stats.get("throttled", 0)
+
+    def summary(self):
+        every = [ms for values in self.latencies.values() for ms in values]
+        report = {
+            "updates": len(every),
+            "latency_ms": {
+                "p50": percentile(every, 50),
+                "p90": percentile(every, 90),
+                "p99": percentile(every, 99),
+                "max": max(every, default=0.0),
+                "mean": statistics.fmean(every) if every else 0.0,
+            },
+            "handlers": {},
+        }
+        for label in sorted(self.totals):
+            totals = self.totals[label]
+            n = totals["updates"]
+            report["handlers"][label] = {
+                "updates": n,
+                "errors": totals["errors"],
+                "throttled": totals["throttled"],
+                "p50_ms": percentile(self.latencies[label], 50),
+                "p99_ms": percentile(self.latencies[label], 99),
+                "db_calls": totals["db_calls"] / n,
+                "items_read": totals["items_read"] / n,
+                "items_written": totals["items_written"] / n,
+                "read_units": totals["read_units"] / n,
+                "write_units": totals["write_units"] / n,
+                "telegram_calls": totals["telegram_calls"] / n,
+            }
+        return report
+
+
+def print_report(report):
+    latency = report["latency_ms"]
+    print(
+        f"{report['updates']} updates  "
+        f"p50 {latency['p50']:.2f} ms  p90 {latency['p90']:.2f} ms  "
+        f"p99 {latency['p99']:.2f} ms  max {latency['max']:.2f} ms"
+    )
+    print()
+    header = (
+        f"{'handler':<20}{'n':>6}{'err':>5}{'thr':>5}{'p50 ms':>9}{'p99 ms':>9}"
+        f"{'db':>7}{'read':>7}{'write':>7}{'RCU':>7}{'WCU':>7}{'tg':>5}"
+    )
+    print(header)
+    print("-" * len(header))
+    for label, row in report["handlers"].items():
+        print(
+            f"{label:<20}{row['updates']:>6}{row['errors']:>5}{row['throttled']:>5}"
+            f"{row['p50_ms']:>9.2f}{row['p99_ms']:>9.2f}"
+            f"{row['db_calls']:>7.1f}{row['items_read']:>7.1f}"
+            f"{row['items_written']:>7.1f}{row['read_units']:>7.1f}"
+            f"{row['write_units']:>7.1f}{row['telegram_calls']:>5.1f}"
+        )
+
+
+def read_updates(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                update = json.loads(line)
+                yield json.loads(update["body"]) if "body" in update else update
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    # The bot samples texts and translations with the global generator
+    random.seed(args.seed)
+
+    faults = FaultInjector(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        throttle_rate=args.throttle_rate,
+        seed=args.seed,
+    )
+    resource = FakeDynamoDB()
+    prefix = os.environ["DYNAMODB_TABLE_PREFIX"]
+    create_bot_tables(resource, prefix)
+    seed_texts(resource, prefix, args.texts)
+
+    if args.webhook_reply:
+        os.environ["WEBHOOK_REPLY"] = "true"
+    import db
+    import main_function
+
+    db.bind_dynamodb(resource)
+    # Stands in for the scheduled rebuild_untranslated_index job
+    db.rebuild_untranslated_index()
+    resource.stats.clear()
+    resource.faults = faults
+    telegram = StubTelegramRequest()
+    main_function.application = main_function.build_application(telegram)
+    logging.getLogger("main_function").setLevel(logging.WARNING)
+    with contextlib.redirect_stdout(None):
+        main_function.lambda_handler({"warmup": True}, None)
+
+    if args.replay:
+        updates = read_updates(args.replay)
+    else:
+        users = SyntheticUsers(args.users, telegram, rng)
+        updates = (users.next_update(i) for i in range(1, args.updates + 1))
+
+    delivered = []
+    record = open(args.record, "w") if args.record else None
+    recorder = Recorder()
+    try:
+        for update in updates:
+            label = handler_label(update)
+            if delivered and rng.random() < args.redeliver_rate:
+                # A retry of an update whose response Telegram never got
+                update, label = rng.choice(delivered), "redelivery"
+            else:
+                delivered.append(update)
+            if record:
+                record.write(json.dumps(update) + "\n")
+            resource.reset_stats()
+            telegram_calls = sum(telegram.calls.values())
+            started = time.perf_counter()
+            # The handler prints its metrics record; keep the report readable
+            with contextlib.redirect_stdout(None):
+                response = main_function.lambda_handler(
+                    {"body": json.dumps(update)}, None
+                )
+            latency_ms = (time.perf_counter() - started) * 1000
+            telegram.webhook_reply(response)
+            recorder.add(
+                label,
+                latency_ms,
+                dict(resource.stats),
+                sum(telegram.calls.values()) - telegram_calls,
+                response.get("statusCode") == 200,
+            )
+    finally:
+        if record:
+            record.close()
+    return recorder.summary()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--texts", type=int, default=2000, help="OriginalText rows")
+    parser.add_argument("--replay", help="JSON-lines file of updates to replay")
+    parser.add_argument("--record", help="write the updates that were run here")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--webhook-reply",
+        action="store_true",
+        help="return the first reply in the webhook response",
+    )
+    parser.add_argument(
+        "--redeliver-rate",
+        type=float,
+        default=0.0,
+        help="fraction of deliveries that repeat an earlier update",
+    )
+    parser.add_argument("--json", action="store_true", help="print the raw report")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+import random
+import struct
+import zlib
+from array import array
+from bisect import bisect_left, insort
+
+# Containers hold the low 16 bits of every value that shares the same high
+# bits. Sparse containers are sorted arrays, dense ones are 8 KiB bitmaps.
+ARRAY_CONTAINER_MAX = 4096
+BITMAP_CONTAINER_BYTES = 1 << 13
+
+_ARRAY = 0
+_BITMAP = 1
+_MAGIC = b"RBM1"
+_POPCOUNT = bytes(bin(i).count("1") for i in range(256))
+_BIG_ENDIAN = array("H", [1]).tobytes() == b"\x00\x01"
+
+
+class RoaringBitmap:
+    """Compressed set of non-negative integers with uniform sampling.
+
+    A sample is a :meth:`select` of a random rank, which walks the container
+    keys and, in a dense container, up to 8 KiB of bitmap bytes.
+    """
+
+    def __init__(self, values=()):
+        self._containers = {}
+        self._cardinality = {}
+        self._keys = []
+        for value in values:
+            self.add(value)
+
+    def __len__(self):
+        return sum(self._cardinality.values())
+
+    def __contains__(self, value):
+        high, low = divmod(int(value), 1 << 16)
+        container = self._containers.get(high)
+        if container is None:
+            return False
+        if isinstance(container, array):
+            i = bisect_left(container, low)
+            return i < len(container) and container[i] == low
+        return bool(container[low >> 3] & (1 << (low & 7)))
+
+    def __iter__(self):
+        for high in self._keys:
+            base = high << 16
+            container = self._containers[high]
+            lows = (
+                container if isinstance(container, array) else _iter_bitmap(container)
+            )
+            for low in lows:
+                yield base + low
+
+    def add(self, value):
+        high, low = divmod(int(value), 1 << 16)
+        container = self._containers.get(high)
+        if container is None:
+            self._containers[high] = array("H", [low])
+            self._cardinality[high] = 1
+            insort(self._keys, high)
+            return True
+
+        if isinstance(container, array):
+            i = bisect_left(container, low)
+            if i < len(container) and container[i] == low:
+                return False
+            container.insert(i, low)
+            self._cardinality[high] += 1
+            if len(container) > ARRAY_CONTAINER_MAX:
+                self._containers[high] = _to_bitmap(container)
+            return True
+
+        mask = 1 << (low & 7)
+        if container[low >> 3] & mask:
+            return False
+        container[low >> 3] |= mask
+        self._cardinality[high] += 1
+        return True
+
+    def discard(self, value):
+        high, low = divmod(int(value), 1 << 16)
+        container = self._containers.get(high)
+        if container is None:
+            return False
+
+        if isinstance(container, array):
+            i = bisect_left(container, low)
+            if i == len(container) or container[i] != low:
+                return False
+            del container[i]
+        else:
+            mask = 1 << (low & 7)
+            if not container[low >> 3] & mask:
+                return False
+            container[low >> 3] &= ~mask & 0xFF
+
+        self._cardinality[high] -= 1
+        if self._cardinality[high] == 0:
+            del self._containers[high]
+            del self._cardinality[high]
+            self._keys.remove(high)
+        elif (
+            not isinstance(container, array)
+            and self._cardinality[high] <= ARRAY_CONTAINER_MAX
+        ):
+            self._containers[high] = array("H", _iter_bitmap(container))
+        return True
+
+    def select(self, rank):
+        """Return the ``rank``-th smallest value (0-based)."""
+        if rank < 0:
+            raise IndexError("rank out of range")
+        for high in self._keys:
+            cardinality = self._cardinality[high]
+            if rank >= cardinality:
+                rank -= cardinality
+                continue
+            container = self._containers[high]
+            if isinstance(container, array):
+                return (high << 16) + container[rank]
+            for byte_index, byte in enumerate(container):
+                count = _POPCOUNT[byte]
+                if rank >= count:
+                    rank -= count
+                    continue
+                for bit in range(8):
+                    if byte & (1 << bit):
+                        if rank == 0:
+                            return (high << 16) + (byte_index << 3) + bit
+                        rank -= 1
+        raise IndexError("rank out of range")
+
+    def max(self):
+        """The largest member, or None if the bitmap is empty."""
+        if not self._keys:
+            return None
+        high = self._keys[-1]
+        container = self._containers[high]
+        if isinstance(container, array):
+            return (high << 16) + container[-1]
+        for byte_index in range(len(container) - 1, -1, -1):
+            byte = container[byte_index]
+            if byte:
+                return (high << 16) + (byte_index << 3) + byte.bit_length() - 1
+
+    def sample(self, rng=random):
+        """Return a uniformly random member, or None if the bitmap is empty."""
+        size = len(self)
+        if not size:
+            return None
+        return self.select(rng.randrange(size))
+
+    def serialize(self):
+        parts = [_MAGIC, struct.pack("<I", len(self._keys))]
+        for high in self._keys:
+            container = self._containers[high]
+            kind = _ARRAY if isinstance(container, array) else _BITMAP
+            parts.append(struct.pack("<QBI", high, kind, self._cardinality[high]))
+            if kind == _ARRAY:
+                parts.append(_le_bytes(container))
+            else:
+                parts.append(bytes(container))
+        return zlib.compress(b"".join(parts))
+
+    @classmethod
+    def deserialize(cls, data):
+        data = zlib.decompress(bytes(data))
+        if data[:4] != _MAGIC:
+            raise ValueError("Not a serialized RoaringBitmap")
+        bitmap = cls()
+        (count,) = struct.unpack_from("<I", data, 4)
+        offset = 8
+        for _ in range(count):
+            high, kind, cardinality = struct.unpack_from("<QBI", data, offset)
+            offset += struct.calcsize("<QBI")
+            if kind == _ARRAY:
+                size = cardinality * 2
+                container = array("H")
+                container.frombytes(data[offset : offset + size])
+                if _BIG_ENDIAN:
+                    container.byteswap()
+            else:
+                size = BITMAP_CONTAINER_BYTES
+                container = bytearray(data[offset : offset + size])
+            offset += size
+            bitmap._containers[high] = container
+            bitmap._cardinality[high] = cardinality
+            bitmap._keys.append(high)
+        bitmap._keys.sort()
+        return bitmap
+
+
+def _le_bytes(container):
+    if _BIG_ENDIAN:
+        container = array("H", container)
+        container.byteswap()
+    return container.tobytes()
+
+
+def _to_bitmap(values):
+    bitmap = bytearray(BITMAP_CONTAINER_BYTES)
+    for low in values:
+        bitmap[low >> 3] |= 1 << (low & 7)
+    return bitmap
+
+
+def _iter_bitmap(bitmap):
+    for byte_index, byte in enumerate(bitmap):
+        while byte:
+            bit = (byte & -byte).bit_length() - 1
+            yield (byte_index << 3) + bit
+            byte &= byte - 1
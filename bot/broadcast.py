@@ -0,0 +1,219 @@
+import argparse
+import asyncio
+import logging
+import time
+from collections import Counter
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+from config import (
+    TELEGRAM_BOT_TOKEN,
+    BROADCAST_RATE,
+    BROADCAST_CONCURRENCY,
+    BROADCAST_CHAT_INTERVAL,
+    BROADCAST_MAX_ATTEMPTS,
+)
+from db import (
+    run_db,
+    audience_user_ids,
+    claim_broadcast_user,
+    mark_broadcast_sent,
+    release_broadcast_user,
+    mark_user_blocked,
+    save_broadcast_progress,
+)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+PROGRESS_EVERY = 100
+
+
+class TokenBucket:
+    """Global send rate shared by every broadcast worker."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        # Telegram's RetryAfter applies to the whole bot, not one chat. Sends
+        # resume at the rate, not with a burst saved up during the pause
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+        self.updated_at = self.paused_until
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated_at) * self.rate
+                )
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Broadcast:
+    """Send one message to many users, concurrently and within Telegram limits.
+
+    Every user is claimed in Meta before the send and marked sent after it,
+    so re-running a broadcast with the same id resumes it: users who already
+    got the message are skipped, and users whose sends failed, or whose
+    claim was left pending by a crashed run, are tried again. Users who
+    blocked the bot are flagged and left out of every later audience.
+    """
+
+    def __init__(
+        self,
+        bot,
+        broadcast_id,
+        text,
+        reply_markup=None,
+        rate=BROADCAST_RATE,
+        concurrency=BROADCAST_CONCURRENCY,
+        chat_interval=BROADCAST_CHAT_INTERVAL,
+        max_attempts=BROADCAST_MAX_ATTEMPTS,
+    ):
+        self.bot = bot
+        self.broadcast_id = broadcast_id
+        self.text = text
+        self.reply_markup = reply_markup
+        self.bucket = TokenBucket(rate)
+        self.concurrency = concurrency
+        self.chat_interval = chat_interval
+        self.max_attempts = max_attempts
+        self.counts = Counter()
+        self._unsaved = Counter()
+        self._last_sent = {}
+
+    async def run(self, user_ids=None):
+        if user_ids is None:
+            user_ids = await run_db(lambda: list(audience_user_ids()))
+        await run_db(
+            save_broadcast_progress,
+            self.broadcast_id,
+            {},
+            text=self.text,
+            started_at=int(time.time()),
+        )
+
+        queue = asyncio.Queue()
+        for user_id in user_ids:
+            queue.put_nowait(user_id)
+        workers = [
+            asyncio.create_task(self._worker(queue)) for _ in range(self.concurrency)
+        ]
+        try:
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await self._flush_progress(finished_at=int(time.time()))
+        logger.info(f"Broadcast {self.broadcast_id} done: {dict(self.counts)}")
+        return self.counts
+
+    async def _worker(self, queue):
+        while True:
+            user_id = await queue.get()
+            try:
+                outcome = await self._deliver(user_id)
+            except Exception:
+                logger.exception(f"Broadcast to {user_id} failed")
+                outcome = "failed"
+            finally:
+                queue.task_done()
+            self._count(outcome)
+            if sum(self._unsaved.values()) >= PROGRESS_EVERY:
+                await self._flush_progress()
+
+    async def claim(self, user_id):
+        return await run_db(claim_broadcast_user, self.broadcast_id, user_id)
+
+    async def release(self, user_id):
+        await run_db(release_broadcast_user, self.broadcast_id, user_id)
+
+    async def sent(self, user_id):
+        await run_db(mark_broadcast_sent, self.broadcast_id, user_id)
+
+    async def _deliver(self, user_id):
+        if not await self.claim(user_id):
+            return "skipped"
+
+        for attempt in range(1, self.max_attempts + 1):
+            await self._wait_for_chat(user_id)
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(
+                    chat_id=user_id, text=self.text, reply_markup=self.reply_markup
+                )
+            except RetryAfter as e:
+                logger.warning(f"Flood limit hit, pausing for {e.retry_after}s")
+                self.bucket.pause(_seconds(e.retry_after))
+            except (Forbidden, BadRequest) as e:
+                if isinstance(e, BadRequest) and "chat not found" not in e.message:
+                    break
+                await run_db(mark_user_blocked, user_id)
+                return "blocked"
+            except NetworkError:
+                await asyncio.sleep(min(2**attempt, 30))
+            else:
+                await self.sent(user_id)
+                return "sent"
+
+        await self.release(user_id)
+        return "failed"
+
+    async def _wait_for_chat(self, user_id):
+        last_sent = self._last_sent.get(user_id)
+        now = time.monotonic()
+        if last_sent is not None and now - last_sent < self.chat_interval:
+            await asyncio.sleep(self.chat_interval - (now - last_sent))
+        self._last_sent[user_id] = time.monotonic()
+
+    def _count(self, outcome):
+        self.counts[outcome] += 1
+        self._unsaved[outcome] += 1
+
+    async def _flush_progress(self, **fields):
+        unsaved, self._unsaved = self._unsaved, Counter()
+        await run_db(
+            save_broadcast_progress, self.broadcast_id, dict(unsaved), **fields
+        )
+
+
+def _seconds(retry_after):
+    return getattr(retry_after, "total_seconds", lambda: retry_after)()
+
+
+async def broadcast(bot, broadcast_id, text, user_ids=None, **options):
+    return await Broadcast(bot, broadcast_id, text, **options).run(user_ids)
+
+
+async def main():
+    from telegram import Bot
+
+    parser = argparse.ArgumentParser(description="Send a message to all users")
+    parser.add_argument("broadcast_id", help="reuse an id to resume a broadcast")
+    parser.add_argument("message_file")
+    args = parser.parse_args()
+
+    with open(args.message_file) as f:
+        text = f.read().strip()
+    async with Bot(token=TELEGRAM_BOT_TOKEN) as bot:
+        counts = await broadcast(bot, args.broadcast_id, text)
+    print(dict(counts))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
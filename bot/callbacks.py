@@ -1,20 +1,20 @@
+import asyncio
 import json
 import logging
-from datetime import datetime
 from commands import contribute_command, send_text2vote
+from conversation import IDLE, CONTRIBUTING, VOTING, get_state, set_state
 from db import (
-    get_user_data,
-    set_user_data,
-    save_contribution,
-    save_vote,
-    get_original_text,
+    get_user_session,
+    current_db_metrics,
+    save_contribution_async,
+    save_vote_async,
+    get_original_text_async,
 )
 from utils import (
     send_message,
     edit_message_reply_markup,
-    calculate_interaction_interval,
-    update_avg_interaction_interval,
     check_threshold,
+    with_interaction,
 )
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
@@ -22,29 +22,28 @@ from telegram.ext import ContextTypes
 logger = logging.getLogger(__name__)
 
 
+@with_interaction
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """The one entry point for text messages, routed on the conversation state."""
     user_id = update.effective_user.id
-    interaction_interval = calculate_interaction_interval(user_id)
-    update_avg_interaction_interval(user_id, interaction_interval)
-    set_user_data(user_id, "last_interaction_time", datetime.now().isoformat())
+    session = get_user_session(user_id)
+
+    transition = TEXT_TRANSITIONS.get(get_state(session), reply_with_commands)
+    metrics = current_db_metrics()
+    if metrics is not None:
+        metrics.handler = transition.__name__
+    return await transition(update, context, session)
 
-    contribute_mode = get_user_data(user_id, "contribute_mode")
-    if contribute_mode == "True":
-        await handle_contribution(update, context)
-    else:
-        message = "Please use the provided commands to interact with the bot."
-        await send_message(context, user_id, message)
 
+async def reply_with_commands(update, context, session):
+    message = "Please use the provided commands to interact with the bot."
+    await send_message(context, update.effective_user.id, message)
     return {"statusCode": 200, "body": json.dumps({"message": "Text handled"})}
 
 
-async def handle_contribution(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def handle_contribution(update, context, session):
     user_id = update.effective_user.id
-    contribution_interval = calculate_interaction_interval(user_id)
-    update_avg_interaction_interval(user_id, contribution_interval)
-    set_user_data(user_id, "last_interaction_time", datetime.now().isoformat())
-
-    text_id = get_user_data(user_id, "contribute_text_id")
+    text_id = session.get("contribute_text_id")
     if not text_id:
         await send_message(
             context,
@@ -56,9 +55,20 @@ async def handle_contribution(update: Update, context: ContextTypes.DEFAULT_TYPE
             "body": json.dumps({"message": "Contribution handled"}),
         }
 
+    counts = None
     try:
-        original_text = get_original_text(text_id)
-        save_contribution(text_id, user_id, "mya", update.message.text, original_text)
+        # Persist the interaction fields while the original text is fetched
+        original_text, _ = await asyncio.gather(
+            get_original_text_async(text_id), session.flush_async()
+        )
+        counts = await save_contribution_async(
+            text_id,
+            user_id,
+            "mya",
+            update.message.text,
+            original_text,
+            now=update.message.date.timestamp(),
+        )
         message = "Thank you for your contribution!"
     except Exception:
         logger.exception("Failed to save contribution")
@@ -66,10 +76,11 @@ async def handle_contribution(update: Update, context: ContextTypes.DEFAULT_TYPE
             "Failed to save your contribution due to an error. Please try again later."
         )
 
-    set_user_data(user_id, "contribute_mode", "False")
-    threshold, threshold_message = check_threshold(user_id, type="contribution")
+    set_state(session, IDLE)
+    threshold, threshold_message = check_threshold(counts, type="contribution")
 
     if threshold:
+        # Rest until the user presses Continue
         keyboard = [
             [
                 InlineKeyboardButton("Continue", callback_data="skip_contribute")
@@ -82,35 +93,30 @@ async def handle_contribution(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
     else:
         await send_message(context, user_id, message)
-
-        if get_user_data(user_id, "auto_contribute") == "True":
-            await contribute_command(update, context)
+        await contribute_command(update, context)
 
     return {"statusCode": 200, "body": json.dumps({"message": "Contribution handled"})}
 
 
-async def handle_skip_contribution(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    interaction_interval = calculate_interaction_interval(user_id)
-    update_avg_interaction_interval(user_id, interaction_interval)
-    set_user_data(user_id, "last_interaction_time", datetime.now().isoformat())
+# What a text message means in each conversation state
+TEXT_TRANSITIONS = {CONTRIBUTING: handle_contribution}
+
 
+@with_interaction
+async def handle_skip_contribution(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    query.answer()
+    await query.answer()
 
     if query.data == "skip_contribute":
         await contribute_command(update, context)
 
 
+@with_interaction
 async def handle_start_voting(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     try:
-        voting_interval = calculate_interaction_interval(user_id)
-        update_avg_interaction_interval(user_id, voting_interval)
-        set_user_data(user_id, "last_interaction_time", datetime.now().isoformat())
-
         query = update.callback_query
-        query.answer()
+        await query.answer()
 
         if query.data == "start_voting":
             await edit_message_reply_markup(
@@ -134,20 +140,33 @@ async def handle_start_voting(update: Update, context: ContextTypes.DEFAULT_TYPE
         }
 
 
+@with_interaction
 async def handle_vote(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     try:
-        voting_interval = calculate_interaction_interval(user_id)
-        update_avg_interaction_interval(user_id, voting_interval)
-        set_user_data(user_id, "last_interaction_time", datetime.now().isoformat())
+        session = get_user_session(user_id)
 
         query = update.callback_query
-        await query.answer()
-
         translation_id, score = query.data.split("_")[1:]
-        save_vote(translation_id, user_id, score)
+        # A failed answer() only leaves the button spinning; it must not hide
+        # a vote that was saved
+        answered, counts = await asyncio.gather(
+            query.answer(),
+            # Stamped like the interaction, with the time the callback arrived
+            save_vote_async(
+                translation_id,
+                user_id,
+                score,
+                now=session.get("last_interaction_time"),
+            ),
+            return_exceptions=True,
+        )
+        if isinstance(counts, BaseException):
+            raise counts
+        if isinstance(answered, BaseException):
+            logger.warning(f"Failed to answer vote callback: {answered}")
 
-        threshold, threshold_message = check_threshold(user_id, type="vote")
+        threshold, threshold_message = check_threshold(counts, type="vote")
         if threshold:
             keyboard = [
                 [
@@ -167,8 +186,7 @@ async def handle_vote(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 query.message.message_id,
                 None,
             )
-            auto_vote = get_user_data(user_id, "auto_vote")
-            if auto_vote == "True":
+            if get_state(session) == VOTING:
                 await send_text2vote(update, context)
 
         return {"statusCode": 200, "body": json.dumps({"message": "Vote handled"})}
@@ -1,26 +1,29 @@
+import asyncio
 import json
 from datetime import datetime, timedelta
+from conversation import CONTRIBUTING, VOTING, PAUSED, get_state, set_state
 from db import (
-    get_user_data,
-    set_user_data,
-    is_user_exists,
-    get_untranslated_text,
-    get_unvoted_translation,
-    get_leaderboard_data,
-    get_total_users,
-    get_aggregated_counts,
+    get_user_session,
+    is_user_exists_async,
+    release_text_lease_async,
+    get_untranslated_text_async,
+    get_translation_for_vote_async,
+    get_leaderboard_data_async,
+    get_total_users_async,
+    get_global_daily_counts_async,
 )
-from utils import send_message, handle_command_error
+from utils import send_message, handle_command_error, with_user_session
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
 
+@with_user_session
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     username = update.effective_user.name
 
     try:
-        is_user_exists(user_id, username)
+        await is_user_exists_async(user_id, username)
         message = "🐬\nWelcome to the Echopod Companion!\n\nTo get started, please send:\n\n1. /contribute\n2. /vote"
         await send_message(context, user_id, message)
         return {
@@ -31,18 +34,19 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return await handle_command_error(update, context, e, "start")
 
 
+@with_user_session
 async def contribute_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    set_user_data(user_id, "contribute_mode", "True")
-    set_user_data(user_id, "auto_contribute", "True")
-    set_user_data(user_id, "paused", "False")
+    session = get_user_session(user_id)
+    await release_pending_text(session)
+    set_state(session, CONTRIBUTING)
 
     try:
-        result = get_untranslated_text()
+        result = await get_untranslated_text_async(user_id)
 
         if result:
             message = f"🐬\nဒီစာကို အဆင်ပြေသလို ဘာသာပြန်ပေးပါ\n\n-⚠️မြန်မာစကားပြောအရေးအသားနဲ့ပဲ ရေးပေးပါနော်⚠️-\n\n{result['text']}"
-            set_user_data(user_id, "contribute_text_id", result["text_id"])
+            session.set("contribute_text_id", result["text_id"])
         else:
             message = "No untranslated sentences available at the moment. Please try again later."
 
@@ -58,17 +62,27 @@ async def contribute_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return await handle_command_error(update, context, e, "contribute")
 
 
+async def release_pending_text(session):
+    # Give back a text that was handed out but never translated (skip, a new
+    # /contribute or /stop) so other contributors can pick it up right away
+    text_id = session.get("contribute_text_id")
+    if text_id and get_state(session) == CONTRIBUTING:
+        await release_text_lease_async(text_id, session.user_id)
+
+
+@with_user_session
 async def vote_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     try:
-        set_user_data(user_id, "auto_vote", "True")
-        set_user_data(user_id, "paused", "False")
+        session = get_user_session(user_id)
+        await release_pending_text(session)
+        set_state(session, VOTING)
 
         # Check if this is the first time the user is using the /vote command
-        saw_best_practices = get_user_data(user_id, "saw_best_practices")
+        saw_best_practices = session.get("saw_best_practices")
 
         if saw_best_practices != "True":
-            set_user_data(user_id, "saw_best_practices", "True")
+            session.set("saw_best_practices", "True")
 
             voting_rules = (
                 "🐬\nအမှတ်ပေးတဲ့အခါမှာ ဒီအချက်တွေကို သတိပြုပေးပါခင်ဗျာ-\n\n"
@@ -106,7 +120,7 @@ async def vote_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def send_text2vote(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     try:
-        result = get_unvoted_translation()
+        result = await get_translation_for_vote_async(user_id)
 
         if result:
             original_text = result["original_text"]
@@ -144,14 +158,16 @@ async def send_text2vote(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return await handle_command_error(update, context, e, "send_text2vote")
 
 
+@with_user_session
 async def simple_vote_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
 
     try:
-        set_user_data(user_id, "auto_vote", "True")
-        set_user_data(user_id, "paused", "False")
+        session = get_user_session(user_id)
+        await release_pending_text(session)
+        set_state(session, VOTING)
 
-        result = get_unvoted_translation()
+        result = await get_translation_for_vote_async(user_id)
 
         if result:
             original_text = result["original_text"]
@@ -193,7 +209,7 @@ async def simple_vote_command(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 async def leaderboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        leaderboard_data = get_leaderboard_data()
+        leaderboard_data = await get_leaderboard_data_async()
 
         if leaderboard_data:
             message = "🐬 Top 10 Users:\n\n"
@@ -218,12 +234,14 @@ async def leaderboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         return await handle_command_error(update, context, e, "leaderboard")
 
 
+@with_user_session
 async def stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
 
-    set_user_data(user_id, "auto_contribute", "False")
-    set_user_data(user_id, "auto_vote", "False")
-    set_user_data(user_id, "paused", "True")
+    session = get_user_session(user_id)
+    await release_pending_text(session)
+    set_state(session, PAUSED)
+    session.remove("reminder_bucket")
 
     try:
         message = "Please use /contribute or /vote to start again."
@@ -237,10 +255,10 @@ async def stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def project_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    total_users = get_total_users()
     today = datetime.now().strftime("%Y-%m-%d")
-
-    translation_count, vote_count = get_aggregated_counts(date=today, user_id=None)
+    total_users, (translation_count, vote_count) = await asyncio.gather(
+        get_total_users_async(), get_global_daily_counts_async(today)
+    )
 
     message = (
         f"Total number of users: {total_users}\n"
@@ -1,5 +1,105 @@
+import json
 import os
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 DYNAMODB_TABLE_PREFIX = os.getenv("DYNAMODB_TABLE_PREFIX")
-VOTING_SESSION_THRESHOLD = 3600
\ No newline at end of file
+VOTING_SESSION_THRESHOLD = 3600
+
+# Size of the HTTP connection pool the bot keeps open to the Telegram Bot API
+BOT_CONNECTION_POOL_SIZE = int(os.getenv("BOT_CONNECTION_POOL_SIZE", "8"))
+
+# Untranslated text sampling: draws per request, how long a warm container
+# keeps its copy of the untranslated-text bitmap before reloading the snapshot,
+# and text_ids read from the GSI when the draws miss
+UNTRANSLATED_SAMPLE_ATTEMPTS = int(os.getenv("UNTRANSLATED_SAMPLE_ATTEMPTS", "5"))
+UNTRANSLATED_INDEX_TTL = int(os.getenv("UNTRANSLATED_INDEX_TTL", "900"))
+UNTRANSLATED_QUERY_PAGE = int(os.getenv("UNTRANSLATED_QUERY_PAGE", "100"))
+
+# Vote scheduling: votes wanted per translation, number of partitions of the
+# vote queue index, and how many candidates/pages one /vote may read
+VOTE_TARGET = int(os.getenv("VOTE_TARGET", "3"))
+VOTE_QUEUE_SHARDS = int(os.getenv("VOTE_QUEUE_SHARDS", "10"))
+VOTE_CANDIDATES_PAGE_SIZE = int(os.getenv("VOTE_CANDIDATES_PAGE_SIZE", "25"))
+VOTE_SCHEDULER_MAX_PAGES = int(os.getenv("VOTE_SCHEDULER_MAX_PAGES", "3"))
+
+# How long a text handed out by /contribute stays reserved for that user
+CONTRIBUTION_LEASE_SECONDS = int(os.getenv("CONTRIBUTION_LEASE_SECONDS", "1800"))
+
+# Leaderboard snapshot: rows kept and how long a container reuses its copy
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "10"))
+LEADERBOARD_CACHE_TTL = int(os.getenv("LEADERBOARD_CACHE_TTL", "60"))
+
+# Parallel scan segments used by full-table jobs
+SCAN_SEGMENTS = int(os.getenv("SCAN_SEGMENTS", "4"))
+
+# Write shards behind each global counter (total users, per-day totals)
+COUNTER_SHARDS = int(os.getenv("COUNTER_SHARDS", "10"))
+
+# Days a daily_stats row is kept once it has been rolled up into its week
+# and month (0 keeps them forever; needs TTL enabled on expires_at). Keep it
+# above the longest per-user range asked for, whose edge days need the rows
+DAILY_STATS_RETENTION_DAYS = int(os.getenv("DAILY_STATS_RETENTION_DAYS", "0"))
+
+# DynamoDB HTTP connections kept per container, and the number of requests
+# the async layer runs in parallel on them
+DB_MAX_POOL_CONNECTIONS = int(os.getenv("DB_MAX_POOL_CONNECTIONS", "16"))
+
+# DynamoDB round trips one update may make before a warning is logged, counting
+# the update_id claim and done mark, with optional per-handler overrides as
+# JSON, e.g. {"handle_vote": 8}
+DB_ROUND_TRIP_BUDGET = int(os.getenv("DB_ROUND_TRIP_BUDGET", "10"))
+DB_ROUND_TRIP_BUDGETS = json.loads(os.getenv("DB_ROUND_TRIP_BUDGETS", "{}"))
+
+# CloudWatch namespace of the per-update metrics record
+METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "Echopod/Bot")
+
+# Broadcasts: messages per second across all chats (Telegram allows ~30),
+# parallel sends, seconds between messages to one chat, attempts per user,
+# seconds a pending claim on a user blocks a resumed run, and seconds the
+# per-user claims are kept in Meta (needs TTL enabled on expires_at)
+BROADCAST_RATE = int(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+BROADCAST_CHAT_INTERVAL = float(os.getenv("BROADCAST_CHAT_INTERVAL", "1.0"))
+BROADCAST_MAX_ATTEMPTS = int(os.getenv("BROADCAST_MAX_ATTEMPTS", "5"))
+BROADCAST_CLAIM_SECONDS = int(os.getenv("BROADCAST_CLAIM_SECONDS", "600"))
+BROADCAST_CLAIM_TTL = int(os.getenv("BROADCAST_CLAIM_TTL", str(30 * 86400)))
+
+# Reminders: width of a due-time bucket in the reminder index, buckets a first
+# tick looks back over, seconds between ticks of a long-running scheduler, the
+# interaction interval assumed for users without one yet, and the granularity
+# due times are rounded up to
+REMINDER_BUCKET_SECONDS = int(os.getenv("REMINDER_BUCKET_SECONDS", "3600"))
+REMINDER_LOOKBACK_BUCKETS = int(os.getenv("REMINDER_LOOKBACK_BUCKETS", "24"))
+REMINDER_TICK_SECONDS = int(os.getenv("REMINDER_TICK_SECONDS", "300"))
+REMINDER_DEFAULT_INTERVAL = int(os.getenv("REMINDER_DEFAULT_INTERVAL", "86400"))
+REMINDER_RESOLUTION_SECONDS = int(os.getenv("REMINDER_RESOLUTION_SECONDS", "900"))
+
+# Return the first reply of an update in the webhook response instead of a
+# separate Bot API request
+WEBHOOK_REPLY = os.getenv("WEBHOOK_REPLY", "False").lower() == "true"
+
+# Container-wide cache of immutable text and translation attributes: size
+# limit in bytes of UTF-8 text and seconds an entry is trusted
+TEXT_CACHE_MAX_BYTES = int(os.getenv("TEXT_CACHE_MAX_BYTES", "16777216"))
+TEXT_CACHE_TTL = int(os.getenv("TEXT_CACHE_TTL", "3600"))
+
+# Duplicate webhook deliveries: seconds an update_id is remembered in Meta
+# (needs TTL enabled on expires_at), seconds a delivery being processed
+# blocks retries (keep it above the Lambda timeout), and update_ids a
+# container remembers in memory
+UPDATE_DEDUP = os.getenv("UPDATE_DEDUP", "True").lower() == "true"
+UPDATE_DEDUP_TTL = int(os.getenv("UPDATE_DEDUP_TTL", "86400"))
+UPDATE_PROCESSING_SECONDS = int(os.getenv("UPDATE_PROCESSING_SECONDS", "120"))
+UPDATE_DEDUP_MEMORY = int(os.getenv("UPDATE_DEDUP_MEMORY", "10000"))
+
+# Long-running worker (worker.py): updates processed at once, updates taken
+# on before polling pauses or the webhook server answers 503, getUpdates long
+# poll seconds, seconds a shutdown waits for updates in progress, the address
+# the webhook server listens on and the secret token Telegram must send it
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "100"))
+WORKER_MAX_PENDING = int(os.getenv("WORKER_MAX_PENDING", "1000"))
+WORKER_POLL_TIMEOUT = int(os.getenv("WORKER_POLL_TIMEOUT", "30"))
+WORKER_DRAIN_SECONDS = int(os.getenv("WORKER_DRAIN_SECONDS", "30"))
+WORKER_HOST = os.getenv("WORKER_HOST", "0.0.0.0")
+WORKER_PORT = int(os.getenv("WORKER_PORT", "8080"))
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN")
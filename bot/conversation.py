@@ -0,0 +1,33 @@
+# Conversation states, kept in the User item's ``state`` attribute:
+# IDLE       no mode chosen yet, or resting after a contribution milestone
+# CONTRIBUTING  a text was handed out and the next message translates it
+# VOTING     each vote is followed by the next translation to vote on
+# PAUSED     stopped with /stop; no follow-ups and no reminders
+IDLE = "idle"
+CONTRIBUTING = "contributing"
+VOTING = "voting"
+PAUSED = "paused"
+
+# String flags the state replaced. Items written before it are read through
+# them, and they are removed on the item's next transition.
+LEGACY_FLAGS = ("contribute_mode", "auto_contribute", "auto_vote", "paused")
+
+
+def get_state(session):
+    state = session.get("state")
+    if state is not None:
+        return state
+    if session.get("paused") == "True":
+        return PAUSED
+    if session.get("contribute_mode") == "True":
+        return CONTRIBUTING
+    if session.get("auto_vote") == "True":
+        return VOTING
+    return IDLE
+
+
+def set_state(session, state):
+    session.set("state", state)
+    for flag in LEGACY_FLAGS:
+        if session.get(flag) is not None:
+            session.remove(flag)
@@ -1,89 +1,706 @@
+import asyncio
 import boto3
+import contextvars
+import functools
+import heapq
 import logging
+import queue
 import random
+import threading
+import time
+import uuid
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from boto3.dynamodb.conditions import Key, Attr
-from config import DYNAMODB_TABLE_PREFIX
-from datetime import datetime
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from bitmap import RoaringBitmap
+from cache import LRUCache, MISSING
+from config import (
+    DYNAMODB_TABLE_PREFIX,
+    UNTRANSLATED_INDEX_TTL,
+    UNTRANSLATED_QUERY_PAGE,
+    UNTRANSLATED_SAMPLE_ATTEMPTS,
+    VOTE_TARGET,
+    VOTE_QUEUE_SHARDS,
+    VOTE_CANDIDATES_PAGE_SIZE,
+    VOTE_SCHEDULER_MAX_PAGES,
+    CONTRIBUTION_LEASE_SECONDS,
+    LEADERBOARD_SIZE,
+    LEADERBOARD_CACHE_TTL,
+    SCAN_SEGMENTS,
+    COUNTER_SHARDS,
+    DAILY_STATS_RETENTION_DAYS,
+    DB_MAX_POOL_CONNECTIONS,
+    REMINDER_BUCKET_SECONDS,
+    REMINDER_LOOKBACK_BUCKETS,
+    REMINDER_DEFAULT_INTERVAL,
+    REMINDER_RESOLUTION_SECONDS,
+    TEXT_CACHE_MAX_BYTES,
+    TEXT_CACHE_TTL,
+    UPDATE_DEDUP_TTL,
+    UPDATE_PROCESSING_SECONDS,
+    BROADCAST_CLAIM_SECONDS,
+    BROADCAST_CLAIM_TTL,
+)
+from datetime import date, datetime, timedelta
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-dynamodb = boto3.resource("dynamodb", region_name="us-east-2")
-user_table = dynamodb.Table(f"{DYNAMODB_TABLE_PREFIX}_User")
-original_text_table = dynamodb.Table(f"{DYNAMODB_TABLE_PREFIX}_OriginalText")
-translation_table = dynamodb.Table(f"{DYNAMODB_TABLE_PREFIX}_Translation")
-score_table = dynamodb.Table(f"{DYNAMODB_TABLE_PREFIX}_Score")
-daily_stats_table = dynamodb.Table(f"daily_stats")
+
+def bind_dynamodb(resource):
+    """Point the module at a DynamoDB resource, e.g. a local stand-in.
+
+    Container caches are dropped as they describe the previous tables.
+    """
+    global dynamodb, user_table, original_text_table, translation_table
+    global score_table, daily_stats_table, meta_table
+    global _untranslated_index, _untranslated_index_loaded_at, _translated_since_load
+    global _leaderboard_cache
+    dynamodb = resource
+    user_table = dynamodb.Table(f"{DYNAMODB_TABLE_PREFIX}_User")
+    original_text_table = dynamodb.Table(f"{DYNAMODB_TABLE_PREFIX}_OriginalText")
+    translation_table = dynamodb.Table(f"{DYNAMODB_TABLE_PREFIX}_Translation")
+    score_table = dynamodb.Table(f"{DYNAMODB_TABLE_PREFIX}_Score")
+    daily_stats_table = dynamodb.Table(f"daily_stats")
+    meta_table = dynamodb.Table(f"{DYNAMODB_TABLE_PREFIX}_Meta")
+    with _untranslated_lock:
+        _untranslated_index, _untranslated_index_loaded_at = None, 0
+        _translated_since_load = {}
+    _leaderboard_cache = (None, 0)
+    text_cache.clear()
+
+
+# Immutable attributes of texts and translations, shared by every update a
+# container serves. Mutable ones (translated, leases, votes) are not cached.
+text_cache = LRUCache(TEXT_CACHE_MAX_BYTES, TEXT_CACHE_TTL)
+ORIGINAL_TEXT_FIELDS = ("text_id", "lang", "text")
+TRANSLATION_FIELDS = (
+    "translation_id",
+    "original_text_id",
+    "original_text",
+    "lang",
+    "text",
+    "user_id",
+)
+
+# Guards the untranslated index below, which bind_dynamodb resets
+_untranslated_lock = threading.Lock()
+
+bind_dynamodb(
+    boto3.resource(
+        "dynamodb",
+        region_name="us-east-2",
+        config=Config(max_pool_connections=DB_MAX_POOL_CONNECTIONS),
+    )
+)
+
+UNTRANSLATED_INDEX_KEY = "untranslated_index"
+LEADERBOARD_KEY = "leaderboard"
+USERS_COUNTER_KEY = "counter#users"
+DAILY_COUNTER_KEY = "counter#daily#{date}"
+ROLLUP_WATERMARK_KEY = "daily_stats_rollup"
+GLOBAL_STATS_USER = "*"
+TEXT_ID_COUNTER_KEY = "counter#text_id"
+REMINDER_WATERMARK_KEY = "reminder_tick"
+EXPORT_WATERMARK_KEY = "dataset_export"
+SCORE_AGGREGATES_WATERMARK_KEY = "score_aggregates"
+CHANGED_TRANSLATIONS_INDEX = "updated_day-updated_at-index"
+QUALITY_INDEX = "quality_band-mean_score-index"
+
+# Quality bands by mean score, best first: (band, lowest mean in the band)
+QUALITY_BANDS = [("high", Decimal("3.5")), ("mid", Decimal("2.5")), ("low", 0)]
+SCORE_BUCKETS = range(1, 6)
+
+# Seconds refresh_score_aggregates stays behind now, so votes stamped with
+# their receive time but still being written are not skipped
+SCORE_REFRESH_LAG_SECONDS = 60
+REMINDER_INDEX = "reminder_bucket-next_reminder_at-index"
+
+
+class DbMetrics:
+    """DynamoDB calls, latency and consumed capacity of one update."""
+
+    READ_OPERATIONS = {"batch_get_item", "get_item", "query", "scan"}
+
+    def __init__(self):
+        self.handler = None
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.latency_ms = 0.0
+        self.read_units = 0.0
+        self.write_units = 0.0
+        self.operations = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation, target, latency_ms, response=None, error=None):
+        if error is not None:
+            response = error.response
+        response = response or {}
+        capacity = response.get("ConsumedCapacity") or []
+        if isinstance(capacity, dict):
+            capacity = [capacity]
+        units = sum(float(c.get("CapacityUnits", 0)) for c in capacity)
+        retries = response.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+
+        with self._lock:
+            self.calls += 1
+            self.errors += error is not None
+            self.retries += retries
+            self.latency_ms += latency_ms
+            if operation in self.READ_OPERATIONS:
+                self.read_units += units
+            else:
+                self.write_units += units
+            stats = self.operations.setdefault(
+                f"{operation}:{target}", {"calls": 0, "ms": 0.0, "units": 0.0}
+            )
+            stats["calls"] += 1
+            stats["ms"] += latency_ms
+            stats["units"] += units
+
+
+_db_metrics = contextvars.ContextVar("db_metrics", default=None)
+
+
+def start_db_metrics():
+    """Account every DynamoDB call made from the current context from now on."""
+    metrics = DbMetrics()
+    _db_metrics.set(metrics)
+    return metrics
+
+
+def current_db_metrics():
+    return _db_metrics.get()
+
+
+def _query_target(table, kwargs):
+    if table is not None:
+        target = table.name
+    elif "RequestItems" in kwargs:
+        target = "+".join(sorted(kwargs["RequestItems"]))
+    else:
+        target = "+".join(
+            sorted(
+                {p["TableName"] for i in kwargs["TransactItems"] for p in i.values()}
+            )
+        )
+    if kwargs.get("IndexName"):
+        target += f"/{kwargs['IndexName']}"
+    return target
 
 
 def execute_db_query(operation, **kwargs):
-    table = kwargs.pop("table")
+    table = kwargs.pop("table", None)
+    metrics = _db_metrics.get()
+    if metrics is not None:
+        kwargs.setdefault("ReturnConsumedCapacity", "TOTAL")
+    started = time.perf_counter()
+    response = error = None
     try:
-        if operation == "get_item":
-            return table.get_item(**kwargs)
+        if operation == "batch_get_item":
+            response = dynamodb.batch_get_item(**kwargs)
+        elif operation == "batch_write_item":
+            response = dynamodb.batch_write_item(**kwargs)
+        elif operation == "transact_write_items":
+            response = dynamodb.meta.client.transact_write_items(**kwargs)
+        elif operation == "get_item":
+            response = table.get_item(**kwargs)
         elif operation == "put_item":
-            return table.put_item(**kwargs)
+            response = table.put_item(**kwargs)
         elif operation == "update_item":
-            return table.update_item(**kwargs)
+            response = table.update_item(**kwargs)
+        elif operation == "delete_item":
+            response = table.delete_item(**kwargs)
         elif operation == "query":
-            return table.query(**kwargs)
+            response = table.query(**kwargs)
         elif operation == "scan":
-            return table.scan(**kwargs)
+            response = table.scan(**kwargs)
         else:
             raise ValueError(f"Unsupported operation: {operation}")
+        return response
     except ClientError as e:
-        logger.exception(f"Failed to execute {operation}")
+        error = e
+        # Failed conditions are expected outcomes that callers handle
+        if not is_condition_failure(e):
+            logger.exception(f"Failed to execute {operation}")
         raise e
+    finally:
+        if metrics is not None:
+            metrics.record(
+                operation,
+                _query_target(table, kwargs),
+                (time.perf_counter() - started) * 1000,
+                response,
+                error,
+            )
+
+
+# boto3 has no asyncio transport, so the async layer runs calls on a pool of
+# threads sharing the resource's keep-alive connection pool, one per connection
+_db_executor = ThreadPoolExecutor(
+    max_workers=DB_MAX_POOL_CONNECTIONS, thread_name_prefix="dynamodb"
+)
+
+
+async def run_db(func, *args, **kwargs):
+    """Run a blocking db call without blocking the event loop.
+
+    This is not native asyncio: the boto3 call still blocks, on one of the
+    DB_MAX_POOL_CONNECTIONS threads of the db executor, so that pool size
+    caps how many DB calls run at once across all handlers. The caller's
+    context is copied, so the call sees the current update's user session.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        _db_executor, functools.partial(context.run, func, *args, **kwargs)
+    )
+
+
+async def execute_db_query_async(operation, **kwargs):
+    return await run_db(execute_db_query, operation, **kwargs)
+
+
+def async_variant(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_db(func, *args, **kwargs)
+
+    wrapper.__name__ = wrapper.__qualname__ = f"{func.__name__}_async"
+    return wrapper
+
+
+# Namespace for ClientRequestTokens; a token is derived from what is being
+# written, so a retried webhook replays the same transaction idempotently
+IDEMPOTENCY_NAMESPACE = uuid.UUID("7d0c6a3e-4f8b-4c59-9d53-1f6a1e0b2c4d")
+
+
+def idempotency_token(*parts):
+    return str(uuid.uuid5(IDEMPOTENCY_NAMESPACE, ":".join(map(str, parts))))
+
+
+def transact_write(items, token=None):
+    """Commit ``items`` atomically with one TransactWriteItems call.
+
+    Each entry is ``{"Put" | "Update" | "Delete" | "ConditionCheck": params}``
+    where ``params`` uses the same arguments as ``execute_db_query``. The
+    resource's client serializes plain Python values like the Table API does.
+    """
+    transact_items = []
+    for entry in items:
+        ((action, params),) = entry.items()
+        params = dict(params)
+        params["TableName"] = params.pop("table").name
+        transact_items.append({action: params})
+
+    kwargs = {"TransactItems": transact_items}
+    if token:
+        kwargs["ClientRequestToken"] = token
+    return execute_db_query(operation="transact_write_items", **kwargs)
+
+
+def is_condition_failure(error):
+    """True if ``error`` is a failed condition, alone or inside a transaction."""
+    code = error.response["Error"]["Code"]
+    if code == "ConditionalCheckFailedException":
+        return True
+    if code == "TransactionCanceledException":
+        return any(
+            reason.get("Code") == "ConditionalCheckFailed"
+            for reason in error.response.get("CancellationReasons", [])
+        )
+    return False
+
+
+class ScanStats:
+    """Totals reported by :func:`scan_items` once the scan is consumed."""
+
+    def __init__(self):
+        self.pages = 0
+        self.count = 0
+        self.scanned_count = 0
+        self.consumed_capacity = 0.0
+        self._lock = threading.Lock()
+
+    def add_page(self, response):
+        with self._lock:
+            self.pages += 1
+            self.count += response.get("Count", 0)
+            self.scanned_count += response.get("ScannedCount", 0)
+            capacity = response.get("ConsumedCapacity") or {}
+            self.consumed_capacity += float(capacity.get("CapacityUnits", 0))
+
+    def __repr__(self):
+        return (
+            f"ScanStats(pages={self.pages}, count={self.count}, "
+            f"scanned_count={self.scanned_count}, "
+            f"consumed_capacity={self.consumed_capacity})"
+        )
+
+
+_SCAN_DONE = object()
+
+
+def scan_items(table, segments=1, projection=None, stats=None, **scan_kwargs):
+    """Yield every item of ``table``, following LastEvaluatedKey.
+
+    With ``segments`` > 1 the table is read as a DynamoDB parallel scan, one
+    worker thread per segment. Pages are handed over through a bounded queue,
+    so memory stays at a few pages however large the table is. ``projection``
+    is a list of attribute names, and consumed capacity, page and item counts
+    are accumulated into ``stats`` (a :class:`ScanStats`) when given.
+    """
+    if projection:
+        names = {f"#p{i}": name for i, name in enumerate(projection)}
+        scan_kwargs["ProjectionExpression"] = ", ".join(names)
+        scan_kwargs["ExpressionAttributeNames"] = {
+            **scan_kwargs.get("ExpressionAttributeNames", {}),
+            **names,
+        }
+    scan_kwargs["ReturnConsumedCapacity"] = "TOTAL"
+    stats = stats if stats is not None else ScanStats()
+
+    def pages(segment, stop=None):
+        kwargs = dict(scan_kwargs)
+        if segments > 1:
+            kwargs.update(Segment=segment, TotalSegments=segments)
+        while stop is None or not stop.is_set():
+            response = execute_db_query(operation="scan", table=table, **kwargs)
+            stats.add_page(response)
+            yield response.get("Items", [])
+            if "LastEvaluatedKey" not in response:
+                return
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    if segments <= 1:
+        for items in pages(0):
+            yield from items
+        return
+
+    pending = queue.Queue(maxsize=segments * 2)
+    stop = threading.Event()
+
+    def put(value):
+        while not stop.is_set():
+            try:
+                pending.put(value, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def worker(segment):
+        try:
+            for items in pages(segment, stop):
+                put(items)
+        except Exception as e:
+            put(e)
+        finally:
+            put(_SCAN_DONE)
+
+    with ThreadPoolExecutor(max_workers=segments) as executor:
+        for segment in range(segments):
+            # Each segment gets the caller's context, so its pages are
+            # counted in the current DbMetrics
+            executor.submit(contextvars.copy_context().run, worker, segment)
+        try:
+            remaining = segments
+            while remaining:
+                value = pending.get()
+                if value is _SCAN_DONE:
+                    remaining -= 1
+                elif isinstance(value, Exception):
+                    raise value
+                else:
+                    yield from value
+        finally:
+            stop.set()
+
+
+def query_items(table, **query_kwargs):
+    """Yield every item matched by a query, following LastEvaluatedKey."""
+    while True:
+        response = execute_db_query(operation="query", table=table, **query_kwargs)
+        yield from response.get("Items", [])
+        if "LastEvaluatedKey" not in response:
+            return
+        query_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+_REMOVED = object()
+
+
+class UserSession:
+    """Request-scoped view of a single ``User`` item.
+
+    The item is loaded with one ``get_item`` on first access, reads are served
+    from memory and changed attributes are written back with one
+    ``update_item`` when :meth:`flush` is called.
+    """
+
+    def __init__(self, user_id, autoflush=False):
+        self.user_id = str(user_id)
+        self.autoflush = autoflush
+        self._item = None
+        self._dirty = {}
+        # Set once a load or touch found no item; the write that creates it
+        # also bumps the users counter
+        self._missing = False
+
+    @property
+    def item(self):
+        if self._item is None:
+            self.load()
+        return self._item
+
+    @property
+    def exists(self):
+        return bool(self.item)
+
+    def load(self):
+        try:
+            response = execute_db_query(
+                operation="get_item",
+                Key={"user_id": self.user_id},
+                table=user_table,
+            )
+            self._item = response.get("Item", {})
+            self._missing = not self._item
+        except ClientError as e:
+            logger.exception("Failed to load user session")
+            raise e
+        return self._item
+
+    async def load_async(self):
+        return await run_db(self.load)
+
+    def touch(self, **values):
+        """Set ``values`` and load the item with one conditional ``update_item``.
+
+        Stands in for :meth:`load` on the first access of an update and
+        returns the item as it was before the write, for callers that derive
+        something from the previous values. A user without an item loads as
+        empty and the values are written by the next :meth:`flush`.
+        """
+        if self._item is not None:
+            previous = dict(self._item)
+            self.update(**values)
+            return previous
+        names = {f"#k{i}": key for i, key in enumerate(values)}
+        try:
+            response = execute_db_query(
+                operation="update_item",
+                Key={"user_id": self.user_id},
+                UpdateExpression="SET "
+                + ", ".join(f"#k{i} = :v{i}" for i in range(len(values))),
+                ConditionExpression="attribute_exists(user_id)",
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues={
+                    f":v{i}": value for i, value in enumerate(values.values())
+                },
+                ReturnValues="ALL_OLD",
+                table=user_table,
+            )
+        except ClientError as e:
+            if not is_condition_failure(e):
+                logger.exception("Failed to touch user session")
+                raise e
+            self._item = {}
+            self._missing = True
+            self.update(**values)
+            return {}
+        previous = response.get("Attributes", {})
+        self._item = {**previous, **values}
+        return previous
+
+    async def touch_async(self, **values):
+        return await run_db(self.touch, **values)
+
+    def get(self, key, default=None):
+        return self.item.get(key, default)
+
+    def set(self, key, value):
+        if self._item is not None and key not in self._dirty:
+            if key in self._item and self._item[key] == value:
+                return
+        if self._item is not None:
+            self._item[key] = value
+        self._dirty[key] = value
+        if self.autoflush:
+            self.flush()
+
+    def remove(self, key):
+        if self._item is not None:
+            self._item.pop(key, None)
+        self._dirty[key] = _REMOVED
+        if self.autoflush:
+            self.flush()
+
+    def update(self, **values):
+        autoflush, self.autoflush = self.autoflush, False
+        try:
+            for key, value in values.items():
+                self.set(key, value)
+        finally:
+            self.autoflush = autoflush
+        if self.autoflush:
+            self.flush()
+
+    @property
+    def dirty(self):
+        return dict(self._dirty)
+
+    def flush(self):
+        if not self._dirty:
+            return
+        names = {}
+        values = {}
+        assignments = []
+        removals = []
+        for i, (key, value) in enumerate(self._dirty.items()):
+            names[f"#k{i}"] = key
+            if value is _REMOVED:
+                removals.append(f"#k{i}")
+                continue
+            values[f":v{i}"] = value
+            assignments.append(f"#k{i} = :v{i}")
+        clauses = []
+        if assignments:
+            clauses.append("SET " + ", ".join(assignments))
+        if removals:
+            clauses.append("REMOVE " + ", ".join(removals))
+        update = {
+            "table": user_table,
+            "Key": {"user_id": self.user_id},
+            "UpdateExpression": " ".join(clauses),
+            "ExpressionAttributeNames": names,
+        }
+        if values:
+            update["ExpressionAttributeValues"] = values
+        try:
+            if self._missing:
+                self._create(update)
+            else:
+                execute_db_query(operation="update_item", **update)
+            self._dirty.clear()
+        except ClientError as e:
+            logger.exception("Failed to flush user session")
+            raise e
+
+    def _create(self, update):
+        try:
+            transact_write(
+                [
+                    {
+                        "Update": {
+                            **update,
+                            "ConditionExpression": "attribute_not_exists(user_id)",
+                        }
+                    },
+                    global_counter_update(
+                        USERS_COUNTER_KEY, self.user_id, "users_count"
+                    ),
+                ]
+            )
+        except ClientError as e:
+            if not is_condition_failure(e):
+                raise e
+            # A concurrent request created and counted the user
+            execute_db_query(operation="update_item", **update)
+        self._missing = False
+
+    async def flush_async(self):
+        return await run_db(self.flush)
+
+
+_user_session = contextvars.ContextVar("user_session", default=None)
+
+
+def get_user_session(user_id):
+    """Return the session bound to the current update for ``user_id``.
+
+    Outside of :func:`user_session` a write-through session is returned so
+    callers without a request scope (jobs, scripts) keep working.
+    """
+    session = _user_session.get()
+    if session is not None and session.user_id == str(user_id):
+        return session
+    return UserSession(user_id, autoflush=True)
+
+
+class user_session:
+    """Bind a :class:`UserSession` to the current update and flush it on exit.
+
+    Nested scopes for the same user reuse the outer session, so handlers that
+    call other handlers still read the item once and write it once.
+    """
+
+    def __init__(self, user_id, load=True):
+        self.user_id = str(user_id)
+        self.load = load
+        self.session = None
+        self._token = None
+
+    def __enter__(self):
+        current = _user_session.get()
+        if current is not None and current.user_id == self.user_id:
+            self.session = current
+        else:
+            self.session = UserSession(self.user_id)
+            self._token = _user_session.set(self.session)
+        return self.session
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._token is None:
+            return False
+        _user_session.reset(self._token)
+        self._token = None
+        self.session.flush()
+        return False
+
+    async def __aenter__(self):
+        session = self.__enter__()
+        # Without ``load`` the caller loads it, e.g. with UserSession.touch
+        if self.load and session._item is None:
+            await session.load_async()
+        return session
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._token is None:
+            return False
+        _user_session.reset(self._token)
+        self._token = None
+        await self.session.flush_async()
+        return False
 
 
 def get_user_data(user_id, key):
     try:
-        response = execute_db_query(
-            operation="get_item",
-            Key={"user_id": str(user_id)},
-            table=user_table,
-        )
-        return response.get("Item", {}).get(key)
+        return get_user_session(user_id).get(key)
     except ClientError as e:
         logger.exception("Failed to get user data")
         return None
 
 
 def set_user_data(user_id, key, value):
-    try:
-        execute_db_query(
-            operation="update_item",
-            Key={"user_id": str(user_id)},
-            UpdateExpression=f"SET {key} = :value",
-            ExpressionAttributeValues={":value": value},
-            table=user_table,
-        )
-    except ClientError as e:
-        logger.exception("Failed to set user data")
-        raise e
+    get_user_session(user_id).set(key, value)
 
 
 def is_user_exists(user_id, username):
+    session = get_user_session(user_id)
     try:
-        response = execute_db_query(
-            operation="get_item",
-            Key={"user_id": str(user_id)},
-            table=user_table,
-        )
-        if "Item" not in response:
+        if not session.exists:
             add_new_user(user_id, username)
+            session.item.update({"user_id": str(user_id), "username": username})
+            session._missing = False
         else:
             # Check if the username has changed and update it if necessary
-            current_username = response["Item"].get("username", "").lstrip("@")
+            current_username = session.get("username", "").lstrip("@")
             if current_username != username.lstrip("@"):
-                execute_db_query(
-                    operation="update_item",
-                    Key={"user_id": str(user_id)},
-                    UpdateExpression="SET username = :username",
-                    ExpressionAttributeValues={":username": username},
-                    table=user_table,
-                )
+                session.set("username", username)
     except ClientError as e:
         logger.exception("Failed to check user existence")
         raise e
@@ -91,15 +708,26 @@ def is_user_exists(user_id, username):
 
 def add_new_user(user_id, username):
     try:
-        execute_db_query(
-            operation="put_item",
-            Item={
-                "user_id": str(user_id),
-                "username": username,
-            },
-            table=user_table,
+        transact_write(
+            [
+                {
+                    "Put": {
+                        "table": user_table,
+                        "Item": {
+                            "user_id": str(user_id),
+                            "username": username,
+                        },
+                        "ConditionExpression": "attribute_not_exists(user_id)",
+                    }
+                },
+                global_counter_update(USERS_COUNTER_KEY, user_id, "users_count"),
+            ],
+            token=idempotency_token("user", user_id),
         )
     except ClientError as e:
+        if is_condition_failure(e):
+            # A concurrent /start already created and counted this user
+            return
         logger.exception("Failed to add new user")
         raise e
 
@@ -118,249 +746,1778 @@ def get_user_details(user_id):
         raise e
 
 
+def _immutable(item, fields):
+    return {field: item[field] for field in fields if field in item}
+
+
+def cache_original_text(item):
+    text = _immutable(item, ORIGINAL_TEXT_FIELDS)
+    text_cache.set(("text", int(item["text_id"])), text)
+    return text
+
+
 def get_original_text_by_id(text_id):
+    """Return the immutable attributes of an OriginalText item, cached."""
+    text = text_cache.get(("text", int(text_id)))
+    if text is not MISSING:
+        return text
     try:
         response = execute_db_query(
             operation="get_item",
             Key={"text_id": int(text_id)},
             table=original_text_table,
         )
-        return response.get("Item")
+        item = response.get("Item")
+        return cache_original_text(item) if item else None
     except ClientError as e:
         logger.exception("Failed to get original text by ID")
         raise e
 
 
 def get_translation_by_id(translation_id):
+    """Return the immutable attributes of a Translation item, cached."""
+    key = ("translation", int(translation_id))
+    translation = text_cache.get(key)
+    if translation is not MISSING:
+        return translation
     try:
         response = execute_db_query(
             operation="get_item",
             Key={"translation_id": int(translation_id)},
             table=translation_table,
         )
-        return response.get("Item")
+        item = response.get("Item")
+        if not item:
+            return None
+        translation = _immutable(item, TRANSLATION_FIELDS)
+        text_cache.set(key, translation)
+        return translation
     except ClientError as e:
         logger.exception("Failed to get translation by ID")
         raise e
 
 
-def get_untranslated_text():
-    try:
-        while True:
-            # Generate a random number between 0 and a large value (e.g., 400000)
-            random_index = random.randint(0, 400000)
-
-            # Query the original_text_table using the translated-index to get a random untranslated text
-            response = execute_db_query(
-                operation="query",
-                table=original_text_table,
-                IndexName="translated-text_id-index",
-                KeyConditionExpression=Key("translated").eq("False"),
-                Limit=1,
-                ExclusiveStartKey={"translated": "False", "text_id": random_index},
-            )
-
-            if response["Items"]:
-                return response["Items"][0]
-            else:
-                # If no matching item is found, retry with a new random number
-                continue
-    except ClientError as e:
-        logger.exception("Failed to get untranslated text")
-        raise e
+# Bitmap of untranslated text_ids, cached across warm invocations. The snapshot
+# lives in one Meta item (a dense 400k-text corpus compresses to ~50 KB) and
+# texts translated since it was loaded are dropped locally. A worker runs
+# handlers concurrently on the DB threads, so the bitmap and
+# _translated_since_load are only touched under _untranslated_lock.
+_untranslated_index = None
+_untranslated_index_loaded_at = 0
+_translated_since_load = {}
 
 
-def get_unvoted_translation():
+def rebuild_untranslated_index():
+    index = RoaringBitmap()
+    built_at = int(time.time())
     try:
+        query_kwargs = {
+            "IndexName": "translated-text_id-index",
+            "KeyConditionExpression": Key("translated").eq("False"),
+            "ProjectionExpression": "text_id",
+        }
         while True:
-            # Generate a random number between 0 and a large value (e.g., 1000000)
-            random_index = random.randint(0, 1000000)
-
-            # Query the translation_table using the voted-index to get a random unvoted translation
             response = execute_db_query(
-                operation="query",
-                table=translation_table,
-                IndexName="voted-translation_id-index",
-                KeyConditionExpression=Key("voted").eq("False"),
-                Limit=1,
-                ExclusiveStartKey={"voted": "False", "translation_id": random_index},
+                operation="query", table=original_text_table, **query_kwargs
             )
+            for item in response["Items"]:
+                index.add(int(item["text_id"]))
+            if "LastEvaluatedKey" not in response:
+                break
+            query_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
 
-            if response["Items"]:
-                return response["Items"][0] if response["Items"] else None
-            else:
-                continue
+        execute_db_query(
+            operation="put_item",
+            Item={
+                "meta_key": UNTRANSLATED_INDEX_KEY,
+                "bitmap": index.serialize(),
+                "size": len(index),
+                "built_at": built_at,
+            },
+            table=meta_table,
+        )
     except ClientError as e:
-        logger.exception("Failed to get unvoted translation")
+        logger.exception("Failed to rebuild untranslated index")
         raise e
 
+    size = len(index)
+    _set_untranslated_index(index, built_at=built_at)
+    logger.info(f"Rebuilt untranslated index with {size} texts")
+    return index
+
+
+def get_untranslated_index():
+    with _untranslated_lock:
+        if (
+            _untranslated_index is not None
+            and time.time() - _untranslated_index_loaded_at < UNTRANSLATED_INDEX_TTL
+        ):
+            return _untranslated_index
 
-def get_original_text(text_id):
     try:
         response = execute_db_query(
             operation="get_item",
-            Key={"text_id": int(text_id)},
-            table=original_text_table,
+            Key={"meta_key": UNTRANSLATED_INDEX_KEY},
+            table=meta_table,
         )
-        item = response.get("Item")
-        if item:
-            return item["text"]
-        else:
-            return None
     except ClientError as e:
-        logger.exception("Failed to get original text")
+        logger.exception("Failed to load untranslated index")
         raise e
 
+    item = response.get("Item")
+    if not item:
+        # Only the rebuild_untranslated_index job builds the snapshot; until
+        # it has, every draw falls back to querying the GSI
+        index = RoaringBitmap()
+        _set_untranslated_index(index, built_at=0)
+        return index
+
+    index = RoaringBitmap.deserialize(item["bitmap"].value)
+    _set_untranslated_index(index, built_at=int(item["built_at"]))
+    return index
+
+
+def _set_untranslated_index(index, built_at):
+    global _untranslated_index, _untranslated_index_loaded_at
+    with _untranslated_lock:
+        # Re-apply texts this container saw translated after the snapshot
+        # was built
+        for text_id, translated_at in list(_translated_since_load.items()):
+            if translated_at < built_at:
+                del _translated_since_load[text_id]
+            else:
+                index.discard(text_id)
+        _untranslated_index = index
+        _untranslated_index_loaded_at = time.time()
+
+
+def sample_untranslated_text():
+    """A random text_id from the untranslated index, or None if it is empty."""
+    index = get_untranslated_index()
+    with _untranslated_lock:
+        return index.sample()
+
+
+def mark_text_translated(text_id):
+    with _untranslated_lock:
+        _translated_since_load[int(text_id)] = time.time()
+        if _untranslated_index is not None:
+            _untranslated_index.discard(int(text_id))
+
+
+def mark_text_untranslated(text_id):
+    with _untranslated_lock:
+        _translated_since_load.pop(int(text_id), None)
+        if _untranslated_index is not None:
+            _untranslated_index.add(int(text_id))
+
 
-def save_contribution(text_id, user_id, lang, text, original_text):
+# Lease events since the last pop_lease_metrics() call
+lease_metrics = Counter()
+_lease_metrics_lock = threading.Lock()
+
+
+def count_lease_event(event):
+    with _lease_metrics_lock:
+        lease_metrics[event] += 1
+
+
+def pop_lease_metrics():
+    with _lease_metrics_lock:
+        metrics = dict(lease_metrics)
+        lease_metrics.clear()
+    return metrics
+
+
+def acquire_text_lease(text_id, user_id):
+    """Reserve an untranslated text for ``user_id``.
+
+    The conditional write succeeds only while the text is untranslated and
+    its lease is free, expired or already held by the same user. Returns the
+    OriginalText item, or None if somebody else holds or finished it.
+    """
+    now = int(time.time())
     try:
-        execute_db_query(
-            operation="put_item",
-            Item={
-                "translation_id": int(f"{text_id}{user_id}"),
-                "voted": "False",
-                "lang": lang,
-                "original_text": original_text,
-                "original_text_id": str(text_id),
-                "text": text,
-                "user_id": str(user_id),
-            },
-            ConditionExpression="attribute_not_exists(translation_id)",
-            table=translation_table,
-        )
-        execute_db_query(
+        response = execute_db_query(
             operation="update_item",
             Key={"text_id": int(text_id)},
-            UpdateExpression="SET translated = :translated",
-            ExpressionAttributeValues={":translated": "True"},
+            UpdateExpression="SET lease_owner = :owner, lease_expires_at = :expires",
+            ConditionExpression="translated = :false AND ("
+            "attribute_not_exists(lease_expires_at) "
+            "OR lease_expires_at < :now OR lease_owner = :owner)",
+            ExpressionAttributeValues={
+                ":owner": str(user_id),
+                ":expires": now + CONTRIBUTION_LEASE_SECONDS,
+                ":now": now,
+                ":false": "False",
+            },
+            ReturnValues="ALL_OLD",
             table=original_text_table,
         )
-        update_daily_stats(user_id, "translation")
     except ClientError as e:
         if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
-            logger.warning(f"Contribution already exists for text_id: {text_id}")
-        else:
-            logger.exception("Failed to save contribution")
+            count_lease_event("contended")
+            return None
+        logger.exception("Failed to acquire text lease")
         raise e
 
+    item = response.get("Attributes")
+    if not item:
+        return None
+    previous_owner = item.get("lease_owner")
+    if previous_owner and previous_owner != str(user_id):
+        count_lease_event("reclaimed")
+    count_lease_event("acquired")
+    # The follow-up contribution reads the text back through the cache
+    cache_original_text(item)
+    item["lease_owner"] = str(user_id)
+    item["lease_expires_at"] = now + CONTRIBUTION_LEASE_SECONDS
+    return item
 
-def save_vote(translation_id, user_id, score):
-    try:
-        execute_db_query(
-            operation="put_item",
-            Item={
-                "score_id": int(f"{translation_id}{user_id}"),
-                "score_value": int(score),
-                "translation_id": str(translation_id),
-                "user_id": str(user_id),
-            },
-            ConditionExpression="attribute_not_exists(score_id)",
-            table=score_table,
-        )
 
+def release_text_lease(text_id, user_id):
+    try:
         execute_db_query(
             operation="update_item",
-            Key={"translation_id": int(translation_id)},
-            UpdateExpression="SET voted = :voted",
-            ExpressionAttributeValues={":voted": "True"},
-            table=translation_table,
+            Key={"text_id": int(text_id)},
+            UpdateExpression="REMOVE lease_owner, lease_expires_at",
+            ConditionExpression="lease_owner = :owner",
+            ExpressionAttributeValues={":owner": str(user_id)},
+            table=original_text_table,
         )
-        update_daily_stats(user_id, "vote")
+        count_lease_event("released")
+        mark_text_untranslated(text_id)
     except ClientError as e:
-        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
-            logger.warning(
-                f"Vote already exists for translation_id: {translation_id} and user_id: {user_id}"
-            )
-        else:
-            logger.exception("Failed to save vote")
-        raise e
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            logger.exception("Failed to release text lease")
+            raise e
 
 
-def get_leaderboard_data():
-    try:
+def _text_translated(text_id):
+    response = execute_db_query(
+        operation="get_item",
+        Key={"text_id": int(text_id)},
+        ProjectionExpression="translated",
+        ConsistentRead=True,
+        table=original_text_table,
+    )
+    return response.get("Item", {}).get("translated") == "True"
+
+
+def _highest_text_id():
+    with _untranslated_lock:
+        highest = _untranslated_index.max() if _untranslated_index else None
+    if highest is not None:
+        return highest
+    response = execute_db_query(
+        operation="get_item",
+        Key={"meta_key": TEXT_ID_COUNTER_KEY},
+        table=meta_table,
+    )
+    return int(response.get("Item", {}).get("last_id", 0))
+
+
+def _lease_from_untranslated_query(user_id, skipped):
+    # The snapshot can predate the texts still open, e.g. in a cold container
+    # that loaded it before a rebuild, so ask the GSI itself. The page starts
+    # at a random text_id, wrapping around to the lowest ids, and is shuffled
+    # so that concurrent callers do not all queue on the same texts.
+    query_kwargs = {
+        "IndexName": "translated-text_id-index",
+        "KeyConditionExpression": Key("translated").eq("False"),
+        "ProjectionExpression": "text_id",
+        "Limit": UNTRANSLATED_QUERY_PAGE,
+    }
+    start = random.randint(0, _highest_text_id())
+    text_ids = []
+    for start_key in ({"translated": "False", "text_id": start}, None):
+        kwargs = dict(query_kwargs)
+        if start_key is not None:
+            kwargs["ExclusiveStartKey"] = start_key
         response = execute_db_query(
-            operation="scan",
-            table=user_table,
+            operation="query", table=original_text_table, **kwargs
         )
-        leaderboard_data = []
-        for item in response.get("Items", []):
-            user_id = item["user_id"]
-            if user_id == "1":  # Skip the bot's user ID
-                continue
-            username = item.get("username", "Unknown").lstrip("@")
-            contributions = float(item.get("contributions", 0))
-            votings = float(item.get("votings", 0))
-            score = round(contributions + (votings / 10))
-            leaderboard_data.append(
-                {
-                    "user_id": user_id,
-                    "username": username,
-                    "score": score,
-                }
-            )
+        text_ids += [int(item["text_id"]) for item in response["Items"]]
+        if len(text_ids) >= UNTRANSLATED_QUERY_PAGE or start_key is None:
+            break
+    text_ids = [text_id for text_id in set(text_ids) if text_id not in skipped]
+    random.shuffle(text_ids)
+    for text_id in text_ids[:UNTRANSLATED_SAMPLE_ATTEMPTS]:
+        item = acquire_text_lease(text_id, user_id)
+        if item:
+            return item
+    return None
 
-        return sorted(leaderboard_data, key=lambda x: x["score"], reverse=True)[:10]
-    except ClientError as e:
-        logger.exception("Failed to get leaderboard data")
-        raise e
 
+def get_untranslated_text(user_id):
+    """Lease a uniformly random untranslated text to ``user_id``.
 
-def get_total_users():
+    Draws from the untranslated index first and falls back to querying the
+    translated-text_id-index when the draws come up empty.
+    """
     try:
-        response = execute_db_query(
-            operation="scan",
-            table=user_table,
-            Select="COUNT",
-        )
-        return response["Count"]
+        skipped = set()
+        for _ in range(UNTRANSLATED_SAMPLE_ATTEMPTS):
+            text_id = sample_untranslated_text()
+            if text_id is None:
+                break
+
+            item = acquire_text_lease(text_id, user_id)
+            if item:
+                return item
+
+            skipped.add(text_id)
+            # A text leased to someone else comes back if the lease runs out;
+            # only a translated one is skipped until the next snapshot load
+            if _text_translated(text_id):
+                mark_text_translated(text_id)
+
+        item = _lease_from_untranslated_query(user_id, skipped)
+        if item:
+            return item
+        logger.info("No untranslated texts available in the corpus")
+        return None
     except ClientError as e:
-        logger.exception("Failed to get total users")
+        logger.exception("Failed to get untranslated text")
         raise e
 
 
-def update_daily_stats(user_id, activity_type):
+def batch_get_items(table, keys, projection=None):
+    items = []
     try:
-        today = datetime.now().strftime("%Y-%m-%d")
-        update_expression = "SET {field} = if_not_exists({field}, :zero) + :inc"
-        expression_attribute_values = {":zero": 0, ":inc": 1}
-
-        if activity_type == "translation":
-            field = "translations_count"
-        elif activity_type == "vote":
-            field = "votes_count"
+        # BatchGetItem accepts at most 100 keys per call
+        for start in range(0, len(keys), 100):
+            request = {"Keys": keys[start : start + 100]}
+            if projection:
+                request["ProjectionExpression"] = projection
+            request_items = {table.name: request}
+            while request_items:
+                response = execute_db_query(
+                    operation="batch_get_item", RequestItems=request_items
+                )
+                items.extend(response["Responses"].get(table.name, []))
+                request_items = response.get("UnprocessedKeys")
+    except ClientError as e:
+        logger.exception("Failed to batch get items")
+        raise e
+    return items
+
+
+def batch_write_items(puts):
+    """Write ``(table, item)`` pairs with BatchWriteItem, 25 items per call.
+
+    Items DynamoDB hands back as unprocessed are resent with jittered
+    exponential backoff until every item is written.
+    """
+    try:
+        for start in range(0, len(puts), 25):
+            request_items = {}
+            for table, item in puts[start : start + 25]:
+                request_items.setdefault(table.name, []).append(
+                    {"PutRequest": {"Item": item}}
+                )
+            attempt = 0
+            while request_items:
+                response = execute_db_query(
+                    operation="batch_write_item", RequestItems=request_items
+                )
+                request_items = response.get("UnprocessedItems")
+                if request_items:
+                    attempt += 1
+                    time.sleep(random.uniform(0, min(0.05 * 2**attempt, 5)))
+    except ClientError as e:
+        logger.exception("Failed to batch write items")
+        raise e
+
+
+def reserve_text_ids(count):
+    """Reserve ``count`` consecutive new text_ids and return the first one."""
+    try:
+        response = execute_db_query(
+            operation="update_item",
+            Key={"meta_key": TEXT_ID_COUNTER_KEY},
+            UpdateExpression="ADD last_id :count",
+            ConditionExpression="attribute_exists(meta_key)",
+            ExpressionAttributeValues={":count": count},
+            ReturnValues="UPDATED_NEW",
+            table=meta_table,
+        )
+    except ClientError as e:
+        if not is_condition_failure(e):
+            raise e
+        seed_text_id_counter()
+        return reserve_text_ids(count)
+    return int(response["Attributes"]["last_id"]) - count + 1
+
+
+def seed_text_id_counter():
+    """Start the text_id counter after the highest existing text_id."""
+    highest = max(
+        (
+            int(item["text_id"])
+            for item in scan_items(
+                original_text_table, segments=SCAN_SEGMENTS, projection=["text_id"]
+            )
+        ),
+        default=0,
+    )
+    try:
+        execute_db_query(
+            operation="put_item",
+            Item={"meta_key": TEXT_ID_COUNTER_KEY, "last_id": highest},
+            ConditionExpression="attribute_not_exists(meta_key)",
+            table=meta_table,
+        )
+    except ClientError as e:
+        if not is_condition_failure(e):
+            raise e
+
+
+def vote_queue_shard(translation_id):
+    return str(int(translation_id) % VOTE_QUEUE_SHARDS)
+
+
+def get_translation_for_vote(user_id):
+    """Pick the least-voted translation ``user_id`` may still score.
+
+    Translations sit in the sparse vote_queue-vote_count-index until they
+    collect VOTE_TARGET votes. One shard of the queue is read per attempt and
+    the voter's own and already-scored translations are filtered out, so a
+    request costs at most VOTE_SCHEDULER_MAX_PAGES query + batch_get pairs.
+    """
+    user_id = str(user_id)
+    first_shard = random.randrange(VOTE_QUEUE_SHARDS)
+    try:
+        for attempt in range(VOTE_SCHEDULER_MAX_PAGES):
+            shard = str((first_shard + attempt) % VOTE_QUEUE_SHARDS)
+            response = execute_db_query(
+                operation="query",
+                table=translation_table,
+                IndexName="vote_queue-vote_count-index",
+                KeyConditionExpression=Key("vote_queue").eq(shard)
+                & Key("vote_count").lt(VOTE_TARGET),
+                Limit=VOTE_CANDIDATES_PAGE_SIZE,
+            )
+            candidates = [
+                item for item in response["Items"] if item.get("user_id") != user_id
+            ]
+            if not candidates:
+                continue
+
+            scored = batch_get_items(
+                score_table,
+                [
+                    {"score_id": int(f"{item['translation_id']}{user_id}")}
+                    for item in candidates
+                ],
+                projection="translation_id",
+            )
+            scored_ids = {item["translation_id"] for item in scored}
+            candidates = [
+                item
+                for item in candidates
+                if str(item["translation_id"]) not in scored_ids
+            ]
+            if not candidates:
+                continue
+
+            least_votes = min(item["vote_count"] for item in candidates)
+            return random.choice(
+                [item for item in candidates if item["vote_count"] == least_votes]
+            )
+
+        return None
+    except ClientError as e:
+        logger.exception("Failed to get translation for vote")
+        raise e
+
+
+def backfill_vote_queue():
+    """Put translations saved before the vote scheduler into its queue."""
+    try:
+        for item in scan_items(
+            translation_table,
+            segments=SCAN_SEGMENTS,
+            projection=["translation_id", "voted"],
+            FilterExpression=Attr("vote_queue").not_exists(),
+        ):
+            execute_db_query(
+                operation="update_item",
+                Key={"translation_id": item["translation_id"]},
+                UpdateExpression="SET vote_queue = :shard, "
+                "vote_count = if_not_exists(vote_count, :count)",
+                ExpressionAttributeValues={
+                    ":shard": vote_queue_shard(item["translation_id"]),
+                    ":count": 1 if item.get("voted") == "True" else 0,
+                },
+                table=translation_table,
+            )
+    except ClientError as e:
+        logger.exception("Failed to backfill vote queue")
+        raise e
+
+
+def translation_changed_at(now):
+    """Translation attributes that place it in the changed-translations index."""
+    return {"updated_at": int(now), "updated_day": _day_of(now)}
+
+
+def get_changed_translations(since, until):
+    """Yield translations saved or voted on in ``since < updated_at <= until``.
+
+    The updated_day-updated_at-index is partitioned by day, so this reads one
+    partition per day in the window and nothing older.
+    """
+    day = datetime.fromtimestamp(since).date()
+    last_day = datetime.fromtimestamp(until).date()
+    try:
+        while day <= last_day:
+            yield from query_items(
+                translation_table,
+                IndexName=CHANGED_TRANSLATIONS_INDEX,
+                KeyConditionExpression=Key("updated_day").eq(day.isoformat())
+                & Key("updated_at").between(int(since) + 1, int(until)),
+            )
+            day += timedelta(days=1)
+    except ClientError as e:
+        logger.exception("Failed to query changed translations")
+        raise e
+
+
+def get_export_watermark():
+    response = execute_db_query(
+        operation="get_item",
+        Key={"meta_key": EXPORT_WATERMARK_KEY},
+        table=meta_table,
+    )
+    item = response.get("Item")
+    return int(item["updated_at"]) if item else None
+
+
+def set_export_watermark(updated_at):
+    execute_db_query(
+        operation="put_item",
+        Item={"meta_key": EXPORT_WATERMARK_KEY, "updated_at": int(updated_at)},
+        table=meta_table,
+    )
+
+
+def refresh_score_aggregates(until=None):
+    """Derive mean_score and quality_band of the translations voted on since
+    the last run, which puts them into the quality_band-mean_score-index.
+
+    Returns how many translations were updated. Run backfill_score_aggregates
+    once for votes from before the first run.
+    """
+    until = int(until or time.time() - SCORE_REFRESH_LAG_SECONDS)
+    try:
+        response = execute_db_query(
+            operation="get_item",
+            Key={"meta_key": SCORE_AGGREGATES_WATERMARK_KEY},
+            table=meta_table,
+        )
+        since = int(response.get("Item", {}).get("updated_at", until - 86400))
+        refreshed = 0
+        for item in get_changed_translations(since, until):
+            count = int(item.get("vote_count", 0))
+            if not count:
+                continue
+            aggregates = score_aggregates(int(item.get("score_sum", 0)), count)
+            if all(item.get(key) == value for key, value in aggregates.items()):
+                continue
+            try:
+                execute_db_query(
+                    operation="update_item",
+                    Key={"translation_id": int(item["translation_id"])},
+                    UpdateExpression="SET mean_score = :mean, quality_band = :band",
+                    # A vote landing in between moves updated_at past this
+                    # run, and the next run derives it again
+                    ConditionExpression="vote_count = :count",
+                    ExpressionAttributeValues={
+                        ":mean": aggregates["mean_score"],
+                        ":band": aggregates["quality_band"],
+                        ":count": count,
+                    },
+                    table=translation_table,
+                )
+                refreshed += 1
+            except ClientError as e:
+                if not is_condition_failure(e):
+                    raise e
+        execute_db_query(
+            operation="put_item",
+            Item={"meta_key": SCORE_AGGREGATES_WATERMARK_KEY, "updated_at": until},
+            table=meta_table,
+        )
+        return refreshed
+    except ClientError as e:
+        logger.exception("Failed to refresh score aggregates")
+        raise e
+
+
+def backfill_score_aggregates():
+    """Recompute the score aggregates of every voted translation from Score.
+
+    Votes saved while this runs may be overwritten, so run it before the
+    bot starts recording aggregates or during a quiet period.
+    """
+    totals = {}
+    try:
+        for item in scan_items(
+            score_table,
+            segments=SCAN_SEGMENTS,
+            projection=["translation_id", "score_value"],
+        ):
+            totals.setdefault(item["translation_id"], []).append(
+                int(item["score_value"])
+            )
+        for translation_id, scores in totals.items():
+            histogram = Counter(s for s in scores if s in SCORE_BUCKETS)
+            values = {
+                "vote_count": len(scores),
+                "score_sum": sum(scores),
+                **{f"score_{bucket}": histogram[bucket] for bucket in SCORE_BUCKETS},
+                **score_aggregates(sum(scores), len(scores)),
+            }
+            names = {f"#a{i}": name for i, name in enumerate(values)}
+            try:
+                execute_db_query(
+                    operation="update_item",
+                    Key={"translation_id": int(translation_id)},
+                    UpdateExpression="SET "
+                    + ", ".join(f"#a{i} = :a{i}" for i in range(len(values))),
+                    ConditionExpression="attribute_exists(translation_id)",
+                    ExpressionAttributeNames=names,
+                    ExpressionAttributeValues={
+                        f":a{i}": value for i, value in enumerate(values.values())
+                    },
+                    table=translation_table,
+                )
+            except ClientError as e:
+                # Scores of deleted translations
+                if not is_condition_failure(e):
+                    raise e
+    except ClientError as e:
+        logger.exception("Failed to backfill score aggregates")
+        raise e
+
+
+def get_original_text(text_id):
+    text = get_original_text_by_id(text_id)
+    return text["text"] if text else None
+
+
+def save_contribution(text_id, user_id, lang, text, original_text, now=None):
+    """Save a translation, complete its text and bump the counters atomically.
+
+    ``now`` should come from the Telegram update so that a retried delivery
+    sends an identical transaction and is absorbed by its idempotency token.
+    """
+    now = int(now or time.time())
+    translation_id = int(f"{text_id}{user_id}")
+    try:
+        transact_write(
+            [
+                {
+                    "Put": {
+                        "table": translation_table,
+                        "Item": {
+                            "translation_id": translation_id,
+                            "voted": "False",
+                            "lang": lang,
+                            "original_text": original_text,
+                            "original_text_id": str(text_id),
+                            "text": text,
+                            "user_id": str(user_id),
+                            "vote_count": 0,
+                            "vote_queue": vote_queue_shard(translation_id),
+                            **translation_changed_at(now),
+                        },
+                        "ConditionExpression": "attribute_not_exists(translation_id)",
+                    }
+                },
+                {
+                    # Completing the text also ends the lease; this fails if
+                    # the lease expired and another user finished the text
+                    "Update": {
+                        "table": original_text_table,
+                        "Key": {"text_id": int(text_id)},
+                        "UpdateExpression": "SET translated = :translated "
+                        "REMOVE lease_owner, lease_expires_at",
+                        "ConditionExpression": "translated = :false AND ("
+                        "attribute_not_exists(lease_owner) OR lease_owner = :owner "
+                        "OR lease_expires_at < :now)",
+                        "ExpressionAttributeValues": {
+                            ":translated": "True",
+                            ":false": "False",
+                            ":owner": str(user_id),
+                            ":now": now,
+                        },
+                    }
+                },
+                user_counter_update(user_id, "contributions", "translation", now),
+                *user_created_updates(user_id),
+                *daily_stats_updates(user_id, "translation", now),
+            ],
+            token=idempotency_token("contribution", text_id, user_id),
+        )
+        mark_text_translated(text_id)
+        _bump_session_counter(user_id, "contributions")
+        update_leaderboard_for(user_id)
+        return record_daily_activity(user_id, "translation", now)
+    except ClientError as e:
+        reasons = [
+            reason.get("Code") for reason in e.response.get("CancellationReasons", [])
+        ]
+        if reasons[:1] == ["ConditionalCheckFailed"]:
+            logger.warning(f"Contribution already exists for text_id: {text_id}")
+        elif reasons[1:2] == ["ConditionalCheckFailed"]:
+            # The lease ran out and another user finished the text
+            count_lease_event("lost")
+            logger.warning(f"Lease lost on text_id: {text_id} by user_id: {user_id}")
         else:
-            logger.error(f"Unsupported activity type: {activity_type}")
+            logger.exception("Failed to save contribution")
+        raise e
+
+
+def quality_band(mean_score):
+    return next(band for band, floor in QUALITY_BANDS if mean_score >= floor)
+
+
+def score_aggregates(score_sum, score_count):
+    """The mean score and quality band stored on a voted translation."""
+    mean = (Decimal(score_sum) / Decimal(score_count)).quantize(Decimal("0.0001"))
+    return {"mean_score": mean, "quality_band": quality_band(mean)}
+
+
+def get_translations_by_quality(band, min_score=None, max_score=None):
+    """Yield the voted translations in ``band``, optionally within a mean
+    score range, from the quality_band-mean_score-index."""
+    condition = Key("quality_band").eq(band)
+    if min_score is not None and max_score is not None:
+        condition &= Key("mean_score").between(
+            Decimal(str(min_score)), Decimal(str(max_score))
+        )
+    elif min_score is not None:
+        condition &= Key("mean_score").gte(Decimal(str(min_score)))
+    elif max_score is not None:
+        condition &= Key("mean_score").lte(Decimal(str(max_score)))
+    try:
+        yield from query_items(
+            translation_table,
+            IndexName=QUALITY_INDEX,
+            KeyConditionExpression=condition,
+        )
+    except ClientError as e:
+        logger.exception("Failed to query translations by quality")
+        raise e
+
+
+def _vote_write(translation_id, user_id, score, now):
+    names = {}
+    additions = "ADD vote_count :one, score_sum :score"
+    if score in SCORE_BUCKETS:
+        names["#bucket"] = f"score_{score}"
+        additions += ", #bucket :one"
+    update = {
+        "table": translation_table,
+        "Key": {"translation_id": int(translation_id)},
+        "UpdateExpression": "SET voted = :voted, updated_at = :now, "
+        "updated_day = :day " + additions,
+        "ConditionExpression": "attribute_exists(translation_id)",
+        "ExpressionAttributeValues": {
+            ":voted": "True",
+            ":one": 1,
+            ":score": score,
+            ":now": now,
+            ":day": _day_of(now),
+        },
+    }
+    if names:
+        update["ExpressionAttributeNames"] = names
+    # No token: a redelivered vote is caught by the Score row's condition,
+    # which, unlike a replayed token, tells it apart from a new vote
+    transact_write(
+        [
+            {
+                "Put": {
+                    "table": score_table,
+                    "Item": {
+                        "score_id": int(f"{translation_id}{user_id}"),
+                        "score_value": score,
+                        "translation_id": str(translation_id),
+                        "user_id": str(user_id),
+                    },
+                    "ConditionExpression": "attribute_not_exists(score_id)",
+                }
+            },
+            {"Update": update},
+            user_counter_update(user_id, "votings", "vote", now),
+            *user_created_updates(user_id),
+            *daily_stats_updates(user_id, "vote", now),
+        ]
+    )
+
+
+def _vote_recorded(error):
+    # The Score row exists: an earlier delivery of the vote got through
+    reasons = error.response.get("CancellationReasons", [])
+    return bool(reasons) and reasons[0].get("Code") == "ConditionalCheckFailed"
+
+
+def save_vote(translation_id, user_id, score, now=None):
+    """Save a vote and bump the translation's score totals atomically.
+
+    vote_count, score_sum and the score_1..score_5 histogram are bumped in
+    the same transaction as the Score row, without reading the translation
+    first. mean_score and quality_band, which an update expression cannot
+    divide out, are derived by :func:`refresh_score_aggregates`.
+
+    A vote already recorded, typically by an earlier delivery of the same
+    update, is not an error: today's counts are returned as they stand.
+    """
+    now = int(now or time.time())
+    score = int(score)
+    try:
+        _vote_write(translation_id, user_id, score, now)
+        _bump_session_counter(user_id, "votings")
+        update_leaderboard_for(user_id)
+        return record_daily_activity(user_id, "vote", now)
+    except ClientError as e:
+        if _vote_recorded(e):
+            logger.info(
+                f"Vote already recorded for translation_id: {translation_id} and user_id: {user_id}"
+            )
+            return daily_counts(user_id, now)
+        if is_condition_failure(e):
+            logger.warning(f"Voted on a missing translation_id: {translation_id}")
+        else:
+            logger.exception("Failed to save vote")
+        raise e
+
+
+def daily_counter_name(field, today):
+    return f"{field}@{today}"
+
+
+def user_counter_update(user_id, counter, activity_type=None, now=None):
+    """Bump a User counter, and with ``activity_type`` also the user's
+    counter for today, mirrored from daily_stats onto the User item.
+
+    A transaction cannot return updated values, but the request's session
+    already holds the User item, so today's post-increment count is known
+    without reading daily_stats back (see :func:`record_daily_activity`).
+    """
+    names = {"#counter": counter}
+    expression = "ADD #counter :one"
+    if activity_type:
+        names["#daily"] = daily_counter_name(
+            DAILY_STATS_FIELDS[activity_type], _day_of(now)
+        )
+        expression += ", #daily :one"
+    return {
+        "Update": {
+            "table": user_table,
+            "Key": {"user_id": str(user_id)},
+            "UpdateExpression": expression,
+            "ExpressionAttributeNames": names,
+            "ExpressionAttributeValues": {":one": 1},
+        }
+    }
+
+
+def user_created_updates(user_id):
+    """The users counter bump for a transaction whose counter update creates
+    the User item, as far as the request's session knows."""
+    session = _user_session.get()
+    if session is not None and session.user_id == str(user_id) and session._missing:
+        return [global_counter_update(USERS_COUNTER_KEY, user_id, "users_count")]
+    return []
+
+
+def _bump_session_counter(user_id, counter):
+    # Keep the request's view of the User item in step with the transaction
+    session = _user_session.get()
+    if session is not None and session.user_id == str(user_id):
+        session._missing = False
+        if session._item is not None:
+            # The transaction has created the item if it was missing
+            session._item.setdefault("user_id", session.user_id)
+            session._item[counter] = session._item.get(counter, 0) + 1
+
+
+def record_daily_activity(user_id, activity_type, now=None):
+    """Apply a committed activity to the session and return today's counts.
+
+    Counters of earlier days are dropped when the session is flushed. Returns
+    None without a session for ``user_id``.
+    """
+    session = _user_session.get()
+    if session is None or session.user_id != str(user_id) or session._item is None:
+        return None
+    today = _day_of(now)
+    _bump_session_counter(
+        user_id, daily_counter_name(DAILY_STATS_FIELDS[activity_type], today)
+    )
+    for key in list(session._item):
+        if "@" in key and not key.endswith(f"@{today}"):
+            session.remove(key)
+    return daily_counts(user_id, now)
+
+
+def daily_counts(user_id, now=None):
+    """Today's counts from the session's User item, or None without one."""
+    session = _user_session.get()
+    if session is None or session.user_id != str(user_id):
+        return None
+    today = _day_of(now)
+    return {
+        field: int(session.item.get(daily_counter_name(field, today), 0))
+        for field in DAILY_STATS_FIELDS.values()
+    }
+
+
+def leaderboard_entry(item):
+    contributions = float(item.get("contributions", 0))
+    votings = float(item.get("votings", 0))
+    return {
+        "user_id": item["user_id"],
+        "username": item.get("username", "Unknown").lstrip("@"),
+        "score": round(contributions + (votings / 10)),
+    }
+
+
+def rank_leaderboard(entries):
+    return sorted(entries, key=lambda x: x["score"], reverse=True)[:LEADERBOARD_SIZE]
+
+
+# (snapshot item, loaded_at), cached across warm invocations
+_leaderboard_cache = (None, 0)
+
+
+def refresh_leaderboard_snapshot():
+    """Recompute the leaderboard from the User table and store it as one item."""
+    try:
+        entries = (
+            leaderboard_entry(item)
+            for item in scan_items(
+                user_table,
+                segments=SCAN_SEGMENTS,
+                projection=["user_id", "username", "contributions", "votings"],
+            )
+            if item["user_id"] != "1"  # Skip the bot's user ID
+        )
+        top = heapq.nlargest(LEADERBOARD_SIZE, entries, key=lambda x: x["score"])
+        snapshot = _put_leaderboard_snapshot(rank_leaderboard(top))
+    except ClientError as e:
+        logger.exception("Failed to refresh leaderboard snapshot")
+        raise e
+    return snapshot
+
+
+def _put_leaderboard_snapshot(entries, expected_version=None):
+    global _leaderboard_cache
+    version = int(time.time() * 1000)
+    snapshot = {
+        "meta_key": LEADERBOARD_KEY,
+        "entries": entries,
+        "version": version,
+    }
+    kwargs = {}
+    if expected_version is not None:
+        kwargs["ConditionExpression"] = "version = :version"
+        kwargs["ExpressionAttributeValues"] = {":version": expected_version}
+    execute_db_query(operation="put_item", Item=snapshot, table=meta_table, **kwargs)
+    _leaderboard_cache = (snapshot, time.time())
+    return snapshot
+
+
+def get_leaderboard_snapshot():
+    """The stored leaderboard, or None until the refresh_leaderboard job has
+    seeded it. Building it here would scan User inside a user's request."""
+    global _leaderboard_cache
+    snapshot, loaded_at = _leaderboard_cache
+    if snapshot is not None and time.time() - loaded_at < LEADERBOARD_CACHE_TTL:
+        return None if snapshot is MISSING else snapshot
+
+    response = execute_db_query(
+        operation="get_item",
+        Key={"meta_key": LEADERBOARD_KEY},
+        table=meta_table,
+    )
+    snapshot = response.get("Item")
+    _leaderboard_cache = (MISSING if snapshot is None else snapshot, time.time())
+    return snapshot
+
+
+def get_leaderboard_data():
+    try:
+        snapshot = get_leaderboard_snapshot()
+        return snapshot["entries"] if snapshot else []
+    except ClientError as e:
+        logger.exception("Failed to get leaderboard data")
+        raise e
+
+
+def update_leaderboard_for(user_id):
+    """Fold a user's new counters into the snapshot if it changes the board.
+
+    Only called after a contribution or vote, with the counters taken from the
+    request's User session, so it costs a write only when the user enters the
+    board or changes places on it. Point totals of users who keep their place
+    are refreshed by the scheduled refresh_leaderboard job.
+    """
+    global _leaderboard_cache
+    session = _user_session.get()
+    if session is None or session.user_id != str(user_id) or str(user_id) == "1":
+        return
+
+    try:
+        snapshot = get_leaderboard_snapshot()
+        if snapshot is None:
+            # The scheduled job builds the board from every user's counters
+            return
+        entries = [e for e in snapshot["entries"] if e["user_id"] != str(user_id)]
+        ranked = rank_leaderboard([*entries, leaderboard_entry(session.item)])
+        current = [e["user_id"] for e in snapshot["entries"]]
+        if [e["user_id"] for e in ranked] == current:
             return
+        _put_leaderboard_snapshot(ranked, expected_version=snapshot["version"])
+    except ClientError as e:
+        if not is_condition_failure(e):
+            logger.exception("Failed to update leaderboard snapshot")
+        # Someone else changed the board first; reload it on the next read
+        _leaderboard_cache = (None, 0)
+
+
+DAILY_STATS_FIELDS = {"translation": "translations_count", "vote": "votes_count"}
+
+
+def counter_shard(user_id):
+    # Deterministic per user, so a retried transaction stays idempotent
+    return int(user_id) % COUNTER_SHARDS
+
+
+def global_counter_update(counter_key, user_id, field):
+    return {
+        "Update": {
+            "table": meta_table,
+            "Key": {"meta_key": f"{counter_key}#{counter_shard(user_id)}"},
+            "UpdateExpression": "ADD #field :inc",
+            "ExpressionAttributeNames": {"#field": field},
+            "ExpressionAttributeValues": {":inc": 1},
+        }
+    }
+
+
+def read_global_counter(counter_key, fields):
+    """Sum ``fields`` over every shard of a global counter."""
+    keys = [{"meta_key": f"{counter_key}#{i}"} for i in range(COUNTER_SHARDS)]
+    totals = dict.fromkeys(fields, 0)
+    for item in batch_get_items(meta_table, keys):
+        for field in fields:
+            totals[field] += int(item.get(field, 0))
+    return totals
 
+
+def get_total_users():
+    try:
+        return read_global_counter(USERS_COUNTER_KEY, ["users_count"])["users_count"]
+    except ClientError as e:
+        logger.exception("Failed to get total users")
+        raise e
+
+
+def seed_users_counter():
+    """Reset the total users counter from a full count of the User table.
+
+    Run once when the counter is introduced; /start keeps it up to date
+    afterwards. Users created while the scan runs may be counted twice.
+    """
+    stats = ScanStats()
+    for _ in scan_items(
+        user_table, segments=SCAN_SEGMENTS, stats=stats, Select="COUNT"
+    ):
+        pass
+    for i in range(COUNTER_SHARDS):
         execute_db_query(
-            operation="update_item",
-            Key={"date": today, "user_id": str(user_id)},
-            UpdateExpression=update_expression.format(field=field),
-            ExpressionAttributeValues=expression_attribute_values,
-            table=daily_stats_table,
+            operation="put_item",
+            Item={
+                "meta_key": f"{USERS_COUNTER_KEY}#{i}",
+                "users_count": stats.count if i == 0 else 0,
+            },
+            table=meta_table,
+        )
+    return stats.count
+
+
+def get_global_daily_counts(date):
+    """Return the project-wide (translations, votes) totals for ``date``."""
+    try:
+        totals = read_global_counter(
+            DAILY_COUNTER_KEY.format(date=date), DAILY_STATS_FIELDS.values()
+        )
+        return totals["translations_count"], totals["votes_count"]
+    except ClientError as e:
+        logger.exception("Failed to get global daily counts")
+        raise e
+
+
+def _day_of(now=None):
+    return datetime.fromtimestamp(now or time.time()).strftime("%Y-%m-%d")
+
+
+def daily_stats_updates(user_id, activity_type, now=None):
+    """Updates for the user's daily_stats row and the global daily counter."""
+    today = _day_of(now)
+    field = DAILY_STATS_FIELDS[activity_type]
+    return [
+        {
+            "Update": {
+                "table": daily_stats_table,
+                "Key": {"date": today, "user_id": str(user_id)},
+                "UpdateExpression": "ADD #field :inc",
+                "ExpressionAttributeNames": {"#field": field},
+                "ExpressionAttributeValues": {":inc": 1},
+            }
+        },
+        global_counter_update(DAILY_COUNTER_KEY.format(date=today), user_id, field),
+    ]
+
+
+def update_daily_stats(user_id, activity_type, now=None):
+    """Count one activity for today and return the user's updated counters."""
+    if activity_type not in DAILY_STATS_FIELDS:
+        logger.error(f"Unsupported activity type: {activity_type}")
+        return
+
+    row, global_counter = daily_stats_updates(user_id, activity_type, now)
+    try:
+        response = execute_db_query(
+            operation="update_item", ReturnValues="UPDATED_NEW", **row["Update"]
         )
+        execute_db_query(operation="update_item", **global_counter["Update"])
     except ClientError as e:
         logger.exception("Failed to update daily stats")
         raise e
+    attributes = response.get("Attributes", {})
+    return {
+        field: int(attributes.get(field, 0)) for field in DAILY_STATS_FIELDS.values()
+    }
+
 
-# TODO: aggregate counts with Efficient Range Queries for any given date ranges.
 def get_aggregated_counts(date, user_id=None):
+    return get_aggregated_counts_range(date, date, user_id)
+
+
+def week_key(day):
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def month_key(day):
+    return day.strftime("%Y-%m")
+
+
+def _month_end(day):
+    next_month = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return next_month - timedelta(days=1)
+
+
+def rollup_plan(start, end, compacted_through=None):
+    """Cover ``start``..``end`` with as few daily_stats partitions as possible.
+
+    Whole months and ISO weeks that are already compacted are read from their
+    rollup items, the remaining edge days from the daily rows, so a range
+    costs O(months + weeks at the edges + days at the edges) items.
+    """
+    keys = []
+    rolled_up_until = min(end, compacted_through) if compacted_through else None
+    day = start
+    while day <= end:
+        week_end = day + timedelta(days=6 - day.weekday())
+        if rolled_up_until and day.day == 1 and _month_end(day) <= rolled_up_until:
+            keys.append(month_key(day))
+            day = _month_end(day) + timedelta(days=1)
+        elif rolled_up_until and day.weekday() == 0 and week_end <= rolled_up_until:
+            keys.append(week_key(day))
+            day = week_end + timedelta(days=1)
+        else:
+            keys.append(day.isoformat())
+            day += timedelta(days=1)
+    return keys
+
+
+def get_rollup_watermark():
+    response = execute_db_query(
+        operation="get_item",
+        Key={"meta_key": ROLLUP_WATERMARK_KEY},
+        table=meta_table,
+    )
+    item = response.get("Item")
+    return date.fromisoformat(item["compacted_through"]) if item else None
+
+
+def get_aggregated_counts_range(start, end, user_id=None):
+    """Return (translations, votes) for ``start``..``end`` inclusive.
+
+    Dates are ``YYYY-MM-DD`` strings or dates. Without ``user_id`` the totals
+    are project-wide: days come from the sharded global counters and weeks
+    and months from the rollup items kept under the ``*`` user.
+
+    A user's edge days are read from daily rows, so with
+    DAILY_STATS_RETENTION_DAYS set a range whose edge days may have expired
+    raises ValueError instead of coming back short.
+    """
+    start, end = (
+        d if isinstance(d, date) else date.fromisoformat(d) for d in (start, end)
+    )
     try:
-        if user_id:
-            key_condition_expression = Key('date').eq(date) & Key('user_id').eq(str(user_id))
+        # Ranges shorter than a week never contain a whole rollup period
+        watermark = get_rollup_watermark() if (end - start).days >= 6 else None
+        partitions = rollup_plan(start, end, watermark)
+
+        if user_id is not None:
+            oldest = min((key for key in partitions if len(key) == 10), default=None)
+            if oldest and date.fromisoformat(oldest) <= daily_rows_expired_through():
+                raise ValueError(
+                    f"daily_stats rows for {oldest} may have expired; "
+                    "per-user ranges must start on a week or month rolled up "
+                    f"or within {DAILY_STATS_RETENTION_DAYS} days"
+                )
+            items = batch_get_items(
+                daily_stats_table,
+                [{"date": key, "user_id": str(user_id)} for key in partitions],
+            )
         else:
-            key_condition_expression = Key('date').eq(date)
+            days = [key for key in partitions if len(key) == 10]
+            items = batch_get_items(
+                daily_stats_table,
+                [
+                    {"date": key, "user_id": GLOBAL_STATS_USER}
+                    for key in partitions
+                    if len(key) != 10
+                ],
+            )
+            items += batch_get_items(
+                meta_table,
+                [
+                    {"meta_key": f"{DAILY_COUNTER_KEY.format(date=day)}#{i}"}
+                    for day in days
+                    for i in range(COUNTER_SHARDS)
+                ],
+            )
+
+        total_translations = sum(int(i.get("translations_count", 0)) for i in items)
+        total_votes = sum(int(i.get("votes_count", 0)) for i in items)
+        return total_translations, total_votes
+    except ClientError as e:
+        logger.exception("Failed to get aggregated counts for the given range")
+        raise e
 
-        response = daily_stats_table.query(
-            KeyConditionExpression=key_condition_expression,
-            ProjectionExpression="translations_count, votes_count"
+
+def daily_rows_expired_through(today=None):
+    """The last day whose daily_stats rows may have expired, or date.min."""
+    if not DAILY_STATS_RETENTION_DAYS:
+        return date.min
+    return (today or date.today()) - timedelta(days=DAILY_STATS_RETENTION_DAYS)
+
+
+def get_recent_counts(days, user_id=None, today=None):
+    """Totals for the last ``days`` days, today included (e.g. 7, 30, 90)."""
+    today = today or date.today()
+    return get_aggregated_counts_range(today - timedelta(days=days - 1), today, user_id)
+
+
+def _rollup_update(partition, user_id, day, counts):
+    # The days set makes folding the same day in twice a no-op, so an
+    # interrupted compaction can simply be run again
+    return execute_db_query(
+        operation="update_item",
+        Key={"date": partition, "user_id": user_id},
+        UpdateExpression="ADD translations_count :t, votes_count :v, #days :day",
+        ConditionExpression="attribute_not_exists(#days) OR NOT contains(#days, :d)",
+        ExpressionAttributeNames={"#days": "days"},
+        ExpressionAttributeValues={
+            ":t": counts["translations_count"],
+            ":v": counts["votes_count"],
+            ":day": {day},
+            ":d": day,
+        },
+        table=daily_stats_table,
+    )
+
+
+def compact_day(day):
+    """Fold one day of daily_stats rows into the week and month rollups."""
+    key = day.isoformat()
+    totals = Counter()
+    rows = query_items(
+        daily_stats_table,
+        KeyConditionExpression=Key("date").eq(key),
+        ProjectionExpression="user_id, translations_count, votes_count",
+    )
+    expires_at = None
+    if DAILY_STATS_RETENTION_DAYS:
+        expires_at = int(
+            datetime.combine(
+                day + timedelta(days=DAILY_STATS_RETENTION_DAYS), datetime.min.time()
+            ).timestamp()
         )
 
-        items = response.get("Items", [])
-        total_translations = sum(item.get("translations_count", 0) for item in items)
-        total_votes = sum(item.get("votes_count", 0) for item in items)
+    for row in rows:
+        counts = {
+            field: int(row.get(field, 0)) for field in DAILY_STATS_FIELDS.values()
+        }
+        totals.update(counts)
+        for partition in (week_key(day), month_key(day)):
+            try:
+                _rollup_update(partition, row["user_id"], key, counts)
+            except ClientError as e:
+                if not is_condition_failure(e):
+                    raise
+        if expires_at:
+            execute_db_query(
+                operation="update_item",
+                Key={"date": key, "user_id": row["user_id"]},
+                UpdateExpression="SET expires_at = :expires_at",
+                ExpressionAttributeValues={":expires_at": expires_at},
+                table=daily_stats_table,
+            )
 
-        return total_translations, total_votes
+    totals = {field: totals[field] for field in DAILY_STATS_FIELDS.values()}
+    for partition in (week_key(day), month_key(day)):
+        try:
+            _rollup_update(partition, GLOBAL_STATS_USER, key, totals)
+        except ClientError as e:
+            if not is_condition_failure(e):
+                raise
+
+    # Days from before the global counters existed only have per-user rows
+    counter_key = DAILY_COUNTER_KEY.format(date=key)
+    if any(totals.values()) and not any(
+        read_global_counter(counter_key, DAILY_STATS_FIELDS.values()).values()
+    ):
+        execute_db_query(
+            operation="put_item",
+            Item={"meta_key": f"{counter_key}#0", **totals},
+            ConditionExpression="attribute_not_exists(meta_key)",
+            table=meta_table,
+        )
+
+
+def compact_daily_stats(until=None):
+    """Roll every closed day up to ``until`` (default yesterday) into rollups."""
+    until = until or date.today() - timedelta(days=1)
+    try:
+        watermark = get_rollup_watermark()
+        if watermark is None:
+            first = min(
+                (
+                    item["date"]
+                    for item in scan_items(
+                        daily_stats_table, segments=SCAN_SEGMENTS, projection=["date"]
+                    )
+                    if len(item["date"]) == 10
+                ),
+                default=None,
+            )
+            if first is None:
+                return None
+            watermark = date.fromisoformat(first) - timedelta(days=1)
+
+        day = watermark + timedelta(days=1)
+        while day <= until:
+            compact_day(day)
+            execute_db_query(
+                operation="put_item",
+                Item={
+                    "meta_key": ROLLUP_WATERMARK_KEY,
+                    "compacted_through": day.isoformat(),
+                },
+                table=meta_table,
+            )
+            day += timedelta(days=1)
+        return day - timedelta(days=1)
+    except ClientError as e:
+        logger.exception("Failed to compact daily stats")
+        raise e
+
+
+def audience_user_ids(condition=None):
+    """User ids a broadcast goes to: everyone who has not blocked the bot.
+
+    This is a filtered scan of User. Nearly every user is in the audience,
+    and no key is shared by all of them, so an index would either hold the
+    whole table again or put every user under one hot partition key.
+    """
+    filter_expression = Attr("blocked").not_exists() & Attr("user_id").ne("1")
+    if condition is not None:
+        filter_expression &= condition
+    for item in scan_items(
+        user_table, projection=["user_id"], FilterExpression=filter_expression
+    ):
+        yield int(item["user_id"])
+
+
+def _broadcast_claim_key(broadcast_id, user_id):
+    return f"broadcast#{broadcast_id}#{user_id}"
+
+
+def claim_broadcast_user(broadcast_id, user_id, now=None):
+    """Record in Meta that ``broadcast_id`` is being sent to the user.
+
+    Returns False if the user was sent the message already, or another run
+    holds a pending claim on them. A pending claim whose run died between
+    the claim and the send runs out after BROADCAST_CLAIM_SECONDS, so a
+    resumed broadcast tries that user again.
+    """
+    now = int(now or time.time())
+    try:
+        execute_db_query(
+            operation="put_item",
+            Item={
+                "meta_key": _broadcast_claim_key(broadcast_id, user_id),
+                "status": "pending",
+                "claimed_until": now + BROADCAST_CLAIM_SECONDS,
+                "expires_at": now + BROADCAST_CLAIM_TTL,
+            },
+            ConditionExpression="attribute_not_exists(meta_key) OR "
+            "(#status = :pending AND claimed_until < :now)",
+            ExpressionAttributeNames={"#status": "status"},
+            ExpressionAttributeValues={":pending": "pending", ":now": now},
+            table=meta_table,
+        )
+        return True
     except ClientError as e:
-        logger.exception("Failed to get aggregated counts for the given user and day")
+        if is_condition_failure(e):
+            return False
         raise e
+
+
+def mark_broadcast_sent(broadcast_id, user_id):
+    execute_db_query(
+        operation="update_item",
+        Key={"meta_key": _broadcast_claim_key(broadcast_id, user_id)},
+        UpdateExpression="SET #status = :sent",
+        ExpressionAttributeNames={"#status": "status"},
+        ExpressionAttributeValues={":sent": "sent"},
+        table=meta_table,
+    )
+
+
+def release_broadcast_user(broadcast_id, user_id):
+    # The message never went out; let a resumed run try this user again
+    execute_db_query(
+        operation="delete_item",
+        Key={"meta_key": _broadcast_claim_key(broadcast_id, user_id)},
+        table=meta_table,
+    )
+
+
+def mark_user_blocked(user_id):
+    # Blocked users are left out of every later broadcast
+    execute_db_query(
+        operation="update_item",
+        Key={"user_id": str(user_id)},
+        UpdateExpression="SET blocked = :blocked REMOVE reminder_bucket",
+        ExpressionAttributeValues={":blocked": "True"},
+        table=user_table,
+    )
+
+
+def save_broadcast_progress(broadcast_id, counts, **fields):
+    """Add ``counts`` to the broadcast's progress item in Meta."""
+    names, values, actions = {}, {}, []
+    for i, (name, value) in enumerate(counts.items()):
+        names[f"#c{i}"] = name
+        values[f":c{i}"] = value
+        actions.append(f"#c{i} :c{i}")
+    sets = []
+    for i, (name, value) in enumerate(fields.items()):
+        names[f"#f{i}"] = name
+        values[f":f{i}"] = value
+        sets.append(f"#f{i} = :f{i}")
+    clauses = []
+    if sets:
+        clauses.append("SET " + ", ".join(sets))
+    if actions:
+        clauses.append("ADD " + ", ".join(actions))
+    if not clauses:
+        return
+    execute_db_query(
+        operation="update_item",
+        Key={"meta_key": f"broadcast#{broadcast_id}"},
+        UpdateExpression=" ".join(clauses),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+        table=meta_table,
+    )
+
+
+def interaction_time(value):
+    """Epoch seconds of a stored interaction timestamp, or None.
+
+    Older items hold ISO strings written with the local ``datetime.now()``.
+    """
+    if value is None or value == "None":
+        return None
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+    return float(value)
+
+
+def reminder_bucket(timestamp):
+    return int(timestamp) - int(timestamp) % REMINDER_BUCKET_SECONDS
+
+
+def reminder_schedule(next_reminder_at):
+    """User attributes that put the user into the reminder index.
+
+    The due time is rounded up to REMINDER_RESOLUTION_SECONDS, so the
+    interactions of one sitting leave the schedule, and the item, unchanged.
+    """
+    due = -(-int(next_reminder_at) // REMINDER_RESOLUTION_SECONDS)
+    due *= REMINDER_RESOLUTION_SECONDS
+    return {"next_reminder_at": due, "reminder_bucket": reminder_bucket(due)}
+
+
+def get_reminder_watermark():
+    response = execute_db_query(
+        operation="get_item",
+        Key={"meta_key": REMINDER_WATERMARK_KEY},
+        table=meta_table,
+    )
+    item = response.get("Item")
+    return int(item["bucket"]) if item else None
+
+
+def set_reminder_watermark(bucket):
+    execute_db_query(
+        operation="put_item",
+        Item={"meta_key": REMINDER_WATERMARK_KEY, "bucket": int(bucket)},
+        table=meta_table,
+    )
+
+
+def get_due_reminders(now=None):
+    """Users whose ``next_reminder_at`` has passed.
+
+    Users sit in the sparse reminder_bucket-next_reminder_at-index under the
+    bucket their reminder falls in, and leave it when reminded, paused or
+    blocked. A tick queries the buckets from the last tick's up to the current
+    one, so its cost follows the number of reminders due, not the user count.
+    """
+    now = int(now or time.time())
+    current = reminder_bucket(now)
+    first = get_reminder_watermark()
+    if first is None:
+        first = current - REMINDER_LOOKBACK_BUCKETS * REMINDER_BUCKET_SECONDS
+    due = []
+    try:
+        for bucket in range(first, current + 1, REMINDER_BUCKET_SECONDS):
+            due.extend(
+                query_items(
+                    user_table,
+                    IndexName=REMINDER_INDEX,
+                    KeyConditionExpression=Key("reminder_bucket").eq(bucket)
+                    & Key("next_reminder_at").lte(now),
+                )
+            )
+    except ClientError as e:
+        logger.exception("Failed to get due reminders")
+        raise e
+    return due
+
+
+def claim_reminder(user_id, bucket, next_reminder_at, now=None):
+    """Take the user out of the reminder index before their reminder is sent.
+
+    Returns False if the user interacted (rescheduling the reminder) or
+    another tick claimed it first.
+    """
+    try:
+        execute_db_query(
+            operation="update_item",
+            Key={"user_id": str(user_id)},
+            UpdateExpression="SET reminded_at = :now REMOVE reminder_bucket",
+            ConditionExpression="reminder_bucket = :bucket AND next_reminder_at = :due",
+            ExpressionAttributeValues={
+                ":now": int(now or time.time()),
+                ":bucket": int(bucket),
+                ":due": int(next_reminder_at),
+            },
+            table=user_table,
+        )
+        return True
+    except ClientError as e:
+        if is_condition_failure(e):
+            return False
+        raise e
+
+
+def release_reminder(user_id, next_reminder_at, now=None):
+    # The reminder never went out; leave it due for the next tick. The tick
+    # moves the watermark to the bucket of ``now``, so the user goes there
+    # rather than back into the bucket it was found in.
+    bucket = reminder_bucket(now or time.time())
+    try:
+        execute_db_query(
+            operation="update_item",
+            Key={"user_id": str(user_id)},
+            UpdateExpression="SET reminder_bucket = :bucket",
+            ConditionExpression="attribute_not_exists(reminder_bucket) "
+            "AND next_reminder_at = :due",
+            ExpressionAttributeValues={
+                ":bucket": int(bucket),
+                ":due": int(next_reminder_at),
+            },
+            table=user_table,
+        )
+    except ClientError as e:
+        if not is_condition_failure(e):
+            raise e
+
+
+def schedule_reminders():
+    """Put users who last interacted before the reminder index into it."""
+    now = time.time()
+    try:
+        for item in scan_items(
+            user_table,
+            segments=SCAN_SEGMENTS,
+            projection=[
+                "user_id",
+                "last_interaction_time",
+                "last_interaction_session_time",
+                "avg_interaction_interval",
+            ],
+            FilterExpression=Attr("next_reminder_at").not_exists()
+            & Attr("blocked").not_exists()
+            & Attr("state").ne("paused")
+            & Attr("paused").ne("True"),
+        ):
+            last = item.get("last_interaction_time") or item.get(
+                "last_interaction_session_time"
+            )
+            if not last:
+                continue
+            interval = item.get("avg_interaction_interval")
+            interval = (
+                float(interval)
+                if interval and interval != "None"
+                else REMINDER_DEFAULT_INTERVAL
+            )
+            due = max(interaction_time(last) + interval, now)
+            schedule = reminder_schedule(due)
+            execute_db_query(
+                operation="update_item",
+                Key={"user_id": item["user_id"]},
+                UpdateExpression="SET next_reminder_at = :due, "
+                "reminder_bucket = :bucket",
+                ExpressionAttributeValues={
+                    ":due": schedule["next_reminder_at"],
+                    ":bucket": schedule["reminder_bucket"],
+                },
+                table=user_table,
+            )
+    except ClientError as e:
+        logger.exception("Failed to schedule reminders")
+        raise e
+
+
+def claim_update(update_id, now=None):
+    """Record that this container is processing ``update_id``.
+
+    Returns "claimed", or the status of the claim already there: "done" or
+    "processing" while another delivery is being processed. A claim whose
+    processing lease ran out (the container died) is taken over.
+    """
+    now = int(now or time.time())
+    try:
+        execute_db_query(
+            operation="put_item",
+            Item={
+                "meta_key": f"update#{update_id}",
+                "status": "processing",
+                "lease_until": now + UPDATE_PROCESSING_SECONDS,
+                "expires_at": now + UPDATE_DEDUP_TTL,
+            },
+            ConditionExpression="attribute_not_exists(meta_key) OR "
+            "(#status = :processing AND lease_until < :now)",
+            ExpressionAttributeNames={"#status": "status"},
+            ExpressionAttributeValues={":processing": "processing", ":now": now},
+            table=meta_table,
+        )
+        return "claimed"
+    except ClientError as e:
+        if not is_condition_failure(e):
+            raise e
+    response = execute_db_query(
+        operation="get_item",
+        Key={"meta_key": f"update#{update_id}"},
+        ConsistentRead=True,
+        table=meta_table,
+    )
+    # A claim released in between is retried like one in progress
+    return response.get("Item", {}).get("status", "processing")
+
+
+def complete_update(update_id):
+    execute_db_query(
+        operation="update_item",
+        Key={"meta_key": f"update#{update_id}"},
+        UpdateExpression="SET #status = :done",
+        ExpressionAttributeNames={"#status": "status"},
+        ExpressionAttributeValues={":done": "done"},
+        table=meta_table,
+    )
+
+
+def release_update(update_id):
+    # Processing failed; let Telegram's retry run it again
+    execute_db_query(
+        operation="delete_item",
+        Key={"meta_key": f"update#{update_id}"},
+        table=meta_table,
+    )
+
+
+# Awaitable counterparts of the functions above for use in handlers
+get_user_data_async = async_variant(get_user_data)
+set_user_data_async = async_variant(set_user_data)
+is_user_exists_async = async_variant(is_user_exists)
+add_new_user_async = async_variant(add_new_user)
+get_user_details_async = async_variant(get_user_details)
+get_original_text_by_id_async = async_variant(get_original_text_by_id)
+get_translation_by_id_async = async_variant(get_translation_by_id)
+rebuild_untranslated_index_async = async_variant(rebuild_untranslated_index)
+get_untranslated_index_async = async_variant(get_untranslated_index)
+acquire_text_lease_async = async_variant(acquire_text_lease)
+release_text_lease_async = async_variant(release_text_lease)
+get_untranslated_text_async = async_variant(get_untranslated_text)
+batch_get_items_async = async_variant(batch_get_items)
+get_translation_for_vote_async = async_variant(get_translation_for_vote)
+backfill_vote_queue_async = async_variant(backfill_vote_queue)
+get_original_text_async = async_variant(get_original_text)
+save_contribution_async = async_variant(save_contribution)
+save_vote_async = async_variant(save_vote)
+refresh_leaderboard_snapshot_async = async_variant(refresh_leaderboard_snapshot)
+get_leaderboard_snapshot_async = async_variant(get_leaderboard_snapshot)
+get_leaderboard_data_async = async_variant(get_leaderboard_data)
+update_leaderboard_for_async = async_variant(update_leaderboard_for)
+read_global_counter_async = async_variant(read_global_counter)
+get_total_users_async = async_variant(get_total_users)
+seed_users_counter_async = async_variant(seed_users_counter)
+get_global_daily_counts_async = async_variant(get_global_daily_counts)
+update_daily_stats_async = async_variant(update_daily_stats)
+get_aggregated_counts_async = async_variant(get_aggregated_counts)
+get_rollup_watermark_async = async_variant(get_rollup_watermark)
+get_aggregated_counts_range_async = async_variant(get_aggregated_counts_range)
+get_recent_counts_async = async_variant(get_recent_counts)
+compact_day_async = async_variant(compact_day)
+compact_daily_stats_async = async_variant(compact_daily_stats)
+transact_write_async = async_variant(transact_write)
+claim_update_async = async_variant(claim_update)
+complete_update_async = async_variant(complete_update)
+release_update_async = async_variant(release_update)
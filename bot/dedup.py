@@ -0,0 +1,83 @@
+import logging
+import threading
+from collections import OrderedDict
+from config import UPDATE_DEDUP_MEMORY
+from db import claim_update_async, complete_update_async, release_update_async
+
+logger = logging.getLogger(__name__)
+
+
+class RecentUpdates:
+    """Bounded map of the update_ids this process took on to their status.
+
+    Telegram redelivers an update to the container that timed out on it as
+    often as to any other, so a warm container answers most duplicates
+    without a DynamoDB call.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, update_id):
+        with self._lock:
+            return self._ids.get(update_id)
+
+    def reserve(self, update_id):
+        """Mark ``update_id`` processing. Returns its status if already known."""
+        with self._lock:
+            if update_id in self._ids:
+                self._ids.move_to_end(update_id)
+                return self._ids[update_id]
+            self._ids[update_id] = "processing"
+            if len(self._ids) > self.size:
+                self._ids.popitem(last=False)
+            return None
+
+    def set(self, update_id, status):
+        with self._lock:
+            self._ids[update_id] = status
+
+    def discard(self, update_id):
+        with self._lock:
+            self._ids.pop(update_id, None)
+
+
+recent_updates = RecentUpdates(UPDATE_DEDUP_MEMORY)
+
+
+async def begin_update(update_id):
+    """Claim ``update_id`` for processing.
+
+    Returns "claimed", "done" for an update already processed, or
+    "processing" while another delivery of it is under way.
+    """
+    status = recent_updates.reserve(update_id)
+    if status is not None:
+        return status
+    try:
+        status = await claim_update_async(update_id)
+    finally:
+        if status == "done":
+            recent_updates.set(update_id, "done")
+        elif status != "claimed":
+            # Another container has it, and should that container die, the
+            # next retry must get as far as DynamoDB again
+            recent_updates.discard(update_id)
+    return status
+
+
+async def finish_update(update_id):
+    # Without the done mark a redelivery after the lease would run it again
+    recent_updates.set(update_id, "done")
+    try:
+        await complete_update_async(update_id)
+    except Exception:
+        # Telegram has its answer; only a stray redelivery could repeat it
+        logger.exception(f"Failed to mark update {update_id} done")
+
+
+async def abandon_update(update_id):
+    recent_updates.discard(update_id)
+    await release_update_async(update_id)
@@ -1,6 +1,10 @@
 import asyncio
+import functools
 import json
+import logging
+import time
 from telegram import Update
+from telegram.request import HTTPXRequest
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -10,7 +14,6 @@ from telegram.ext import (
 )
 from callbacks import (
     handle_text,
-    handle_contribution,
     handle_skip_contribution,
     handle_start_voting,
     handle_vote,
@@ -23,14 +26,49 @@ from commands import (
     stop_command,
     project_stats_command,
 )
-from config import TELEGRAM_BOT_TOKEN
+from config import (
+    TELEGRAM_BOT_TOKEN,
+    BOT_CONNECTION_POOL_SIZE,
+    DB_ROUND_TRIP_BUDGET,
+    DB_ROUND_TRIP_BUDGETS,
+    METRICS_NAMESPACE,
+    WEBHOOK_REPLY,
+    UPDATE_DEDUP,
+)
+from db import (
+    start_db_metrics,
+    current_db_metrics,
+    rebuild_untranslated_index,
+    backfill_vote_queue,
+    refresh_leaderboard_snapshot,
+    seed_users_counter,
+    compact_daily_stats,
+    schedule_reminders,
+    backfill_score_aggregates,
+    refresh_score_aggregates,
+    pop_lease_metrics,
+    text_cache,
+)
+from dedup import begin_update, finish_update, abandon_update
+from reminders import send_due_reminders
+from webhook_reply import WebhookReplyRequest, start_webhook_reply
 
-def lambda_handler(event, context):
-    return asyncio.get_event_loop().run_until_complete(main(event, context))
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
 
 
-async def main(event, context):
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+def build_application(request=None, webhook_reply=WEBHOOK_REPLY):
+    builder = Application.builder().token(TELEGRAM_BOT_TOKEN)
+    if webhook_reply:
+        request = WebhookReplyRequest(
+            request or HTTPXRequest(connection_pool_size=BOT_CONNECTION_POOL_SIZE)
+        )
+    if request is not None:
+        # A custom transport, e.g. the benchmark's Bot API stub
+        builder = builder.request(request)
+    else:
+        builder = builder.connection_pool_size(BOT_CONNECTION_POOL_SIZE)
+    application = builder.build()
 
     # Add handlers to the application
     application.add_handler(CommandHandler("start", start_command))
@@ -49,17 +87,211 @@ async def main(event, context):
     application.add_handler(
         MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text)
     )
-    application.add_handler(
-        MessageHandler(filters.TEXT & ~filters.COMMAND, handle_contribution)
-    )
 
-    try:
-        await application.initialize()
-        await application.process_update(
-            Update.de_json(json.loads(event["body"]), application.bot)
+    for handler in application.handlers[0]:
+        handler.callback = track_handler(handler.callback)
+
+    return application
+
+
+def track_handler(callback):
+    """Attribute the update's DynamoDB metrics to ``callback``."""
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        metrics = current_db_metrics()
+        if metrics is not None and metrics.handler is None:
+            metrics.handler = callback.__name__
+        return await callback(update, context)
+
+    return wrapper
+
+
+# Built once per container and reused by every warm invocation. The event loop
+# is kept alive as well, because the bot's HTTP connection pool is bound to it.
+loop = asyncio.new_event_loop()
+asyncio.set_event_loop(loop)
+application = build_application()
+_initialized = False
+
+
+def send_reminders():
+    return send_due_reminders(application.bot)
+
+
+# Maintenance jobs run by scheduled events carrying {"job": "<name>"}
+JOBS = {
+    "rebuild_untranslated_index": rebuild_untranslated_index,
+    "backfill_vote_queue": backfill_vote_queue,
+    "refresh_leaderboard": refresh_leaderboard_snapshot,
+    "seed_users_counter": seed_users_counter,
+    "compact_daily_stats": compact_daily_stats,
+    "schedule_reminders": schedule_reminders,
+    "backfill_score_aggregates": backfill_score_aggregates,
+    "refresh_score_aggregates": refresh_score_aggregates,
+    "send_reminders": send_reminders,
+}
+
+
+def lambda_handler(event, context):
+    return loop.run_until_complete(main(event, context))
+
+
+async def ensure_initialized():
+    """Initialize the application once per container. Returns True on cold start."""
+    global _initialized
+    if _initialized:
+        return False
+    await application.initialize()
+    _initialized = True
+    return True
+
+
+def event_kind(event):
+    if "job" in event:
+        return "job"
+    if (
+        event.get("warmup") is True
+        or event.get("source") == "aws.events"
+        or "body" not in event
+    ):
+        return "warmup"
+    return "update"
+
+
+async def run_job(name):
+    job = JOBS.get(name)
+    if job is None:
+        logger.error(f"Unknown job: {name}")
+        return {"statusCode": 400, "body": f"Unknown job: {name}"}
+    result = job()
+    if asyncio.iscoroutine(result):
+        await result
+    return {"statusCode": 200, "body": f"Job {name} done"}
+
+
+def emit_metrics(kind, metrics, cold_start, init_ms, total_ms):
+    """Print one CloudWatch embedded-metric-format record for the invocation."""
+    handler = metrics.handler or kind
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": METRICS_NAMESPACE,
+                    "Dimensions": [["Handler"]],
+                    "Metrics": [
+                        {"Name": "Duration", "Unit": "Milliseconds"},
+                        {"Name": "DbCalls", "Unit": "Count"},
+                        {"Name": "DbRetries", "Unit": "Count"},
+                        {"Name": "DbLatency", "Unit": "Milliseconds"},
+                        {"Name": "ReadCapacityUnits", "Unit": "Count"},
+                        {"Name": "WriteCapacityUnits", "Unit": "Count"},
+                    ],
+                }
+            ],
+        },
+        "Handler": handler,
+        "Duration": round(total_ms, 2),
+        "DbCalls": metrics.calls,
+        "DbRetries": metrics.retries,
+        "DbLatency": round(metrics.latency_ms, 2),
+        "ReadCapacityUnits": metrics.read_units,
+        "WriteCapacityUnits": metrics.write_units,
+        "cold_start": cold_start,
+        "event": kind,
+        "init_ms": round(init_ms, 2),
+        "leases": pop_lease_metrics(),
+        "text_cache": text_cache.stats(),
+        "db_errors": metrics.errors,
+        "db_operations": {
+            key: {**stats, "ms": round(stats["ms"], 2)}
+            for key, stats in metrics.operations.items()
+        },
+    }
+    # EMF records must be bare JSON lines on stdout
+    print(json.dumps(record), flush=True)
+
+    budget = DB_ROUND_TRIP_BUDGETS.get(handler, DB_ROUND_TRIP_BUDGET)
+    if kind == "update" and metrics.calls > budget:
+        logger.warning(
+            f"{handler} made {metrics.calls} DynamoDB round trips "
+            f"(budget {budget}): {sorted(metrics.operations)}"
         )
 
+
+async def handle_update(application, data, dedup=UPDATE_DEDUP):
+    """Run one update through the handlers and return the webhook response.
+
+    ``dedup`` claims the update_id in Meta first, two writes per update;
+    only webhook deliveries are retried and need it.
+    """
+    update_id = None
+    try:
+        if dedup and "update_id" in data:
+            # A retried delivery stops here instead of running its handler again
+            status = await begin_update(data["update_id"])
+            if status == "done":
+                current_db_metrics().handler = "duplicate"
+                return {"statusCode": 200, "body": "Duplicate"}
+            if status == "processing":
+                # The first delivery may have died with its container; Telegram
+                # retries and takes the claim over once its lease is up
+                current_db_metrics().handler = "in_progress"
+                return {"statusCode": 503, "body": "In progress"}
+            update_id = data["update_id"]
+
+        reply = start_webhook_reply() if WEBHOOK_REPLY else None
+        await application.process_update(Update.de_json(data, application.bot))
+        if update_id is not None:
+            await finish_update(update_id)
+
+        if reply is not None and reply.method is not None:
+            return {
+                "statusCode": 200,
+                "headers": {"Content-Type": "application/json"},
+                "body": reply.body(),
+            }
         return {"statusCode": 200, "body": "Success"}
 
-    except Exception as exc:
+    except Exception:
+        logger.exception("Failed to process update")
+        if update_id is not None:
+            try:
+                await abandon_update(update_id)
+            except Exception:
+                # The claim's lease runs out and lets a retry through
+                logger.exception(f"Failed to release update {update_id}")
         return {"statusCode": 500, "body": "Failure"}
+
+
+async def main(event, context):
+    started = time.perf_counter()
+    cold_start = False
+    init_ms = 0.0
+    metrics = start_db_metrics()
+
+    try:
+        cold_start = await ensure_initialized()
+        init_ms = (time.perf_counter() - started) * 1000
+
+        kind = event_kind(event)
+        if kind == "job":
+            metrics.handler = f"job:{event['job']}"
+            return await run_job(event["job"])
+        if kind == "warmup":
+            return {"statusCode": 200, "body": "Warm"}
+
+        return await handle_update(application, json.loads(event["body"]))
+
+    except Exception:
+        logger.exception("Failed to process update")
+        return {"statusCode": 500, "body": "Failure"}
+    finally:
+        emit_metrics(
+            event_kind(event),
+            metrics,
+            cold_start,
+            init_ms,
+            (time.perf_counter() - started) * 1000,
+        )
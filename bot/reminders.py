@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import time
+from broadcast import Broadcast
+from config import TELEGRAM_BOT_TOKEN, REMINDER_TICK_SECONDS
+from db import (
+    run_db,
+    reminder_bucket,
+    get_due_reminders,
+    set_reminder_watermark,
+    claim_reminder,
+    release_reminder,
+)
+from utils import REMINDER_MESSAGE
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class ReminderBroadcast(Broadcast):
+    """Send the reminder to the users found due by one tick.
+
+    Claiming takes the user out of the reminder index, so a user is reminded
+    once per idle period; their next interaction schedules the next reminder.
+    """
+
+    def __init__(self, bot, due, now):
+        super().__init__(bot, f"reminder#{reminder_bucket(now)}", REMINDER_MESSAGE)
+        self.due = {int(item["user_id"]): item for item in due}
+        self.now = now
+
+    async def claim(self, user_id):
+        item = self.due[user_id]
+        return await run_db(
+            claim_reminder,
+            user_id,
+            item["reminder_bucket"],
+            item["next_reminder_at"],
+            self.now,
+        )
+
+    async def release(self, user_id):
+        item = self.due[user_id]
+        await run_db(
+            release_reminder,
+            user_id,
+            item["next_reminder_at"],
+            self.now,
+        )
+
+    async def sent(self, user_id):
+        # Claiming took the user out of the reminder index already
+        pass
+
+    async def run(self):
+        return await super().run(list(self.due))
+
+
+async def send_due_reminders(bot, now=None):
+    """Remind every user who is due. One tick of the reminder scheduler."""
+    now = int(now or time.time())
+    due = await run_db(get_due_reminders, now)
+    counts = {}
+    if due:
+        counts = await ReminderBroadcast(bot, due, now).run()
+    await run_db(set_reminder_watermark, reminder_bucket(now))
+    return counts
+
+
+async def run_scheduler(bot, interval=REMINDER_TICK_SECONDS):
+    """Tick forever, for processes that outlive a single Lambda invocation."""
+    while True:
+        started = time.monotonic()
+        try:
+            await send_due_reminders(bot)
+        except Exception:
+            logger.exception("Reminder tick failed")
+        await asyncio.sleep(max(0, interval - (time.monotonic() - started)))
+
+
+async def main():
+    from telegram import Bot
+
+    async with Bot(token=TELEGRAM_BOT_TOKEN) as bot:
+        await run_scheduler(bot)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -1,17 +1,49 @@
+import functools
 import logging
 import json
-from datetime import datetime
-from db import get_user_data, set_user_data, get_aggregated_counts
-from config import VOTING_SESSION_THRESHOLD
+import time
+from conversation import PAUSED, get_state
+from db import get_user_session, user_session, reminder_schedule, interaction_time
+from config import VOTING_SESSION_THRESHOLD, REMINDER_DEFAULT_INTERVAL
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.ERROR)
 
 
+def with_user_session(handler):
+    """Run ``handler`` inside a user session that is flushed once it returns."""
+
+    @functools.wraps(handler)
+    async def wrapper(update, context, *args, **kwargs):
+        async with user_session(update.effective_user.id):
+            return await handler(update, context, *args, **kwargs)
+
+    return wrapper
+
+
+def with_interaction(handler):
+    """Like :func:`with_user_session`, for handlers of the user's own actions.
+
+    The session is loaded by the write that stamps the interaction, see
+    :func:`record_interaction`.
+    """
+
+    @functools.wraps(handler)
+    async def wrapper(update, context, *args, **kwargs):
+        user_id = update.effective_user.id
+        async with user_session(user_id, load=False):
+            await record_interaction(user_id)
+            return await handler(update, context, *args, **kwargs)
+
+    return wrapper
+
+
+REMINDER_MESSAGE = "Hi! It's been a while since your last voting session.\n\nYour votes help ensure the quality of the 🐬 Echopod dataset.\n\nTake a moment to review some translations today! 🙏🐬"
+
+
 async def send_reminder_message(context, user_id):
-    message = "Hi! It's been a while since your last voting session.\n\nYour votes help ensure the quality of the 🐬 Echopod dataset.\n\nTake a moment to review some translations today! 🙏🐬"
-    await send_message(context, user_id, message)
+    await send_message(context, user_id, REMINDER_MESSAGE)
 
 
 async def send_message(context, user_id, message, reply_markup=None):
@@ -42,79 +74,73 @@ async def handle_command_error(context, error, command_name, user_id):
     }
 
 
-def check_threshold(user_id, type="contribution"):
-    today = datetime.now().strftime("%Y-%m-%d")
-    total_translations, total_votes = get_aggregated_counts(today, user_id)
-
-    milestones = {
-        "contribution": {
-            10: "🐬\nကျေးဇူးတင်ပါတယ်!\n\nခဏလောက် မျက်စိအနားပေးလိုက်ပါဦးနော်...😌",
-            25: "🐬\n၁၀ မိနစ်လောက် နားဦးလေ\n\nတစ်ထိုင်ထဲ အများကြီးလုပ်ရင် ပင်ပန်းနေမှာစိုးလို့ပါ ❤️",
-            35: "🐬\nကျေးဇူးအများကြီးတင်ပါတယ်!\n\nဒီနေ့အတွက် နားမယ်ဆိုရင်၊ နားလိုက်တော့နော်...\nတစ်ထိုင်ထဲ အများကြီးလုပ်ရင် ပင်ပန်းမှာစိုးလို့ပါ ❤️",
-            50: "🐬\nကဲ.. မနားသေးဘူးကိုး\n\nဒီနေ့အတွက် {count}ခုတောင် ဘာသာပြန်ပေးထားတာ...\n\nနားလိုက်ပါတော့နော်...❤️\n\nတစ်နေ့ကိုနည်းနည်းစီ ပုံမှန်လုပ်ဖို့က ပိုအရေးကြီးတာမလို့၊ မနက်ဖြန်ကြရင်ထပ်တွေ့မယ်လေ... ❤️",
-        },
-        "vote": {
-            10: "🐬\nကျေးဇူးတင်ပါတယ်!\n\nခဏလောက် မျက်စိအနားပေးလိုက်ပါဦးနော်...😌",
-            30: "🐬\n၅ မိနစ်လောက် နားဦးလေ\n\nတစ်ထိုင်ထဲ အများကြီးလုပ်ရင် ပင်ပန်းနေမှာစိုးလို့ပါ ❤️",
-            50: "🐬\nကျေးဇူးအများကြီးတင်ပါတယ်!\n\nဒီနေ့အတွက် {count}တောင်အမှတ်ပေးလိုက်တာ...\n\nနားမယ်ဆိုရင်၊ နားလိုက်တော့နော်...❤️\n\nတစ်နေ့ကိုနည်းနည်းစီ ပုံမှန်လုပ်ဖို့က ပိုအရေးကြီးတာမလို့၊ မနက်ဖြန်ကြရင်ထပ်တွေ့မယ်လေ...",
-            100: "🐬\nကဲ.. မနားသေးဘူးကို\nကျေးဇူးအများကြီးတင်ပါတယ်ဗျာ!\n\nဒါပေမယ့် ဒီတစ်ခါတော့ တကယ်နားလိုက်ပါတော့\n\nဒီနေ့အတွက် {count}ခုတောင် အမှတ်ပေးပြီးသွားပြီလေ...\n\nနားလိုက်ပါတော့.. လိမ္မာပါတယ်..\n\nမနက်ဖြန်ကြရင်တော့ ထပ်ပြီးကူပေးဖို့ မမေ့ရဘူးနော်...",
-        },
-    }
-
-    count = int(total_translations) if type == "contribution" else int(total_votes)
-
-    if count in milestones[type]:
-        milestone_message = milestones[type][count].format(count=count)
+# Daily milestones per activity, keyed by today's count
+_MILESTONE_TEMPLATES = {
+    "contribution": {
+        10: "🐬\nကျေးဇူးတင်ပါတယ်!\n\nခဏလောက် မျက်စိအနားပေးလိုက်ပါဦးနော်...😌",
+        25: "🐬\n၁၀ မိနစ်လောက် နားဦးလေ\n\nတစ်ထိုင်ထဲ အများကြီးလုပ်ရင် ပင်ပန်းနေမှာစိုးလို့ပါ ❤️",
+        35: "🐬\nကျေးဇူးအများကြီးတင်ပါတယ်!\n\nဒီနေ့အတွက် နားမယ်ဆိုရင်၊ နားလိုက်တော့နော်...\nတစ်ထိုင်ထဲ အများကြီးလုပ်ရင် ပင်ပန်းမှာစိုးလို့ပါ ❤️",
+        50: "🐬\nကဲ.. မနားသေးဘူးကိုး\n\nဒီနေ့အတွက် {count}ခုတောင် ဘာသာပြန်ပေးထားတာ...\n\nနားလိုက်ပါတော့နော်...❤️\n\nတစ်နေ့ကိုနည်းနည်းစီ ပုံမှန်လုပ်ဖို့က ပိုအရေးကြီးတာမလို့၊ မနက်ဖြန်ကြရင်ထပ်တွေ့မယ်လေ... ❤️",
+    },
+    "vote": {
+        10: "🐬\nကျေးဇူးတင်ပါတယ်!\n\nခဏလောက် မျက်စိအနားပေးလိုက်ပါဦးနော်...😌",
+        30: "🐬\n၅ မိနစ်လောက် နားဦးလေ\n\nတစ်ထိုင်ထဲ အများကြီးလုပ်ရင် ပင်ပန်းနေမှာစိုးလို့ပါ ❤️",
+        50: "🐬\nကျေးဇူးအများကြီးတင်ပါတယ်!\n\nဒီနေ့အတွက် {count}တောင်အမှတ်ပေးလိုက်တာ...\n\nနားမယ်ဆိုရင်၊ နားလိုက်တော့နော်...❤️\n\nတစ်နေ့ကိုနည်းနည်းစီ ပုံမှန်လုပ်ဖို့က ပိုအရေးကြီးတာမလို့၊ မနက်ဖြန်ကြရင်ထပ်တွေ့မယ်လေ...",
+        100: "🐬\nကဲ.. မနားသေးဘူးကို\nကျေးဇူးအများကြီးတင်ပါတယ်ဗျာ!\n\nဒါပေမယ့် ဒီတစ်ခါတော့ တကယ်နားလိုက်ပါတော့\n\nဒီနေ့အတွက် {count}ခုတောင် အမှတ်ပေးပြီးသွားပြီလေ...\n\nနားလိုက်ပါတော့.. လိမ္မာပါတယ်..\n\nမနက်ဖြန်ကြရင်တော့ ထပ်ပြီးကူပေးဖို့ မမေ့ရဘူးနော်...",
+    },
+}
+
+MILESTONES = {
+    type: {count: template.format(count=count) for count, template in table.items()}
+    for type, table in _MILESTONE_TEMPLATES.items()
+}
+
+
+def check_threshold(counts, type="contribution"):
+    """Return (True, message) if ``counts`` (today's counters as returned by
+    save_contribution/save_vote) just reached a milestone."""
+    if not counts:
+        return False, None
+
+    field = "translations_count" if type == "contribution" else "votes_count"
+    milestone_message = MILESTONES[type].get(counts[field])
+    if milestone_message:
         return True, milestone_message
 
     return False, None
 
 
-def calculate_interaction_interval(user_id):
-    current_time = datetime.now()
-    last_interaction_time = get_user_data(user_id, "last_interaction_time")
-    last_interaction_session_time = get_user_data(
-        user_id, "last_interaction_session_time"
-    )
-
-    if last_interaction_time:
-        last_interaction_time = datetime.fromisoformat(last_interaction_time)
-        interaction_interval = (current_time - last_interaction_time).total_seconds()
-    else:
-        interaction_interval = None
-
-    if last_interaction_session_time:
-        last_interaction_session_time = datetime.fromisoformat(
-            last_interaction_session_time
-        )
-        session_interval = (
-            current_time - last_interaction_session_time
-        ).total_seconds()
-
-        if session_interval > VOTING_SESSION_THRESHOLD:
-            set_user_data(
-                user_id, "last_interaction_session_time", current_time.isoformat()
-            )
-            return interaction_interval
-        else:
-            return None
-    else:
-        set_user_data(
-            user_id, "last_interaction_session_time", current_time.isoformat()
-        )
-        return None
+async def record_interaction(user_id, now=None):
+    """Stamp the interaction and keep the user's usual interval up to date.
 
+    The stamp is written by the same ``update_item`` that loads the session,
+    and the interval since the previous interaction is worked out from the
+    values it returns. Only the first interaction of a new session (after
+    VOTING_SESSION_THRESHOLD) counts toward the average interval.
+    """
+    session = get_user_session(user_id)
+    now = int(now or time.time())
+    previous = await session.touch_async(last_interaction_time=now)
+    last_interaction_time = interaction_time(previous.get("last_interaction_time"))
+    last_session_time = interaction_time(previous.get("last_interaction_session_time"))
 
-def update_avg_interaction_interval(user_id, interval):
-    default_interval = 24 * 60 * 60  # 24 hours in seconds
+    interval = None
+    if last_session_time is None or now - last_session_time > VOTING_SESSION_THRESHOLD:
+        session.set("last_interaction_session_time", now)
+        if last_session_time is not None and last_interaction_time is not None:
+            interval = now - last_interaction_time
 
-    avg_interval = get_user_data(user_id, "avg_interaction_interval")
+    avg_interval = previous.get("avg_interaction_interval")
     avg_interval = (
         float(avg_interval)
         if avg_interval and avg_interval != "None"
-        else default_interval
+        else REMINDER_DEFAULT_INTERVAL
     )
-
-    new_avg_interval = (avg_interval + interval) / 2 if interval else avg_interval
-
-    set_user_data(user_id, "avg_interaction_interval", str(new_avg_interval))
+    if interval:
+        avg_interval = (avg_interval + interval) / 2
+    session.set("avg_interaction_interval", int(avg_interval))
+
+    # Remind the user once they have been away for their usual interval
+    if get_state(session) != PAUSED:
+        session.update(**reminder_schedule(now + avg_interval))
+    return interval
@@ -0,0 +1,105 @@
+import contextvars
+import json
+import time
+from telegram.request import BaseRequest
+
+# Bot API methods that can be sent back as the webhook response. Telegram
+# does not report their result, so only methods whose result handlers ignore
+# are eligible, and sendMessage gets a stand-in Message.
+REPLY_METHODS = {"sendMessage", "answerCallbackQuery"}
+
+_webhook_reply = contextvars.ContextVar("webhook_reply", default=None)
+
+
+class WebhookReply:
+    """The Bot API call held back for the response to the current update."""
+
+    def __init__(self):
+        self.method = None
+        self.parameters = None
+        self.pending = None
+
+    def body(self):
+        if self.method is None:
+            return None
+        return json.dumps({"method": self.method, **self.parameters})
+
+
+def start_webhook_reply():
+    reply = WebhookReply()
+    _webhook_reply.set(reply)
+    return reply
+
+
+class WebhookReplyRequest(BaseRequest):
+    """Hold one outbound call per update for the webhook response.
+
+    Telegram runs a method call found in the body of a webhook response,
+    which saves that call's HTTPS round trip. The held call goes out after
+    everything else the handler sends, so a held sendMessage is released
+    as soon as another call is made, keeping messages in order, and the
+    newest eligible call is held in its place. A held answerCallbackQuery
+    does not depend on order and stays held.
+    """
+
+    def __init__(self, request):
+        self.request = request
+
+    @property
+    def read_timeout(self):
+        return self.request.read_timeout
+
+    async def initialize(self):
+        await self.request.initialize()
+
+    async def shutdown(self):
+        await self.request.shutdown()
+
+    async def do_request(
+        self,
+        url,
+        method,
+        request_data=None,
+        read_timeout=BaseRequest.DEFAULT_NONE,
+        write_timeout=BaseRequest.DEFAULT_NONE,
+        connect_timeout=BaseRequest.DEFAULT_NONE,
+        pool_timeout=BaseRequest.DEFAULT_NONE,
+    ):
+        timeouts = {
+            "read_timeout": read_timeout,
+            "write_timeout": write_timeout,
+            "connect_timeout": connect_timeout,
+            "pool_timeout": pool_timeout,
+        }
+        reply = _webhook_reply.get()
+        if reply is None:
+            return await self.request.do_request(url, method, request_data, **timeouts)
+
+        endpoint = url.rsplit("/", 1)[-1]
+        if reply.method == "sendMessage":
+            held, reply.method = reply.pending, None
+            await self.request.do_request(*held, **timeouts)
+
+        if (
+            reply.method is None
+            and endpoint in REPLY_METHODS
+            and request_data is not None
+            and not request_data.contains_files
+        ):
+            reply.method = endpoint
+            reply.parameters = request_data.parameters
+            reply.pending = (url, method, request_data)
+            return 200, json.dumps({"ok": True, "result": _result(reply)}).encode()
+
+        return await self.request.do_request(url, method, request_data, **timeouts)
+
+
+def _result(reply):
+    if reply.method != "sendMessage":
+        return True
+    return {
+        "message_id": 0,
+        "date": int(time.time()),
+        "chat": {"id": int(reply.parameters["chat_id"]), "type": "private"},
+        "text": reply.parameters.get("text", ""),
+    }
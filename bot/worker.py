@@ -0,0 +1,370 @@
+"""Run the bot as one long-running process instead of a Lambda per update.
+
+Updates come from getUpdates (``polling``) or from Telegram's POSTs to a
+small built-in HTTP server (``webhook``), and are processed concurrently on
+one event loop with the same handlers, caches and DB layer as the Lambda.
+
+    python bot/worker.py polling --delete-webhook
+    python bot/worker.py webhook --port 8080 --url https://bot.example.com/
+    python bot/worker.py polling --reminders
+
+At most WORKER_CONCURRENCY updates run at once, and the updates of one
+user run one at a time, in the order they arrived, because they share the
+user's item and conversation state. SIGINT or SIGTERM stops taking updates
+and waits up to WORKER_DRAIN_SECONDS for those in progress. Raise
+BOT_CONNECTION_POOL_SIZE and DB_MAX_POOL_CONNECTIONS with the concurrency.
+"""
+
+import argparse
+import asyncio
+import functools
+import hmac
+import json
+import logging
+import signal
+import time
+from telegram.error import Conflict, InvalidToken, RetryAfter, TelegramError
+from config import (
+    UPDATE_DEDUP,
+    WEBHOOK_REPLY,
+    WEBHOOK_SECRET_TOKEN,
+    WORKER_CONCURRENCY,
+    WORKER_MAX_PENDING,
+    WORKER_POLL_TIMEOUT,
+    WORKER_DRAIN_SECONDS,
+    WORKER_HOST,
+    WORKER_PORT,
+)
+from db import start_db_metrics
+from main_function import build_application, handle_update, emit_metrics
+from reminders import run_scheduler
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def order_key(data):
+    """The user whose updates must not overtake each other."""
+    for value in data.values():
+        if isinstance(value, dict):
+            sender = value.get("from") or value.get("user") or value.get("chat")
+            if sender:
+                return sender["id"]
+    return data.get("update_id")
+
+
+class UpdateDispatcher:
+    """Process updates concurrently, one at a time per user."""
+
+    def __init__(self, application, concurrency=WORKER_CONCURRENCY, dedup=True):
+        self.application = application
+        self.dedup = dedup
+        self.slots = asyncio.Semaphore(concurrency)
+        # The last update submitted per user; the next one waits for it
+        self.tails = {}
+        self.tasks = set()
+        # update_ids submitted and not finished; a cancelled one stays here
+        self.in_flight = set()
+
+    @property
+    def pending(self):
+        return len(self.tasks)
+
+    def submit(self, data):
+        key = order_key(data)
+        task = asyncio.create_task(self._process(data, self.tails.get(key)))
+        self.tails[key] = task
+        self.tasks.add(task)
+        update_id = data.get("update_id")
+        if update_id is not None:
+            self.in_flight.add(update_id)
+        task.add_done_callback(functools.partial(self._done, key, update_id))
+        return task
+
+    def _done(self, key, update_id, task):
+        self.tasks.discard(task)
+        if self.tails.get(key) is task:
+            del self.tails[key]
+        if not task.cancelled():
+            self.in_flight.discard(update_id)
+
+    async def _process(self, data, previous):
+        if previous is not None:
+            await asyncio.wait([previous])
+        async with self.slots:
+            started = time.perf_counter()
+            metrics = start_db_metrics()
+            try:
+                return await handle_update(self.application, data, self.dedup)
+            finally:
+                emit_metrics(
+                    "update",
+                    metrics,
+                    False,
+                    0.0,
+                    (time.perf_counter() - started) * 1000,
+                )
+
+    async def wait_for_room(self, limit):
+        while len(self.tasks) >= limit:
+            await asyncio.wait(self.tasks, return_when=asyncio.FIRST_COMPLETED)
+
+    async def drain(self, timeout):
+        """Wait for the updates in progress. Returns how many were cut off."""
+        if not self.tasks:
+            return 0
+        _, unfinished = await asyncio.wait(self.tasks, timeout=timeout)
+        for task in unfinished:
+            task.cancel()
+        return len(unfinished)
+
+
+async def poll(bot, dispatcher, stopping, timeout=WORKER_POLL_TIMEOUT):
+    """Feed getUpdates to the dispatcher until ``stopping`` is set.
+
+    An update is only confirmed to Telegram once it and every update before
+    it have been processed, so the updates a crash cuts off come again.
+    Returns the offset after the last update handed to the dispatcher.
+    """
+    offset = None
+    while not stopping.is_set():
+        await dispatcher.wait_for_room(WORKER_MAX_PENDING)
+        confirm = min(dispatcher.in_flight, default=offset)
+        fetch = asyncio.ensure_future(bot.get_updates(offset=confirm, timeout=timeout))
+        stop = asyncio.ensure_future(stopping.wait())
+        await asyncio.wait({fetch, stop}, return_when=asyncio.FIRST_COMPLETED)
+        stop.cancel()
+        if not fetch.done():
+            # Updates of a cancelled call are not confirmed and come again
+            fetch.cancel()
+            break
+        try:
+            updates = fetch.result()
+        except (Conflict, InvalidToken):
+            raise
+        except RetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            continue
+        except TelegramError:
+            logger.exception("getUpdates failed")
+            await asyncio.sleep(1)
+            continue
+        fresh = [u for u in updates if offset is None or u.update_id >= offset]
+        for update in fresh:
+            dispatcher.submit(update.to_dict())
+            offset = update.update_id + 1
+        if updates and not fresh and dispatcher.pending:
+            # Only updates still in progress came back; wait for one to finish
+            await dispatcher.wait_for_room(dispatcher.pending)
+    return offset
+
+
+class WebhookServer:
+    """Minimal HTTP/1.1 endpoint for Telegram's webhook POSTs.
+
+    A POST is answered once its update has been processed, so a reply held
+    back with WEBHOOK_REPLY goes out in the response, and Telegram's
+    max_connections bounds the deliveries in flight. ``GET /health`` is
+    answered for load balancers.
+    """
+
+    REASONS = {
+        200: "OK",
+        400: "Bad Request",
+        403: "Forbidden",
+        404: "Not Found",
+        405: "Method Not Allowed",
+        500: "Internal Server Error",
+        503: "Service Unavailable",
+    }
+
+    def __init__(self, dispatcher, host, port, path="/", secret_token=None):
+        self.dispatcher = dispatcher
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self.server = None
+        self.closing = False
+        self.connections = set()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, self.host, self.port)
+        logger.info(f"Listening for webhook updates on {self.host}:{self.port}")
+
+    def stop_accepting(self):
+        self.closing = True
+        self.server.close()
+
+    async def close(self):
+        for writer in list(self.connections):
+            writer.close()
+        await self.server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        self.connections.add(writer)
+        try:
+            while not self.closing:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                response = await self._respond(method, path, headers, body)
+                keep_alive = (
+                    headers.get("connection", "").lower() != "close"
+                    and not self.closing
+                )
+                writer.write(self._encode(response, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+    async def _respond(self, method, path, headers, body):
+        if method == "GET" and path == "/health":
+            return {"statusCode": 200, "body": "OK"}
+        if path.split("?", 1)[0] != self.path:
+            return {"statusCode": 404, "body": ""}
+        if method != "POST":
+            return {"statusCode": 405, "body": ""}
+        if self.secret_token and not hmac.compare_digest(
+            headers.get("x-telegram-bot-api-secret-token", ""), self.secret_token
+        ):
+            return {"statusCode": 403, "body": ""}
+        if self.closing or self.dispatcher.pending >= WORKER_MAX_PENDING:
+            # Telegram delivers the update again later
+            return {"statusCode": 503, "body": ""}
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return {"statusCode": 400, "body": ""}
+        return await self.dispatcher.submit(data)
+
+    def _encode(self, response, keep_alive):
+        status = response["statusCode"]
+        payload = (response.get("body") or "").encode("utf-8")
+        headers = {
+            "Content-Type": "text/plain; charset=utf-8",
+            **response.get("headers", {}),
+            "Content-Length": str(len(payload)),
+            "Connection": "keep-alive" if keep_alive else "close",
+        }
+        lines = [f"HTTP/1.1 {status} {self.REASONS.get(status, '')}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + payload
+
+
+async def run(
+    mode,
+    host=WORKER_HOST,
+    port=WORKER_PORT,
+    path="/",
+    url=None,
+    delete_webhook=False,
+    reminders=False,
+    concurrency=WORKER_CONCURRENCY,
+):
+    application = build_application(webhook_reply=WEBHOOK_REPLY and mode == "webhook")
+    await application.initialize()
+    bot = application.bot
+    # getUpdates hands out each update once the offset moves past it, and
+    # the offset only moves past finished ones, so polling skips the Meta
+    # claim that guards against webhook retries
+    dispatcher = UpdateDispatcher(
+        application, concurrency, dedup=UPDATE_DEDUP and mode == "webhook"
+    )
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    background = []
+    if reminders:
+        background.append(asyncio.create_task(run_scheduler(bot)))
+
+    server = None
+    offset = None
+    try:
+        if mode == "polling":
+            if delete_webhook:
+                await bot.delete_webhook()
+            logger.info("Polling for updates")
+            offset = await poll(bot, dispatcher, stopping)
+        else:
+            server = WebhookServer(dispatcher, host, port, path, WEBHOOK_SECRET_TOKEN)
+            await server.start()
+            if url:
+                await bot.set_webhook(
+                    url,
+                    secret_token=WEBHOOK_SECRET_TOKEN,
+                    max_connections=min(concurrency, 100),
+                )
+            await stopping.wait()
+            server.stop_accepting()
+
+        logger.info(f"Stopping, waiting for {dispatcher.pending} updates")
+        unfinished = await dispatcher.drain(WORKER_DRAIN_SECONDS)
+        if unfinished:
+            logger.warning(f"Gave up on {unfinished} updates")
+        if offset is not None and not unfinished:
+            # Confirm the last updates so they are not fetched again on restart;
+            # after a cut-off the cancelled ones must come again instead
+            await bot.get_updates(offset=offset, limit=1, timeout=0)
+    finally:
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        if server is not None:
+            await server.close()
+        await application.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("mode", choices=["polling", "webhook"])
+    parser.add_argument("--host", default=WORKER_HOST)
+    parser.add_argument("--port", type=int, default=WORKER_PORT)
+    parser.add_argument("--path", default="/", help="path Telegram posts to")
+    parser.add_argument("--url", help="public URL to register as the webhook")
+    parser.add_argument(
+        "--delete-webhook",
+        action="store_true",
+        help="remove the webhook first; getUpdates fails while one is set",
+    )
+    parser.add_argument(
+        "--reminders", action="store_true", help="also run the reminder scheduler"
+    )
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(
+        run(
+            args.mode,
+            host=args.host,
+            port=args.port,
+            path=args.path,
+            url=args.url,
+            delete_webhook=args.delete_webhook,
+            reminders=args.reminders,
+            concurrency=args.concurrency,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import os
+import sys
 import boto3
 from datetime import datetime, timedelta
 import seaborn as sns
@@ -7,13 +9,40 @@ import numpy as np
 import pandas as pd
 
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bot"))
+from db import scan_items, ScanStats, interaction_time
+
 # Retrieve data from DynamoDB
 dynamodb = boto3.resource("dynamodb", region_name="us-east-2")
 table = dynamodb.Table("echopod_User")
-response = table.scan(
-    ProjectionExpression="user_id, auto_contribute, auto_vote, avg_interaction_interval, contribute_mode, contribute_text_id, contributions, last_interaction_session_time, last_interaction_time, paused, saw_best_practices, username, votings"
+scan_stats = ScanStats()
+items = list(
+    scan_items(
+        table,
+        segments=4,
+        projection=[
+            "user_id",
+            "auto_contribute",
+            "auto_vote",
+            "avg_interaction_interval",
+            "contribute_mode",
+            "contribute_text_id",
+            "contributions",
+            "last_interaction_session_time",
+            "last_interaction_time",
+            "paused",
+            "saw_best_practices",
+            "username",
+            "votings",
+        ],
+        stats=scan_stats,
+    )
 )
-items = response["Items"]
+print(f"Loaded {len(items)} users: {scan_stats}")
+
+
+def interaction_datetime(value):
+    return datetime.fromtimestamp(interaction_time(value))
 
 
 def plot_something():
@@ -32,10 +61,10 @@ def plot_something():
             continue
 
         if "last_interaction_session_time" in item and "last_interaction_time" in item:
-            last_interaction_session_time = datetime.fromisoformat(
+            last_interaction_session_time = interaction_datetime(
                 item["last_interaction_session_time"]
             )
-            last_interaction_time = datetime.fromisoformat(
+            last_interaction_time = interaction_datetime(
                 item["last_interaction_time"]
             )
             interaction_interval = (
@@ -81,7 +110,7 @@ def plot_something():
 
     # Temporal Analysis
     interaction_timestamps = [
-        datetime.fromisoformat(item["last_interaction_time"])
+        interaction_datetime(item["last_interaction_time"])
         for item in items
         if "last_interaction_time" in item
     ]
@@ -130,7 +159,7 @@ def interaction_since_bot_publish():
         2024, 4, 19
     )  # Assuming the bot was released on January 1, 2023
     interaction_dates = [
-        datetime.fromisoformat(item["last_interaction_time"]).date()
+        interaction_datetime(item["last_interaction_time"]).date()
         for item in items
         if "last_interaction_time" in item
     ]
@@ -169,13 +198,13 @@ def retention_chart():
     for item in items:
         if 'user_id' in item and 'last_interaction_time' in item:
             user_id = item['user_id']
-            interaction_date = datetime.fromisoformat(item['last_interaction_time']).date()
+            interaction_date = interaction_datetime(item['last_interaction_time']).date()
             if user_id not in first_interaction_dates:
                 first_interaction_dates[user_id] = interaction_date
 
     retention_data = []
     for user_id, first_date in first_interaction_dates.items():
-        user_interactions = [datetime.fromisoformat(item['last_interaction_time']).date() for item in items if 'user_id' in item and item['user_id'] == user_id]
+        user_interactions = [interaction_datetime(item['last_interaction_time']).date() for item in items if 'user_id' in item and item['user_id'] == user_id]
         for days_since_first in range(7):
             target_date = first_date + timedelta(days=days_since_first)
             if target_date in user_interactions:
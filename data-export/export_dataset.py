@@ -0,0 +1,248 @@
+"""Export the English-Burmese pairs with their vote aggregates.
+
+The first run (or --full) reads every translation that can pass the score
+filter from the quality_band-mean_score-index (or, with --min-votes 0, the
+whole table with a parallel scan). Later runs read only the translations saved or voted on since
+the previous run, from the day-partitioned updated_day-updated_at-index, and
+move the high-water mark in Meta forward. A pair that gets new votes is
+exported again with its new aggregates, so consumers should keep the latest
+row per translation_id.
+
+    python data-export/export_dataset.py out/
+    python data-export/export_dataset.py out/ --format jsonl --format parquet
+    python data-export/export_dataset.py out/ --full --min-votes 0
+
+Rows are written to ``<out>/<run>/part-NNNNN.<ext>`` shards of at most
+--shard-rows rows. Parquet output needs pyarrow. Vote aggregates come from
+vote_count and score_sum on each translation; run the
+backfill_score_aggregates job once for translations voted on before they
+were recorded. A voted translation enters the quality_band-mean_score-index
+once the scheduled refresh_score_aggregates job has derived its mean.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bot"))
+from config import SCAN_SEGMENTS, VOTE_TARGET
+from db import (
+    QUALITY_BANDS,
+    scan_items,
+    translation_table,
+    get_translations_by_quality,
+    get_changed_translations,
+    get_export_watermark,
+    set_export_watermark,
+)
+
+logger = logging.getLogger(__name__)
+
+# Contributions are saved with their message's date and votes with the time
+# their callback reached the bot; both can trail the write by a few minutes
+# when Telegram retries, so a run stops short of now
+EXPORT_LAG_SECONDS = 15 * 60
+
+COLUMNS = [
+    ("translation_id", "int64"),
+    ("original_text_id", "int64"),
+    ("source_lang", "string"),
+    ("source_text", "string"),
+    ("target_lang", "string"),
+    ("target_text", "string"),
+    ("votes", "int64"),
+    ("mean_score", "float64"),
+    ("updated_at", "int64"),
+]
+
+
+def dataset_row(item, source_lang):
+    votes = int(item.get("vote_count", 0))
+    score_sum = item.get("score_sum")
+    return {
+        "translation_id": int(item["translation_id"]),
+        "original_text_id": int(item["original_text_id"]),
+        "source_lang": source_lang,
+        "source_text": item["original_text"],
+        "target_lang": item["lang"],
+        "target_text": item["text"],
+        "votes": votes,
+        "mean_score": float(score_sum) / votes if votes and score_sum else None,
+        "updated_at": int(item["updated_at"]) if "updated_at" in item else None,
+    }
+
+
+def approved(row, min_votes, min_score):
+    if row["votes"] < min_votes:
+        return False
+    return min_votes == 0 or (row["mean_score"] or 0) >= min_score
+
+
+def voted_candidates(min_score):
+    """Voted translations in every quality band that reaches ``min_score``."""
+    ceiling = None
+    for band, floor in QUALITY_BANDS:
+        if ceiling is None or min_score < ceiling:
+            yield from get_translations_by_quality(band, min_score=min_score)
+        ceiling = floor
+
+
+class JsonlShard:
+    extension = "jsonl"
+
+    def __init__(self, path):
+        self.file = open(path, "w", encoding="utf-8")
+
+    def write(self, row):
+        self.file.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetShard:
+    """Buffers ``batch_rows`` rows and writes each batch as a row group."""
+
+    extension = "parquet"
+    batch_rows = 10000
+
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.schema = pa.schema([(name, type) for name, type in COLUMNS])
+        self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_rows:
+            self._flush()
+
+    def _flush(self):
+        if self.rows:
+            table = self.pa.Table.from_pylist(self.rows, schema=self.schema)
+            self.writer.write_table(table)
+            self.rows = []
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+
+
+class ShardedOutput:
+    """Spread rows over numbered shard files, one set per format."""
+
+    FORMATS = {"jsonl": JsonlShard, "parquet": ParquetShard}
+
+    def __init__(self, directory, formats, shard_rows):
+        self.directory = directory
+        self.formats = [self.FORMATS[name] for name in formats]
+        self.shard_rows = shard_rows
+        self.shards = []
+        self.shard_count = 0
+        self.rows = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, row):
+        if self.rows % self.shard_rows == 0:
+            self._rotate()
+        for shard in self.shards:
+            shard.write(row)
+        self.rows += 1
+
+    def _rotate(self):
+        self._close_shards()
+        self.shards = [
+            shard(
+                os.path.join(
+                    self.directory, f"part-{self.shard_count:05d}.{shard.extension}"
+                )
+            )
+            for shard in self.formats
+        ]
+        self.shard_count += 1
+
+    def _close_shards(self):
+        for shard in self.shards:
+            shard.close()
+        self.shards = []
+
+    def close(self):
+        self._close_shards()
+
+
+def export_dataset(
+    out,
+    formats=("jsonl",),
+    full=False,
+    min_votes=VOTE_TARGET,
+    min_score=3.5,
+    source_lang="en",
+    shard_rows=100000,
+):
+    until = int(time.time()) - EXPORT_LAG_SECONDS
+    since = None if full else get_export_watermark()
+    if since is None:
+        if min_votes:
+            items = voted_candidates(min_score)
+        else:
+            items = scan_items(translation_table, segments=SCAN_SEGMENTS)
+        run = f"full-{until}"
+    else:
+        items = get_changed_translations(since, until)
+        run = f"{since}-{until}"
+
+    output = ShardedOutput(os.path.join(out, run), formats, shard_rows)
+    read = 0
+    try:
+        for item in items:
+            read += 1
+            # Rows the bot writes after ``until`` belong to the next run
+            if since is None or int(item.get("updated_at", 0)) <= until:
+                row = dataset_row(item, source_lang)
+                if approved(row, min_votes, min_score):
+                    output.write(row)
+    finally:
+        output.close()
+
+    set_export_watermark(until)
+    logger.info(f"Read {read} translations, exported {output.rows} to {run}")
+    return output.rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("out", help="directory the run's shards are written to")
+    parser.add_argument(
+        "--format",
+        action="append",
+        choices=sorted(ShardedOutput.FORMATS),
+        help="jsonl (default) and/or parquet",
+    )
+    parser.add_argument("--full", action="store_true", help="ignore the watermark")
+    parser.add_argument("--min-votes", type=int, default=VOTE_TARGET)
+    parser.add_argument("--min-score", type=float, default=3.5)
+    parser.add_argument("--source-lang", default="en")
+    parser.add_argument("--shard-rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    rows = export_dataset(
+        args.out,
+        formats=args.format or ["jsonl"],
+        full=args.full,
+        min_votes=args.min_votes,
+        min_score=args.min_score,
+        source_lang=args.source_lang,
+        shard_rows=args.shard_rows,
+    )
+    print(f"Exported {rows} pairs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+"""Stream a corpus drop into the bot's tables.
+
+Reads the JSON-lines corpus (UTF-16 by default, one {"source": {...},
+"target": {...}} per line) lazily, in chunks that get consecutive text ids
+reserved in one call and are written by a pool of workers: BatchWriteItem
+for DynamoDB, COPY for the legacy Postgres schema.
+
+    python data-import/import_corpus.py unicode_processed.json
+    python data-import/import_corpus.py unicode_processed.json --workers 16
+    python data-import/import_corpus.py unicode_processed.json --target postgres
+
+Progress is checkpointed next to the input (``<input>.checkpoint``), so
+running the same command again after a crash resumes where it stopped.
+"""
+
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import (
+    ALL_COMPLETED,
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    wait,
+)
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bot"))
+
+logger = logging.getLogger(__name__)
+
+# Translations that ship with the corpus are credited to the Echopod user
+ECHOPOD_USER_ID = 1
+
+READ_SIZE = 1024 * 1024
+
+
+def read_lines(path, start=0, end=None, encoding="utf-16"):
+    """Yield ``(start, end, line)`` for each line, with byte offsets.
+
+    The file is read in blocks and split on the encoded newline, so offsets
+    stay exact for UTF-16, where a newline is two bytes.
+    """
+    with open(path, "rb") as f:
+        codec = encoding.replace("_", "-").lower()
+        unit = 2 if codec.startswith("utf-16") else 1
+        if codec in ("utf-16", "utf16"):
+            bom = f.read(2)
+            codec = "utf-16-be" if bom == b"\xfe\xff" else "utf-16-le"
+            start = max(start, 2 if bom in (b"\xff\xfe", b"\xfe\xff") else 0)
+        newline = "\n".encode(codec)
+
+        f.seek(start)
+        position = start
+        buffer = b""
+        while end is None or position < end:
+            block = f.read(READ_SIZE)
+            if not block:
+                break
+            buffer += block
+            line_start = 0
+            index = buffer.find(newline)
+            while index != -1:
+                # A match that straddles two UTF-16 code units is not a newline
+                if index % unit:
+                    index = buffer.find(newline, index + 1)
+                    continue
+                line_end = index + len(newline)
+                yield (
+                    position + line_start,
+                    position + line_end,
+                    buffer[line_start:index].decode(codec),
+                )
+                if end is not None and position + line_end >= end:
+                    return
+                line_start = line_end
+                index = buffer.find(newline, line_start)
+            position += line_start
+            buffer = buffer[line_start:]
+        if buffer and (end is None or position < end):
+            yield position, position + len(buffer), buffer.decode(codec)
+
+
+def read_chunks(path, start, size, encoding):
+    """Group the non-empty lines after ``start`` into chunks of ``size``."""
+    records, chunk_start = [], start
+    for line_start, line_end, line in read_lines(path, start, encoding=encoding):
+        if not records:
+            chunk_start = line_start
+        if line.strip():
+            records.append(json.loads(line))
+        if len(records) == size:
+            yield chunk_start, line_end, records
+            records = []
+    if records:
+        yield chunk_start, line_end, records
+
+
+def read_chunk(path, start, end, encoding):
+    return [
+        json.loads(line)
+        for _, _, line in read_lines(path, start, end, encoding)
+        if line.strip()
+    ]
+
+
+class Checkpoint:
+    """Write-ahead log of the chunks handed to the writers.
+
+    A chunk is logged with its byte range and first text id before it is
+    written and marked done after. On resume the chunks never marked done
+    are written again with the same ids, skipping anything they already
+    wrote, and reading continues after the last logged chunk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.chunks = {}
+        self.done = set()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if "done" in entry:
+                        self.done.add(entry["done"])
+                    else:
+                        self.chunks[entry["chunk"]] = entry
+        self._file = open(path, "a")
+
+    @property
+    def offset(self):
+        return max((c["end"] for c in self.chunks.values()), default=0)
+
+    def pending(self):
+        return [c for n, c in sorted(self.chunks.items()) if n not in self.done]
+
+    def plan(self, start, end, first_id):
+        entry = {
+            "chunk": len(self.chunks),
+            "start": start,
+            "end": end,
+            "first_id": first_id,
+        }
+        self.chunks[entry["chunk"]] = entry
+        self._append(entry)
+        return entry
+
+    def mark_done(self, entry):
+        self.done.add(entry["chunk"])
+        self._append({"done": entry["chunk"]})
+
+    def _append(self, entry):
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class DynamoDBWriter:
+    def __init__(self):
+        import db
+
+        self.db = db
+
+    def reserve_ids(self, count):
+        return self.db.reserve_text_ids(count)
+
+    def _existing(self, table, key, ids):
+        items = self.db.batch_get_items(
+            table, [{key: item_id} for item_id in ids], projection=key
+        )
+        return {int(item[key]) for item in items}
+
+    def write(self, records, first_id, redo=False):
+        """Put the chunk's items. Returns how many texts await translation."""
+        written_texts = written_translations = set()
+        if redo:
+            # Items the interrupted run wrote may have been translated or
+            # voted on since, and putting them again would reset that
+            text_ids = range(first_id, first_id + len(records))
+            written_texts = self._existing(
+                self.db.original_text_table, "text_id", text_ids
+            )
+            written_translations = self._existing(
+                self.db.translation_table,
+                "translation_id",
+                [int(f"{text_id}{ECHOPOD_USER_ID}") for text_id in text_ids],
+            )
+
+        puts = []
+        untranslated = 0
+        for text_id, record in enumerate(records, first_id):
+            source, target = record["source"], record.get("target")
+            if not target:
+                untranslated += 1
+            if text_id not in written_texts:
+                puts.append(
+                    (
+                        self.db.original_text_table,
+                        {
+                            "text_id": text_id,
+                            "lang": source["lang"],
+                            "text": source["text"],
+                            "translated": "True" if target else "False",
+                        },
+                    )
+                )
+            translation_id = int(f"{text_id}{ECHOPOD_USER_ID}")
+            if not target or translation_id in written_translations:
+                continue
+            puts.append(
+                (
+                    self.db.translation_table,
+                    {
+                        "translation_id": translation_id,
+                        "voted": "False",
+                        "lang": target["lang"],
+                        "original_text": source["text"],
+                        "original_text_id": str(text_id),
+                        "text": target["text"],
+                        "user_id": str(ECHOPOD_USER_ID),
+                        "vote_count": 0,
+                        "vote_queue": self.db.vote_queue_shard(translation_id),
+                        **self.db.translation_changed_at(time.time()),
+                    },
+                )
+            )
+        self.db.batch_write_items(puts)
+        return untranslated
+
+    def finish(self, untranslated):
+        # New texts to translate only reach /contribute through the index
+        if untranslated:
+            self.db.rebuild_untranslated_index()
+
+
+class PostgresWriter:
+    """Writes to the legacy schema in ``legacy/database/setup.sql``."""
+
+    SEQUENCE = "pg_get_serial_sequence('originaltext', 'text_id')"
+
+    def __init__(self):
+        import psycopg2
+
+        self.connect = lambda: psycopg2.connect(
+            dbname=os.getenv("DB_NAME"),
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            host=os.getenv("DB_HOST"),
+        )
+        self._local = threading.local()
+        self._connections = []
+
+    @property
+    def connection(self):
+        if not hasattr(self._local, "connection"):
+            self._local.connection = self.connect()
+            self._connections.append(self._local.connection)
+        return self._local.connection
+
+    def reserve_ids(self, count):
+        with self.connection as connection, connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT setval({self.SEQUENCE}, nextval({self.SEQUENCE}) + %s - 1)",
+                (count,),
+            )
+            return cursor.fetchone()[0] - count + 1
+
+    def write(self, records, first_id, redo=False):
+        rows = io.StringIO()
+        writer = csv.writer(rows)
+        untranslated = 0
+        for text_id, record in enumerate(records, first_id):
+            source, target = record["source"], record.get("target") or {}
+            untranslated += not target
+            writer.writerow(
+                [
+                    text_id,
+                    source["lang"],
+                    source["text"],
+                    target.get("lang", ""),
+                    target.get("text", ""),
+                ]
+            )
+        rows.seek(0)
+
+        # One transaction per chunk; re-running a chunk skips rows it wrote
+        with self.connection as connection, connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMP TABLE import_rows (text_id INTEGER, source_lang TEXT, "
+                "source_text TEXT, target_lang TEXT, target_text TEXT) "
+                "ON COMMIT DROP"
+            )
+            cursor.copy_expert("COPY import_rows FROM STDIN WITH (FORMAT csv)", rows)
+            cursor.execute(
+                "INSERT INTO OriginalText (text_id, lang, text) "
+                "SELECT text_id, source_lang, source_text FROM import_rows "
+                "ON CONFLICT (text_id) DO NOTHING"
+            )
+            cursor.execute(
+                "INSERT INTO Translation (original_text_id, user_id, lang, text) "
+                "SELECT text_id, %s, target_lang, target_text FROM import_rows r "
+                "WHERE target_text <> '' AND NOT EXISTS (SELECT 1 FROM Translation t "
+                "WHERE t.original_text_id = r.text_id AND t.user_id = %s)",
+                (ECHOPOD_USER_ID, ECHOPOD_USER_ID),
+            )
+        return untranslated
+
+    def finish(self, untranslated):
+        for connection in self._connections:
+            connection.close()
+
+
+def import_corpus(path, writer, checkpoint, chunk_size, workers, encoding):
+    started = time.monotonic()
+    imported = untranslated = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = {}
+
+        def collect(block):
+            nonlocal imported, untranslated
+            finished, _ = wait(
+                in_flight, return_when=FIRST_COMPLETED if block else ALL_COMPLETED
+            )
+            for future in finished:
+                entry, count = in_flight.pop(future)
+                # Summed here rather than by the writers, which run in parallel
+                untranslated += future.result()
+                checkpoint.mark_done(entry)
+                imported += count
+            elapsed = time.monotonic() - started
+            logger.info(f"{imported} lines in {elapsed:.0f}s")
+
+        def submit(entry, records, redo=False):
+            future = pool.submit(writer.write, records, entry["first_id"], redo)
+            in_flight[future] = (entry, len(records))
+            # Keep reading only a little ahead of the writers
+            if len(in_flight) >= workers * 2:
+                collect(block=True)
+
+        for entry in checkpoint.pending():
+            logger.info(f"Redoing chunk {entry['chunk']} from the last run")
+            records = read_chunk(path, entry["start"], entry["end"], encoding)
+            submit(entry, records, redo=True)
+
+        for start, end, records in read_chunks(
+            path, checkpoint.offset, chunk_size, encoding
+        ):
+            first_id = writer.reserve_ids(len(records))
+            submit(checkpoint.plan(start, end, first_id), records)
+
+        if in_flight:
+            collect(block=False)
+
+    writer.finish(untranslated)
+    return imported, time.monotonic() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("path", help="JSON-lines corpus file")
+    parser.add_argument(
+        "--target", choices=["dynamodb", "postgres"], default="dynamodb"
+    )
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--chunk-size", type=int, default=1000, help="lines per chunk")
+    parser.add_argument("--encoding", default="utf-16")
+    parser.add_argument("--checkpoint", help="defaults to <path>.checkpoint")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    writer = DynamoDBWriter() if args.target == "dynamodb" else PostgresWriter()
+    checkpoint = Checkpoint(args.checkpoint or f"{args.path}.checkpoint")
+    try:
+        imported, elapsed = import_corpus(
+            args.path,
+            writer,
+            checkpoint,
+            args.chunk_size,
+            args.workers,
+            args.encoding,
+        )
+    finally:
+        checkpoint.close()
+    print(f"Imported {imported} lines in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+import sys
 import logging
 import boto3
 import json
@@ -15,6 +16,9 @@ from telegram.ext import (
 from dotenv import load_dotenv
 from bot.config import VOTING_SESSION_THRESHOLD
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bot"))
+from db import run_db, scan_items
+
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -523,12 +527,9 @@ async def handle_vote(update, context):
 
 
 async def reminder_job(event, context):
-    response = await execute_db_query_async(
-        operation="scan",
-        table=user_data_table,
-    )
-
-    for item in response["Items"]:
+    # The scan blocks, so it runs on the db threads instead of the event loop
+    items = await run_db(list, scan_items(user_data_table, projection=["user_id"]))
+    for item in items:
         user_id = item["user_id"]
         paused = await get_user_data(user_id, "paused")
         if not paused:
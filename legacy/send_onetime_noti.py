@@ -1,7 +1,11 @@
 import os
+import sys
 from dotenv import load_dotenv
 from telegram import Bot
 
+sys.path.append(os.path.join(os.path.dirname(__file__), "../bot"))
+from broadcast import broadcast
+
 # Quick helper script to clear the pending_update_count
 load_dotenv()
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
@@ -36,12 +40,12 @@ message = "Hi! It's been a while since your last voting session.\n\nYour votes h
 
 
 async def send():
-    # Send the message to all existing users
-    for user_id in existing_user_ids:
-        try:
-            await bot.send_message(chat_id=user_id, text=message)
-        except Exception as e:
-            print(f"Failed to send message to user {user_id}: {e}")
+    # Send the message to all existing users; re-running resumes the broadcast
+    async with bot:
+        counts = await broadcast(
+            bot, "voting-reminder", message, user_ids=existing_user_ids
+        )
+    print(dict(counts))
 
 
 async def main():
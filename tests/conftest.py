@@ -0,0 +1,25 @@
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "bot"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+sys.path.insert(0, os.path.join(ROOT, "data-import"))
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:TEST")
+os.environ.setdefault("DYNAMODB_TABLE_PREFIX", "echopod")
+
+import pytest  # noqa: E402
+
+from fake_dynamodb import FakeDynamoDB  # noqa: E402
+from replay import create_bot_tables  # noqa: E402
+
+
+@pytest.fixture
+def fake_db():
+    """The bot's tables in the in-memory DynamoDB stand-in."""
+    import db
+
+    resource = FakeDynamoDB()
+    create_bot_tables(resource, os.environ["DYNAMODB_TABLE_PREFIX"])
+    db.bind_dynamodb(resource)
+    return resource
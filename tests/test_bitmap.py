@@ -0,0 +1,40 @@
+import random
+from collections import Counter
+
+import pytest
+
+from bitmap import ARRAY_CONTAINER_MAX, RoaringBitmap
+
+
+def test_sparse_and_dense_containers_round_trip():
+    dense = range(70_000, 70_000 + ARRAY_CONTAINER_MAX + 100)
+    values = {3, 65_535, 65_536, *dense, 10**9}
+    bitmap = RoaringBitmap(values)
+    assert len(bitmap) == len(values)
+    assert list(bitmap) == sorted(values)
+    assert bitmap.max() == 10**9
+
+    copy = RoaringBitmap.deserialize(bitmap.serialize())
+    assert list(copy) == sorted(values)
+    assert [copy.select(i) for i in (0, 3, len(values) - 1)] == [3, 70_000, 10**9]
+    with pytest.raises(IndexError):
+        copy.select(len(values))
+
+
+def test_discard_turns_a_dense_container_back_into_an_array():
+    bitmap = RoaringBitmap(range(ARRAY_CONTAINER_MAX + 10))
+    for value in range(20):
+        assert bitmap.discard(value)
+    assert not bitmap.discard(5)
+    assert 5 not in bitmap and 25 in bitmap
+    assert bitmap.max() == ARRAY_CONTAINER_MAX + 9
+    assert len(RoaringBitmap.deserialize(bitmap.serialize())) == len(bitmap)
+
+
+def test_sample_is_uniform():
+    bitmap = RoaringBitmap([1, 2, 100_000, 200_000])
+    rng = random.Random(7)
+    counts = Counter(bitmap.sample(rng) for _ in range(4000))
+    assert set(counts) == {1, 2, 100_000, 200_000}
+    assert min(counts.values()) > 850
+    assert RoaringBitmap().sample() is None and RoaringBitmap().max() is None
@@ -0,0 +1,87 @@
+import asyncio
+import time
+import types
+
+import pytest
+
+import broadcast
+import db
+from broadcast import Broadcast, TokenBucket
+
+
+class RecordingBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        self.sent.append(chat_id)
+
+
+def test_claims_live_in_meta_and_resume(fake_db):
+    now = int(time.time())
+    # A run that died between the claim and the send left user 2 pending
+    assert db.claim_broadcast_user("news", 2, now=now)
+    assert not db.claim_broadcast_user("news", 2, now=now + 1)
+
+    bot = RecordingBot()
+    counts = asyncio.run(Broadcast(bot, "news", "hi", rate=1000).run([1, 2]))
+    assert counts["sent"] == 1 and bot.sent == [1]
+
+    # Once its claim runs out, the pending user is tried again
+    assert db.claim_broadcast_user("news", 2, now=now + db.BROADCAST_CLAIM_SECONDS + 1)
+    # A user who got the message is never claimed again
+    assert not db.claim_broadcast_user("news", 1, now=now + 10**6)
+
+    user = db.user_table.get_item(Key={"user_id": "1"}).get("Item", {})
+    assert "broadcasts" not in user
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A fake clock for the bucket that only moves when it sleeps."""
+    clock = types.SimpleNamespace(now=0.0)
+
+    async def sleep(seconds):
+        clock.now += seconds
+
+    # Rates below are powers of two, so the sums stay exact
+
+    monkeypatch.setattr(
+        broadcast, "time", types.SimpleNamespace(monotonic=lambda: clock.now)
+    )
+    monkeypatch.setattr(
+        broadcast, "asyncio", types.SimpleNamespace(Lock=asyncio.Lock, sleep=sleep)
+    )
+    return clock
+
+
+def acquire(bucket, times):
+    async def run():
+        for _ in range(times):
+            await bucket.acquire()
+
+    asyncio.run(run())
+
+
+def test_bucket_allows_a_burst_then_the_rate(clock):
+    bucket = TokenBucket(rate=4, capacity=3)
+    acquire(bucket, 3)
+    assert clock.now == 0
+    acquire(bucket, 10)
+    assert clock.now == 10 / 4
+
+
+def test_bucket_refills_up_to_capacity(clock):
+    bucket = TokenBucket(rate=4, capacity=3)
+    acquire(bucket, 3)
+    clock.now = 60.0
+    acquire(bucket, 4)
+    assert clock.now == 60 + 1 / 4
+
+
+def test_pause_holds_every_sender(clock):
+    bucket = TokenBucket(rate=4)
+    bucket.pause(30)
+    acquire(bucket, 1)
+    # The bucket starts empty once the pause is over
+    assert clock.now == 30 + 1 / 4
@@ -0,0 +1,61 @@
+import time
+
+from cache import ENTRY_OVERHEAD, LRUCache, MISSING, estimate_size
+
+
+def entry_size(key, value):
+    return estimate_size(key) + estimate_size(value) + ENTRY_OVERHEAD
+
+
+def test_least_recently_used_entry_goes_first():
+    cache = LRUCache(max_bytes=3 * entry_size("a", "x" * 10))
+    for key in "abc":
+        cache.set(key, "x" * 10)
+    assert cache.get("a") == "x" * 10
+    cache.set("d", "x" * 10)
+    assert cache.get("b") is MISSING
+    assert [cache.get(key) is not MISSING for key in "acd"] == [True] * 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_size_counts_utf8_bytes():
+    value = "မြန်မာ"
+    cache = LRUCache(max_bytes=entry_size("k", value))
+    cache.set("k", value)
+    assert cache.stats()["bytes"] == entry_size("k", value)
+    # Larger than the whole cache, so it is never stored
+    cache.set("big", value * 2)
+    assert cache.get("big") is MISSING
+    assert cache.get("k") == value
+
+
+def test_cached_none_is_not_a_miss():
+    cache = LRUCache(max_bytes=1000)
+    cache.set("k", None)
+    assert cache.get("k") is None
+    assert cache.get("other") is MISSING
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    cache = LRUCache(max_bytes=1000, ttl=60)
+    cache.set("k", "v")
+    now += 59
+    assert cache.get("k") == "v"
+    now += 2
+    assert cache.get("k") is MISSING
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["bytes"] == 0
+
+
+def test_replacing_a_key_keeps_the_byte_count():
+    cache = LRUCache(max_bytes=1000)
+    cache.set("k", "short")
+    cache.set("k", "a longer value")
+    assert cache.stats()["bytes"] == entry_size("k", "a longer value")
+    cache.invalidate("k")
+    assert cache.get("k") is MISSING
+    assert cache.stats()["bytes"] == 0
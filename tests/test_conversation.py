@@ -0,0 +1,87 @@
+import asyncio
+import itertools
+import os
+
+import db
+import main_function
+from conversation import CONTRIBUTING, IDLE, PAUSED, VOTING, get_state
+from replay import StubTelegramRequest, message_update, seed_texts
+
+COMMANDS_REPLY = "Please use the provided commands to interact with the bot."
+
+update_ids = itertools.count(3_000_000)
+
+
+def send(telegram, user_id, *texts):
+    async def deliver():
+        application = main_function.build_application(telegram, webhook_reply=False)
+        await application.initialize()
+        try:
+            for text in texts:
+                db.start_db_metrics()
+                update = message_update(next(update_ids), user_id, text)
+                await main_function.handle_update(application, update, dedup=False)
+        finally:
+            await application.shutdown()
+
+    asyncio.run(deliver())
+    return telegram.last_message[user_id]["text"]
+
+
+def translations_by(user_id):
+    return [
+        item
+        for item in db.scan_items(db.translation_table)
+        if item["user_id"] == str(user_id)
+    ]
+
+
+def test_text_is_routed_on_the_state(fake_db):
+    seed_texts(fake_db, os.environ["DYNAMODB_TABLE_PREFIX"], 20)
+    telegram = StubTelegramRequest()
+    user_id = 7000
+
+    assert send(telegram, user_id, "/start", "hello") == COMMANDS_REPLY
+    assert db.get_user_data(user_id, "state") is None
+
+    send(telegram, user_id, "/contribute")
+    assert db.get_user_data(user_id, "state") == CONTRIBUTING
+    text_id = db.get_user_data(user_id, "contribute_text_id")
+    assert "Sentence number" in send(telegram, user_id, "my translation")
+    (translation,) = translations_by(user_id)
+    assert translation["original_text_id"] == str(text_id)
+    assert translation["text"] == "my translation"
+
+    # Texts outside contributing change nothing
+    send(telegram, user_id, "/stop")
+    assert db.get_user_data(user_id, "state") == PAUSED
+    assert send(telegram, user_id, "another") == COMMANDS_REPLY
+    assert len(translations_by(user_id)) == 1
+
+
+def test_legacy_flags_route_like_the_state(fake_db):
+    seed_texts(fake_db, os.environ["DYNAMODB_TABLE_PREFIX"], 20)
+    telegram = StubTelegramRequest()
+    user_id = 7001
+    send(telegram, user_id, "/start")
+    # An item written before the state attribute existed
+    db.user_table.update_item(
+        Key={"user_id": str(user_id)},
+        UpdateExpression="SET contribute_mode = :true, contribute_text_id = :id "
+        "REMOVE #state",
+        ExpressionAttributeNames={"#state": "state"},
+        ExpressionAttributeValues={":true": "True", ":id": 5},
+    )
+
+    send(telegram, user_id, "legacy translation")
+    (translation,) = translations_by(user_id)
+    assert translation["original_text_id"] == "5"
+    assert db.get_user_data(user_id, "state") == CONTRIBUTING
+    assert db.get_user_data(user_id, "contribute_mode") is None
+
+
+def test_get_state_reads_legacy_flags():
+    assert get_state({}) == IDLE
+    assert get_state(dict(auto_vote="True")) == VOTING
+    assert get_state(dict(contribute_mode="True", paused="True")) == PAUSED
+    assert get_state(dict(state=IDLE, contribute_mode="True")) == IDLE
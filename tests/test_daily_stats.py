@@ -0,0 +1,44 @@
+from datetime import date, timedelta
+
+import pytest
+
+import db
+
+
+def test_user_range_past_retention_raises(fake_db, monkeypatch):
+    monkeypatch.setattr(db, "DAILY_STATS_RETENTION_DAYS", 30)
+
+    assert db.get_recent_counts(7, user_id=1) == (0, 0)
+    with pytest.raises(ValueError):
+        db.get_recent_counts(90, user_id=1)
+    # Project-wide days come from the global counters, which do not expire
+    assert db.get_recent_counts(90) == (0, 0)
+
+
+def days(start, end):
+    return [
+        (date.fromisoformat(start) + timedelta(days=i)).isoformat()
+        for i in range((date.fromisoformat(end) - date.fromisoformat(start)).days + 1)
+    ]
+
+
+def test_rollup_plan_reads_whole_months_and_edge_days():
+    plan = db.rollup_plan(date(2024, 1, 30), date(2024, 3, 5), date(2024, 3, 31))
+    # Mar 4 starts a week that runs past the end of the range
+    assert plan == ["2024-01-30", "2024-01-31", "2024-02"] + days(
+        "2024-03-01", "2024-03-05"
+    )
+
+
+def test_rollup_plan_stops_at_the_watermark():
+    plan = db.rollup_plan(date(2024, 1, 1), date(2024, 1, 31), date(2024, 1, 16))
+    # January is not compacted to its end, so its first whole weeks are used
+    assert plan == ["2024-W01", "2024-W02"] + days("2024-01-15", "2024-01-31")
+    assert db.rollup_plan(date(2024, 1, 1), date(2024, 1, 31)) == days(
+        "2024-01-01", "2024-01-31"
+    )
+
+
+def test_rollup_plan_week_across_new_year():
+    plan = db.rollup_plan(date(2024, 12, 30), date(2025, 1, 5), date(2025, 1, 31))
+    assert plan == ["2025-W01"]
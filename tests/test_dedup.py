@@ -0,0 +1,56 @@
+import asyncio
+
+import db
+import dedup
+import main_function
+from replay import StubTelegramRequest, message_update
+
+
+async def deliver(telegram, updates, dedup=True):
+    application = main_function.build_application(telegram, webhook_reply=False)
+    await application.initialize()
+    responses = []
+    try:
+        for update in updates:
+            db.start_db_metrics()
+            responses.append(
+                await main_function.handle_update(application, update, dedup)
+            )
+        return responses
+    finally:
+        await application.shutdown()
+
+
+def test_redelivery_waits_for_the_first_delivery(fake_db):
+    update = message_update(2_000_000, 6000, "/start")
+    # Another container claimed it and has not finished yet
+    assert db.claim_update(update["update_id"]) == "claimed"
+
+    telegram = StubTelegramRequest()
+    (response,) = asyncio.run(deliver(telegram, [update]))
+    assert response["statusCode"] == 503
+    assert 6000 not in telegram.last_message
+
+    db.complete_update(update["update_id"])
+    (response,) = asyncio.run(deliver(telegram, [update]))
+    assert response == {"statusCode": 200, "body": "Duplicate"}
+
+
+def test_update_is_done_once_processed(fake_db):
+    dedup.recent_updates.discard(2_000_001)
+    update = message_update(2_000_001, 6001, "/start")
+    telegram = StubTelegramRequest()
+    first, again = asyncio.run(deliver(telegram, [update, update]))
+    assert first["statusCode"] == 200
+    assert again == {"statusCode": 200, "body": "Duplicate"}
+    assert db.claim_update(update["update_id"]) == "done"
+
+
+def test_polled_updates_skip_the_claim(fake_db):
+    update = message_update(2_000_002, 6002, "/start")
+    telegram = StubTelegramRequest()
+    (response,) = asyncio.run(deliver(telegram, [update], dedup=False))
+    assert response == {"statusCode": 200, "body": "Success"}
+    assert "text" in telegram.last_message[6002]
+    # Nothing was recorded for the update_id
+    assert db.claim_update(update["update_id"]) == "claimed"
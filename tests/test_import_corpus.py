@@ -0,0 +1,96 @@
+import json
+
+import db
+import import_corpus
+from import_corpus import Checkpoint, DynamoDBWriter, read_chunks, read_lines
+
+# Burmese, and an emoji that takes a surrogate pair in UTF-16
+SOURCES = ["Hello.", "မင်္ဂလာပါ", "Tea? 🍵", "Line four.", "Five.", "Six 🐬"]
+
+
+def write_corpus(path):
+    lines = []
+    for i, text in enumerate(SOURCES):
+        record = {"source": {"lang": "en", "text": text}}
+        if i % 2:
+            record["target"] = {"lang": "my", "text": f"{text} (my)"}
+        lines.append(json.dumps(record, ensure_ascii=False))
+    # A blank line in the middle is skipped, not counted
+    lines.insert(3, "")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-16")
+
+
+def test_read_lines_resumes_at_any_offset(tmp_path, monkeypatch):
+    # Blocks of an odd size split code units and surrogate pairs
+    monkeypatch.setattr(import_corpus, "READ_SIZE", 7)
+    path = tmp_path / "corpus.json"
+    write_corpus(path)
+    lines = list(read_lines(path))
+    assert [json.loads(line)["source"]["text"] for _, _, line in lines if line] == (
+        SOURCES
+    )
+    for i, (start, _, _) in enumerate(lines):
+        assert list(read_lines(path, start)) == lines[i:]
+    start, end, _ = lines[2]
+    assert list(read_lines(path, start, end)) == [lines[2]]
+
+
+def test_resume_redoes_the_pending_chunk_without_overwriting(
+    fake_db, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(import_corpus, "READ_SIZE", 7)
+    path = tmp_path / "corpus.json"
+    write_corpus(path)
+    writer = DynamoDBWriter()
+
+    # The first run wrote two chunks and died before marking the second done
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint"))
+    chunks = read_chunks(path, 0, 2, "utf-16")
+    for done in (True, False):
+        start, end, records = next(chunks)
+        entry = checkpoint.plan(start, end, writer.reserve_ids(len(records)))
+        writer.write(records, entry["first_id"])
+        if done:
+            checkpoint.mark_done(entry)
+    checkpoint.close()
+    assert entry["first_id"] == 3
+    # Meanwhile text 3 is translated and Echopod's translation of 4 voted on
+    db.original_text_table.update_item(
+        Key={"text_id": 3},
+        UpdateExpression="SET translated = :true",
+        ExpressionAttributeValues={":true": "True"},
+    )
+    db.translation_table.update_item(
+        Key={"translation_id": 41},
+        UpdateExpression="SET vote_count = :one",
+        ExpressionAttributeValues={":one": 1},
+    )
+
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint"))
+    assert checkpoint.pending() == [entry]
+    try:
+        imported, _ = import_corpus.import_corpus(
+            path, writer, checkpoint, 2, workers=2, encoding="utf-16"
+        )
+    finally:
+        checkpoint.close()
+
+    # The redone chunk and the one never started
+    assert imported == 4
+    texts = sorted(
+        db.scan_items(db.original_text_table), key=lambda item: item["text_id"]
+    )
+    assert [item["text"] for item in texts] == SOURCES
+    assert [item["translated"] for item in texts] == [
+        "False",
+        "True",
+        "True",
+        "True",
+        "False",
+        "True",
+    ]
+    assert (
+        db.translation_table.get_item(Key={"translation_id": 41})["Item"]["vote_count"]
+        == 1
+    )
+    assert Checkpoint(str(tmp_path / "checkpoint")).pending() == []
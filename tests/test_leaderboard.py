@@ -0,0 +1,14 @@
+import db
+
+
+def test_no_snapshot_means_no_scan(fake_db):
+    db.user_table.put_item(Item={"user_id": "60", "contributions": 3})
+    metrics = db.start_db_metrics()
+    with db.user_session(60) as session:
+        session.load()
+        db.update_leaderboard_for(60)
+    assert db.get_leaderboard_data() == []
+    assert not any(op.startswith("scan") for op in metrics.operations)
+
+    db.refresh_leaderboard_snapshot()
+    assert [e["user_id"] for e in db.get_leaderboard_data()] == ["60"]
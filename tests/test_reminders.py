@@ -0,0 +1,35 @@
+import asyncio
+
+from telegram.error import BadRequest
+
+import db
+from reminders import send_due_reminders
+
+
+class FlakyBot:
+    """Fails every send until ``working`` is set."""
+
+    def __init__(self):
+        self.working = False
+        self.sent = []
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        if not self.working:
+            raise BadRequest("Internal server error")
+        self.sent.append(chat_id)
+
+
+def test_released_reminder_is_due_on_the_next_tick(fake_db):
+    now = 1_800_000_000
+    db.user_table.put_item(
+        Item={"user_id": "5", **db.reminder_schedule(now - 4 * 3600)}
+    )
+    bot = FlakyBot()
+
+    counts = asyncio.run(send_due_reminders(bot, now))
+    assert counts["failed"] == 1
+
+    bot.working = True
+    counts = asyncio.run(send_due_reminders(bot, now + 300))
+    assert counts["sent"] == 1
+    assert bot.sent == [5]
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+from botocore.exceptions import ClientError
+
+import db
+from bitmap import RoaringBitmap
+from replay import seed_texts
+
+
+def load_snapshot(text_ids):
+    """Stand in for a stale Meta snapshot loaded by a cold container."""
+    index = RoaringBitmap()
+    for text_id in text_ids:
+        index.add(text_id)
+    db._set_untranslated_index(index, built_at=0)
+
+
+def test_stale_snapshot_falls_back_to_the_index_query(fake_db):
+    seed_texts(fake_db, os.environ["DYNAMODB_TABLE_PREFIX"], 30)
+    for text_id in range(1, 11):
+        db.original_text_table.update_item(
+            Key={"text_id": text_id},
+            UpdateExpression="SET translated = :true",
+            ExpressionAttributeValues={":true": "True"},
+        )
+    load_snapshot(range(1, 11))
+
+    item = db.get_untranslated_text(7)
+    assert item is not None and int(item["text_id"]) > 10
+
+
+def test_contended_text_is_not_marked_translated(fake_db):
+    seed_texts(fake_db, os.environ["DYNAMODB_TABLE_PREFIX"], 2)
+    assert db.acquire_text_lease(1, 8)
+    load_snapshot([1])
+
+    item = db.get_untranslated_text(9)
+    assert int(item["text_id"]) == 2
+    # Text 1 is only leased; it stays in the index for when the lease runs out
+    assert 1 in db.get_untranslated_index()
+
+
+def contribute(text_id, user_id):
+    with db.user_session(user_id):
+        return db.save_contribution(text_id, user_id, "mya", "t", "o", now=1)
+
+
+def test_duplicate_contribution_is_not_a_lost_lease(fake_db):
+    seed_texts(fake_db, os.environ["DYNAMODB_TABLE_PREFIX"], 2)
+    db.pop_lease_metrics()
+    contribute(1, 10)
+    # Another user finished text 2 after user 10's lease ran out
+    db.original_text_table.update_item(
+        Key={"text_id": 2},
+        UpdateExpression="SET translated = :true",
+        ExpressionAttributeValues={":true": "True"},
+    )
+
+    # Past the idempotency window, resending text 1 only hits its conditions
+    fake_db._tokens.clear()
+    for text_id in (1, 2):
+        with pytest.raises(ClientError):
+            contribute(text_id, 10 if text_id == 1 else 11)
+    assert db.pop_lease_metrics() == {"lost": 1}
+
+
+def test_missing_snapshot_is_not_built_inline(fake_db):
+    seed_texts(fake_db, os.environ["DYNAMODB_TABLE_PREFIX"], 300)
+    db.meta_table.put_item(Item={"meta_key": db.TEXT_ID_COUNTER_KEY, "last_id": 300})
+    metrics = db.start_db_metrics()
+
+    leased = {int(db.get_untranslated_text(user)["text_id"]) for user in range(20)}
+    assert len(leased) == 20
+    # The fallback starts at random text_ids instead of always the lowest
+    assert max(leased) > db.UNTRANSLATED_QUERY_PAGE
+    assert "put_item:echopod_Meta" not in metrics.operations
@@ -0,0 +1,53 @@
+from decimal import Decimal
+
+import db
+
+
+def put_translation(translation_id):
+    db.translation_table.put_item(
+        Item={"translation_id": translation_id, "text_id": 1, "user_id": "1"}
+    )
+
+
+def test_retried_vote_is_already_recorded(fake_db):
+    put_translation(7)
+    db.user_table.put_item(Item={"user_id": "42"})
+    with db.user_session(42) as session:
+        # Handlers load the item before the vote
+        session.load()
+        first = db.save_vote(7, 42, 4)
+    with db.user_session(42):
+        # A redelivery after the first transaction got through
+        again = db.save_vote(7, 42, 4)
+    assert again == first
+    item = db.translation_table.get_item(Key={"translation_id": 7})["Item"]
+    assert (item["vote_count"], item["score_sum"]) == (1, 4)
+
+
+def test_user_created_by_a_flush_is_counted_once(fake_db):
+    with db.user_session(43) as session:
+        session.touch(last_interaction_time=1)
+    with db.user_session(43):
+        db.is_user_exists(43, "@someone")
+    assert db.get_total_users() == 1
+
+
+def test_user_created_by_a_vote_is_counted_once(fake_db):
+    put_translation(8)
+    with db.user_session(44) as session:
+        session.touch(last_interaction_time=1)
+        db.save_vote(8, 44, 5)
+    assert db.get_total_users() == 1
+
+
+def test_refresh_derives_the_quality_band(fake_db):
+    put_translation(9)
+    for user_id, score in ((50, 2), (51, 5)):
+        db.user_table.put_item(Item={"user_id": str(user_id)})
+        with db.user_session(user_id):
+            db.save_vote(9, user_id, score, now=1_800_000_000)
+
+    assert db.refresh_score_aggregates(until=1_800_000_100) == 1
+    item = db.translation_table.get_item(Key={"translation_id": 9})["Item"]
+    assert (item["mean_score"], item["quality_band"]) == (Decimal("3.5"), "high")
+    assert db.refresh_score_aggregates(until=1_800_000_200) == 0
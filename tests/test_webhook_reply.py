@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+from webhook_reply import WebhookReplyRequest, start_webhook_reply
+
+URL = "https://api.telegram.org/bot123456:TEST/"
+
+
+class RecordingRequest:
+    """The wrapped request; records the calls that actually go out."""
+
+    read_timeout = 5
+
+    def __init__(self):
+        self.sent = []
+
+    async def do_request(self, url, method, request_data=None, **timeouts):
+        self.sent.append(url.rsplit("/", 1)[-1])
+        return 200, b'{"ok": true, "result": true}'
+
+
+class Data:
+    def __init__(self, contains_files=False, **parameters):
+        self.parameters = parameters
+        self.contains_files = contains_files
+
+
+def run(calls, reply=True):
+    """Make ``calls`` for one update; returns what went out and the reply."""
+    inner = RecordingRequest()
+    request = WebhookReplyRequest(inner)
+
+    async def update():
+        held = start_webhook_reply() if reply else None
+        results = []
+        for endpoint, data in calls:
+            _, payload = await request.do_request(URL + endpoint, "POST", data)
+            results.append(json.loads(payload)["result"])
+        return held, results
+
+    held, results = asyncio.run(update())
+    body = json.loads(held.body()) if held and held.body() else None
+    return inner.sent, body, results
+
+
+def test_last_message_goes_in_the_response():
+    sent, body, results = run(
+        [
+            ("sendMessage", Data(chat_id=7, text="first")),
+            ("sendMessage", Data(chat_id=7, text="second")),
+        ]
+    )
+    # The first message went out before the second was held
+    assert sent == ["sendMessage"]
+    assert body == {"method": "sendMessage", "chat_id": 7, "text": "second"}
+    assert results[1]["chat"]["id"] == 7
+
+
+def test_held_message_goes_out_before_another_call():
+    sent, body, _ = run(
+        [
+            ("sendMessage", Data(chat_id=7, text="hi")),
+            ("editMessageText", Data(chat_id=7, message_id=1, text="edited")),
+        ]
+    )
+    assert sent == ["sendMessage", "editMessageText"]
+    assert body is None
+
+
+def test_answer_stays_held_while_messages_go_out():
+    sent, body, results = run(
+        [
+            ("answerCallbackQuery", Data(callback_query_id="q")),
+            ("sendMessage", Data(chat_id=7, text="next")),
+        ]
+    )
+    assert sent == ["sendMessage"]
+    assert body == {"method": "answerCallbackQuery", "callback_query_id": "q"}
+    assert results[0] is True
+
+
+def test_calls_that_cannot_be_held_go_out():
+    calls = [("sendMessage", Data(contains_files=True, chat_id=7))]
+    assert run(calls)[:2] == (["sendMessage"], None)
+    # Outside an update being answered by webhook nothing is held
+    calls = [("sendMessage", Data(chat_id=7, text="hi"))]
+    assert run(calls, reply=False)[:2] == (["sendMessage"], None)
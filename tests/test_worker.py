@@ -0,0 +1,136 @@
+import asyncio
+import itertools
+import os
+import threading
+
+import db
+import main_function
+from fake_dynamodb import FaultInjector
+from replay import StubTelegramRequest, message_update, seed_texts
+import worker
+from worker import UpdateDispatcher
+
+update_ids = itertools.count(1_000_000)
+
+
+def run_updates(dispatcher, updates):
+    return [dispatcher.submit(update) for update in updates]
+
+
+async def serve(telegram, rounds):
+    application = main_function.build_application(telegram, webhook_reply=False)
+    await application.initialize()
+    dispatcher = UpdateDispatcher(application, concurrency=32)
+    responses = []
+    try:
+        for updates in rounds:
+            responses += await asyncio.gather(*run_updates(dispatcher, updates))
+    finally:
+        await application.shutdown()
+    return responses
+
+
+def test_concurrent_contribute(fake_db):
+    seed_texts(fake_db, os.environ["DYNAMODB_TABLE_PREFIX"], 300)
+    fake_db.faults = FaultInjector(latency_ms=1, jitter_ms=3, seed=1)
+    users = range(5000, 5040)
+    telegram = StubTelegramRequest()
+
+    def command(text):
+        return [message_update(next(update_ids), user, text) for user in users]
+
+    rounds = [command("/start")]
+    for _ in range(3):
+        # Each user's contribute and translation run in order, users in parallel
+        rounds.append(command("/contribute") + command("translated"))
+    rounds.append(command("/contribute"))
+    responses = asyncio.run(serve(telegram, rounds))
+
+    assert all(response["statusCode"] == 200 for response in responses)
+    leased = {}
+    for user in users:
+        message = telegram.last_message[user]["text"]
+        assert "Sentence number" in message, message
+        leased[user] = db.get_user_data(user, "contribute_text_id")
+    assert len(set(leased.values())) == len(users)
+
+
+def test_untranslated_index_across_threads(fake_db):
+    seed_texts(fake_db, os.environ["DYNAMODB_TABLE_PREFIX"], 2000)
+    db.rebuild_untranslated_index()
+    errors = []
+    stop = threading.Event()
+
+    def sample():
+        try:
+            while not stop.is_set():
+                db.sample_untranslated_text()
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    for _ in range(20):
+        for text_id in range(1, 2001):
+            db.mark_text_translated(text_id)
+        for text_id in range(1, 2001):
+            db.mark_text_untranslated(text_id)
+    stop.set()
+    sampler.join()
+    assert errors == []
+
+
+def test_parallel_scan_counts_into_current_metrics(fake_db):
+    seed_texts(fake_db, os.environ["DYNAMODB_TABLE_PREFIX"], 50)
+    metrics = db.start_db_metrics()
+    items = list(db.scan_items(db.original_text_table, segments=4))
+    assert len(items) == 50
+    assert metrics.calls >= 4
+
+
+class QueuedUpdate:
+    def __init__(self, update_id):
+        self.update_id = update_id
+
+    def to_dict(self):
+        return {
+            "update_id": self.update_id,
+            "message": {"from": {"id": self.update_id}},
+        }
+
+
+class HeldDispatcher(UpdateDispatcher):
+    """Keeps every update in progress until ``finish`` is set."""
+
+    def __init__(self):
+        super().__init__(application=None, concurrency=8)
+        self.finish = asyncio.Event()
+
+    async def _process(self, data, previous):
+        await self.finish.wait()
+
+
+def test_poll_confirms_only_finished_updates():
+    async def scenario():
+        dispatcher = HeldDispatcher()
+        stopping = asyncio.Event()
+        offsets = []
+
+        class Bot:
+            async def get_updates(self, offset=None, timeout=None):
+                offsets.append(offset)
+                if len(offsets) == 2:
+                    # Both updates are still in progress at the second call
+                    dispatcher.finish.set()
+                    stopping.set()
+                return [QueuedUpdate(i) for i in (1, 2) if i >= (offset or 0)]
+
+        offset = await worker.poll(Bot(), dispatcher, stopping, timeout=0)
+        await dispatcher.drain(1)
+        return offsets, offset, dispatcher.in_flight
+
+    offsets, offset, in_flight = asyncio.run(scenario())
+    assert offsets == [None, 1]
+    assert offset == 3
+    assert not in_flight